@@ -31,27 +31,52 @@ other dealings in the software.
 
 from __future__ import division
 import os
+import sys
 import math
-import numpy as np
-import matplotlib.pyplot as plt
 from collections import OrderedDict
-from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, RUNNING
-from odemis.acq.feature import FEATURE_ACTIVE, FEATURE_ROUGH_MILLED, FEATURE_DEACTIVE, FEATURE_POLISHED
+from concurrent.futures._base import CancelledError
+from odemis.acq.feature import FEATURE_ACTIVE, FEATURE_ROUGH_MILLED, FEATURE_DEACTIVE
 import logging
 from odemis import dataio, model
-from odemis.acq import stream, acqmng
-from odemis.acq.stream import StaticStream, FluoStream, SEMStream
 import odemis.gui
-from odemis.gui.conf import get_acqui_conf, util
 from odemis.gui import conf
-from odemis.util import dataio as udataio
+from odemis.util import units
 from odemis.gui.util import get_picture_folder
 import time
-import threading
 import wx
 from odemis.gui.plugin import Plugin, AcquisitionDialog
-from odemis.gui.comp.text import UnitFloatCtrl
-import cv2
+
+# The shared helpers are in the "enzel" folder, next to this file
+_plugin_dir = os.path.dirname(os.path.abspath(__file__))
+if _plugin_dir not in sys.path:
+    sys.path.append(_plugin_dir)
+from enzel.acquire import FrameAcquirer
+from enzel.autofocus import autofocus
+from enzel.commands import SEQUENCES, get_channel
+from enzel.eta import FeatureTimer, TimingModel
+from enzel.focusmap import FocusMap
+from enzel.journal import (DEFAULT_DIR as JOURNAL_DIR, RESULT_CANCELLED, RESULT_DONE,
+                           RESULT_FAILED, RunJournal, find_resumable, resume_journal)
+from enzel.lazy import lazy_component, lazy_property
+from enzel.profiles import create_acq_streams, get_current_profile, teardown_streams
+from enzel.recipe import expected_waits, load_recipe, wait_timeout
+from enzel.registration import (MIN_RESPONSE, PhaseCorrelator, load_reference, save_reference,
+                                shift_to_physical)
+from enzel.route import get_speeds, plan_route
+from enzel.settle import wait_moves, wait_stable
+from enzel.streamexport import StreamingExport
+from enzel.timelapse import TimeLapse
+from enzel.tracing import start_trace, stop_trace
+from enzel.writer import ExportQueue
+
+# Names of the (fast) streams used to check the image is stable after a move,
+# the first one present is used. RLMAcq is only present while acquiring, if the
+# streams are created on demand.
+SETTLE_STREAMS = ("RLM", "RLMAcq")
+# Names of the streams used to measure the drift of the features
+DRIFT_STREAMS = ("RLM", "RLMAcq")
+# Name of the (short exposure) stream used to find the best focus
+AUTOFOCUS_STREAM = "Ex485Em525"
 
 class AutoRoughMill(Plugin):
     name = "AutoRoughMill"
@@ -63,7 +88,53 @@ class AutoRoughMill(Plugin):
         ("act", {
             "label": "Per feature action",
             "control_type": odemis.gui.CONTROL_RADIO,
-            "choices": {0: u"Relief cuts", 1: u"Rough milling", 2: u"Relief cuts & rough milling", 3: u"2 um milling", 4: u"1 um milling"},
+            "choices": {0: u"Relief cuts", 1: u"Rough milling", 2: u"Relief cuts & rough milling", 3: u"2 um milling", 4: u"1 um milling",
+                        5: u"Relief cuts, 2 um & 1 um milling"},
+        }),
+        ("pipeline", {
+            "label": "Export while moving",
+            "tooltip": "Write the images in the background, while the stage moves to the next feature",
+        }),
+        ("streaming_export", {
+            "label": "Write each image once",
+            "tooltip": "Don't save the images again in a combined file.\n"
+                       "With HDF5, the combined file links to the image of each channel.",
+        }),
+        ("timelapse", {
+            "label": "Fluorescence during milling",
+            "tooltip": "Acquire a time-lapse of the LM streams while milling, saved in one file per feature",
+        }),
+        ("optimize_route", {
+            "label": "Optimize feature order",
+            "tooltip": "Visit the features in the order which minimizes the stage travel time",
+        }),
+        ("drift_correction", {
+            "label": "Correct drift",
+            "tooltip": "Compare the %s image of each feature with the one of its first visit,\n"
+                       "and update the feature position if the sample has drifted" % (DRIFT_STREAMS[0],),
+        }),
+        ("autofocus", {
+            "label": "Autofocus",
+            "tooltip": "Before acquiring the images, find the best focus with the %s stream.\n"
+                       "The focus found is also used to predict the focus of the next features." % (AUTOFOCUS_STREAM,),
+        }),
+        ("predict_focus", {
+            "label": "Predict focus",
+            "tooltip": "Move the focus to the position predicted from the features on which\n"
+                       "the focus was confirmed, instead of the position stored in the feature",
+        }),
+        ("settle_check", {
+            "label": "Check image stable",
+            "tooltip": "After each move, wait until the %s image doesn't shift anymore" % (SETTLE_STREAMS[0],),
+        }),
+        ("settle_timeout", {
+            "label": "Max settle time",
+            "tooltip": "Maximum time to wait for the image to be stable after a move",
+        }),
+        ("trace", {
+            "label": "Record trace",
+            "tooltip": "Save the duration of each step, as a Chrome trace (.json) and .csv file,\n"
+                       "in the picture folder",
         }),
     ))
     
@@ -81,22 +152,60 @@ class AutoRoughMill(Plugin):
             if not (self.main_data.stage):
                 return
                 
-        # Get components by role self.main_data = self.main_app.main_data
-        try:
-            self.stage = model.getComponent(role="stage")
-            self.sem = model.getComponent("SEM XT Connection")
-        except LookupError:
-            logging.info("Hardware not found, cannot use the AutoRoughMilling stage plugin.")
-            return
-
         self.def_sr = 180.0
-        self.action = {0:0.012, 1:0.013, 2:0.011, 3:0.014, 4:0.015}
-        self.label = {0:"Relief Cuts", 1:"Rough Milling", 2:"RC and RM", 3:"2 um", 4:"1 um"}
-        self.act = model.VAEnumerated(0, choices={0, 1, 2, 3, 4})
+        # iFast commands run for each action, one after another
+        self.action = {0: ("auto_relief_cuts",), 1: ("auto_rough_milling",), 2: ("auto_rc_rm",),
+                       3: ("auto_2um",), 4: ("auto_1um",), 5: SEQUENCES["rc_2um_1um"]}
+        self.label = {0:"Relief Cuts", 1:"Rough Milling", 2:"RC and RM", 3:"2 um", 4:"1 um", 5:"RC 2 um 1 um"}
+        self.act = model.VAEnumerated(0, choices={0, 1, 2, 3, 4, 5})
+        self.pipeline = model.BooleanVA(False)
+        self.export_queue_size = 16  # max number of files waiting to be written
+        self.streaming_export = model.BooleanVA(False)
+        self.timelapse = model.BooleanVA(False)
+        self.optimize_route = model.BooleanVA(False)
+        self.settle_check = model.BooleanVA(False)
+        self.settle_timeout = model.FloatContinuous(10, (0, 60), unit="s")
+        self.settle_max_shift = 0.5  # px, between two frames for the image to be stable
+        self.trace = model.BooleanVA(False)
+        self.predict_focus = model.BooleanVA(False)
+        self.drift_correction = model.BooleanVA(False)
+        self.drift_threshold = 1e-6  # m, the position is only corrected above this drift
+        # m, a larger drift is considered a measurement error. It's also the
+        # distance above which a reference image is of another feature with the same name.
+        self.drift_max = 20e-6
+        self._registration = PhaseCorrelator()  # reference image of each feature, as loaded
+        self._reference_pos = {}  # feature name -> x, y position of its reference image
+        self.autofocus = model.BooleanVA(False)
+        self.autofocus_range = 20e-6  # m, total range scanned around the expected focus
+        self.autofocus_max_frames = 12
+        self.focus_confirm_dist = 50e-6  # m, max distance to the feature to confirm its focus
+        self._focus_map = FocusMap()  # focus offset of the features, kept during the whole session
+        self._journal_dir = JOURNAL_DIR  # where the steps done are recorded, to resume a run
 
         # TODO should check if microscope has a stage connection
         self.addMenu("Milling/Auto mill...", self.start)
 
+    # Only looked up when first used, to not slow down the start of the GUI
+    sem = lazy_component("SEM XT Connection")
+
+    @lazy_property
+    def _channel(self):
+        return get_channel(self.sem, self.def_sr)
+
+    @lazy_property
+    def _timing(self):
+        """
+        (TimingModel): history of the duration of each phase
+        """
+        return TimingModel()
+
+    @lazy_property
+    def _recipe(self):
+        """
+        (dict str -> CommandRecipe): the patterns of each iFast command, to
+          estimate how long they take
+        """
+        return load_recipe()
 
     def start(self):
         # Fail if the live tab is not selected
@@ -110,7 +219,18 @@ class AutoRoughMill(Plugin):
             box.ShowModal()
             box.Destroy()
             return
-        
+
+        try:
+            self.sem
+        except LookupError:
+            logging.info("Hardware not found, cannot use the AutoRoughMilling stage plugin.")
+            box = wx.MessageDialog(self.main_app.main_frame,
+                       "The XT connection was not found.",
+                       "Automated rough milling not possible", wx.OK | wx.ICON_STOP)
+            box.ShowModal()
+            box.Destroy()
+            return
+
         dlg = AcquisitionDialog(self, "Automated rough milling", "LM stream names most contain 'Acq' to automatically acquire images.\n ACTIVE Feature states are processed")
         self._dlg = dlg
         
@@ -128,7 +248,12 @@ class AutoRoughMill(Plugin):
         dlg.addButton("Cancel")
         dlg.addButton("Run action", self._auto_mill, face_colour='blue')
         dlg.addButton("Acq imgs", self.acq_imgs, face_colour='blue')
-
+        dlg.addButton("Confirm focus", self.confirm_focus)
+        dlg.addButton("Resume", self.resume)
+        run = find_resumable(self._journal_dir)
+        if run is not None:
+            dlg.setAcquisitionInfo("The last run (%s) was interrupted, press Resume to continue it" %
+                                   (run.kind if run.kind == "ImgAcq" else run.info["label"],))
 
         ans = dlg.ShowModal()
         
@@ -138,6 +263,8 @@ class AutoRoughMill(Plugin):
             logging.info("Automated milling completed")
         elif ans == 2:
             logging.info("Automated image acquisition completed")
+        elif ans == 4:
+            logging.info("Interrupted run completed")
         else:
             logging.warning("Got unknown return code %s", ans)
 
@@ -146,126 +273,537 @@ class AutoRoughMill(Plugin):
         self._dlg = None
                 
 
-    def _set_rot(self, rot):
-        self.sem.set_rotation(np.deg2rad(self.def_sr+rot))
-        time.sleep(2.0)
-        
-    def _acq_and_save_images(self, streams, fe_name, status):
+    def resume(self, dlg):
+        """
+        Continue the last run, if it was interrupted, skipping the steps already done.
+        """
+        run = find_resumable(self._journal_dir)
+        if run is None:
+            dlg.setAcquisitionInfo("No interrupted run to resume", lvl=logging.WARNING)
+            return
+        logging.info("Resuming run %s", run.path)
+        if run.kind == "ImgAcq":
+            self.acq_imgs(dlg, run)
+        else:
+            self.act.value = run.info["act"]
+            self._auto_mill(dlg, run)
+
+    def _get_run_features(self, run, steps):
+        """
+        run (RunState): the run to resume
+        steps (list of str): all the steps of a feature
+        return (list of Features): the features with steps left, in the order of the run
+        """
+        fs = {fe.name.value: fe for fe in self.main_data.features.value}
+        names = run.features_left(steps)
+        missing = [n for n in names if n not in fs]
+        if missing:
+            logging.warning("Features %s of the run not found, they are skipped", ", ".join(missing))
+        return [fs[n] for n in names if n in fs]
+
+    def _step_done(self, journal, writer, fe, step):
+        """
+        Record in the journal that a step of the feature is done. If the images
+        are written in the background, it's only recorded once they are written.
+        """
+        name = fe.name.value
+        if writer is None:
+            journal.step_done(name, step)
+            return
+
+        def record():
+            writer.check()  # Not done if the images could not be written
+            journal.step_done(name, step)
+        writer.put(record)
+
+    def _order_features(self, features, dlg):
+        """
+        Order the features to minimize the stage travel time, starting from the
+        current position, and report the time saved.
+        features (list of Features): the features to visit
+        return (list of Features): the same features, in the order to visit them
+        """
+        stage, focus = self.main_data.stage, self.main_data.focus
+        start = (stage.position.value['x'], stage.position.value['y'], focus.position.value['z'])
+        points = [fe.pos.value for fe in features]
+        order, opt_time, orig_time = plan_route(points, get_speeds(stage, focus), start)
+        msg = "Estimated stage travel time: %s (%s saved)" % (
+            units.readable_time(round(opt_time)), units.readable_time(round(orig_time - opt_time)))
+        logging.info(msg)
+        dlg.setAcquisitionInfo(msg)
+        return [features[i] for i in order]
+
+    def confirm_focus(self, dlg):
+        """
+        Record that the current focus is good for the feature at the current
+        stage position, to predict the focus of the other features.
+        """
+        spos = self.main_data.stage.position.value
+        z = self.main_data.focus.position.value['z']
+        fs = self.main_data.features.value
+        if not fs:
+            dlg.setAcquisitionInfo("No feature, cannot confirm the focus", lvl=logging.WARNING)
+            return
+        fe = min(fs, key=lambda fe: math.hypot(fe.pos.value[0] - spos['x'], fe.pos.value[1] - spos['y']))
+        dist = math.hypot(fe.pos.value[0] - spos['x'], fe.pos.value[1] - spos['y'])
+        if dist > self.focus_confirm_dist:
+            dlg.setAcquisitionInfo("No feature at the current position, cannot confirm the focus",
+                                   lvl=logging.WARNING)
+            return
+        self._add_focus_point(fe, z)
+        dlg.setAcquisitionInfo("Focus of %s confirmed (%+.1f µm from stored), %d features confirmed" %
+                               (fe.name.value, (z - fe.pos.value[2]) * 1e6, len(self._focus_map)))
+
+    def _add_focus_point(self, fe, z):
+        """
+        fe (Feature): feature on which the focus is correct
+        z (float): the correct focus position (m)
+        """
+        x, y, zs = fe.pos.value
+        self._focus_map.add(x, y, z - zs)
+        logging.info("Focus of %s confirmed at %g m (%+g m from stored)", fe.name.value, z, z - zs)
+
+    def _get_focus_pos(self, pos):
+        """
+        pos (tuple of 3 floats): x, y, z position of the feature
+        return (float): the focus position to move to (m)
+        """
+        if not self.predict_focus.value:
+            return pos[2]
+        return pos[2] + float(self._focus_map.predict(pos[0], pos[1]))
+
+    def _get_phases(self, milling):
+        """
+        milling (bool): True if the features are milled
+        return (list of str): the phases run for each feature
+        """
+        phases = ["move", "acquire", "export"]
+        if self.settle_check.value:
+            phases.append("settle")
+        if self.drift_correction.value:
+            phases.append("register")
+        if self.autofocus.value:
+            phases.append("focus")
+        if milling:
+            phases.append("mill")
+        return phases
+
+    def _update_eta(self, f, action, phases, nb_left, timer):
+        """
+        Update the expected end time of the progressive future, from the
+        durations of the previous features (or the recipe, for the milling).
+        """
+        left = self._timing.time_left(action, phases, nb_left, timer)
+        f.set_progress(end=time.time() + left)
+
+    def _mill(self, action, f, on_done=None):
+        """
+        Ask iFast to run the milling patterns, and wait until they are done.
+        action (tuple of str): the iFast commands to run, one after another
+        f (Future): the task future, to stop waiting when it's cancelled
+        on_done (callable or None): called with the name of each command, once it's done
+        """
+        waits = expected_waits(self._recipe, action)
+        for cmd, wait in zip(action, waits):
+            # The duration of each command is also kept, to know when to expect
+            # it's done. Until then, rely on the estimation from the recipe.
+            history = self._timing.history(cmd, "mill")
+            expected = self._timing.phase_time(cmd, "mill") if history else wait
+            timeout = wait_timeout(max(wait, expected)) if wait is not None else None
+            dur = self._channel.run(cmd, expected, timeout, future=f)
+            self._timing.record(cmd, {"mill": dur})
+            if on_done is not None:
+                on_done(cmd)
+
+    def _find_stream(self, streams, names):
+        """
+        streams (list of Streams): the streams of the tab
+        names (tuple of str): the names of the streams which can be used, by preference
+        return (Stream or None): the first stream found, or None if none is present
+        """
+        found = {s.name.value: s for s in streams}
+        for n in names:
+            if n in found:
+                return found[n]
+        return None
+
+    def _move_to_feature(self, pos, frames, streams, timer):
+        """
+        Move the stage and focus to the feature position, and wait until the
+        system is settled.
+        pos (tuple of 3 floats): x, y, z position of the feature
+        frames (FrameAcquirer): used to check the image is stable
+        streams (list of Streams): the streams of the tab
+        timer (FeatureTimer): to measure the duration of the move and settle
+        """
+        logging.info(f"Moving to position: {pos}")
+        z = self._get_focus_pos(pos)
+        if z != pos[2]:
+            logging.info("Using predicted focus %g m (%+g m from stored)", z, z - pos[2])
+        moves = [self.main_data.stage.moveAbs({'x': pos[0], 'y': pos[1]}),
+                 self.main_data.focus.moveAbs({'z': z})]
+        preview = None
+        if self.settle_check.value:
+            preview = self._find_stream(streams, SETTLE_STREAMS)
+            if preview is None:
+                logging.warning("No %s stream, cannot check the image is stable", SETTLE_STREAMS[0])
+        with timer.phase("move"):
+            wait_moves(moves)
+        if preview:
+            with timer.phase("settle"):
+                wait_stable(frames, preview, self.settle_max_shift, self.settle_timeout.value)
+
+    def _get_reference_path(self, fe_name):
+        """
+        return (str): the file of the reference image of the feature, stored
+          with the images of the feature
+        """
+        return os.path.join(get_picture_folder(), fe_name + " " + DRIFT_STREAMS[0] + " reference.npz")
+
+    def _correct_drift(self, fe, frames, streams, timer):
+        """
+        Measure how much the feature moved since its first visit, and if it's
+        significant, update its position and move the stage there.
+        The first time, the image is only stored as reference, for all the
+        next runs (including after a restart). A stored reference acquired far
+        from the feature is of another feature with the same name, so it's replaced.
+        fe (Feature): the feature at the current position
+        frames (FrameAcquirer): used to acquire the frames
+        streams (list of Streams): the streams of the tab
+        timer (FeatureTimer): to measure the duration of the registration
+        """
+        s = self._find_stream(streams, DRIFT_STREAMS)
+        if s is None:
+            logging.warning("No %s stream, cannot measure the drift", DRIFT_STREAMS[0])
+            return
+        name = fe.name.value
+        x, y, z = fe.pos.value
+        with timer.phase("register"):
+            data = frames.acquire(s)
+            ref_path = self._get_reference_path(name)
+            if not self._registration.has_reference(name):
+                stored = load_reference(ref_path)
+                if stored is not None:
+                    logging.debug("Using reference image %s", ref_path)
+                    self._registration.set_reference(name, stored[0])
+                    self._reference_pos[name] = stored[1]
+            ref_pos = self._reference_pos.get(name)
+            if ref_pos is None or math.hypot(x - ref_pos[0], y - ref_pos[1]) > self.drift_max:
+                # First visit, or the reference is of another feature with the same name
+                # (eg, on a previous grid)
+                logging.info("Reference image of %s stored for the drift correction", name)
+                self._registration.set_reference(name, data)
+                self._reference_pos[name] = (x, y)
+                try:
+                    save_reference(ref_path, data, (x, y))
+                except Exception:
+                    logging.exception("Failed to store the reference image of %s", name)
+                return
+            try:
+                pxs = data.metadata[model.MD_PIXEL_SIZE]
+                shift, response = self._registration.measure(name, data)
+            except (KeyError, ValueError) as ex:
+                logging.warning("Cannot measure the drift of %s: %s", name, ex)
+                return
+            dx, dy = shift_to_physical(shift, pxs)
+            logging.info("Drift of %s: %+.2f, %+.2f µm (correlation %.2f)", name, dx * 1e6, dy * 1e6, response)
+            if response < MIN_RESPONSE:
+                logging.warning("Drift of %s not reliable, position not corrected", name)
+                return
+            if math.hypot(dx, dy) > self.drift_max:
+                logging.warning("Drift of %s too large to be true, position not corrected", name)
+                return
+            if math.hypot(dx, dy) < self.drift_threshold:
+                return
+            fe.pos.value = (x + dx, y + dy, z)
+            wait_moves([self.main_data.stage.moveAbs({'x': x + dx, 'y': y + dy})])
+
+    def _autofocus(self, fe, frames, streams, timer):
+        """
+        Find the best focus of the feature, and use it to predict the focus of
+        the next features.
+        fe (Feature): the feature at the current position
+        frames (FrameAcquirer): used to acquire the frames
+        streams (list of Streams): the streams of the tab
+        timer (FeatureTimer): to measure the duration of the autofocus
+        """
+        for s in streams:
+            if s.name.value == AUTOFOCUS_STREAM:
+                break
+        else:
+            logging.warning("No %s stream, cannot run the autofocus", AUTOFOCUS_STREAM)
+            return
+        focus = self.main_data.focus
+        with timer.phase("focus"):
+            z = autofocus(focus, frames, s, focus.position.value['z'],
+                          self.autofocus_range, max_frames=self.autofocus_max_frames)
+        if z is not None:
+            self._add_focus_point(fe, z)
+
+    def _get_acq_streams(self, streams):
+        """
+        return (list of Streams): the LM streams to acquire for each feature
+        """
+        return [s for s in streams
+                if not "electrons" in s.name.value and ("Acq" in s.name.value or s.name.value == "RLM")]
+
+    def _start_timelapse(self, streams, fe_name, status, f):
+        """
+        Start acquiring a time-lapse of the LM streams, until it's stopped.
+        return (TimeLapse): the running time-lapse
+        """
+        basename = time.strftime("%Y%m%d-%H%M%S ", time.localtime())
+        filepath = os.path.join(get_picture_folder(), basename + fe_name + " " + status + " timelapse.h5")
+        timelapse = TimeLapse(self._get_acq_streams(streams), filepath, f)
+        timelapse.start()
+        return timelapse
+
+    def _acq_and_save_images(self, streams, fe_name, status, frames, timer, writer=None):
+        """
+        Acquire one frame of each acquisition stream, and export them.
+        frames (FrameAcquirer): used to acquire the frames
+        timer (FeatureTimer): to measure the duration of the acquisition and export
+        writer (ExportQueue or None): if given, the files are written in the
+          background, otherwise they are written before returning.
+        """
         config = conf.get_acqui_conf()
         exporter = dataio.get_converter(config.last_format)
+        if writer is None:
+            export = exporter.export
+        else:
+            export = lambda fn, data: writer.put(exporter.export, fn, data)
         extension = config.last_extension
         dirname = get_picture_folder()
         basename = time.strftime("%Y%m%d-%H%M%S ", time.localtime())
+        combined_path = os.path.join(dirname, basename + fe_name + " " + status + extension)
+        streaming = None
+        if self.streaming_export.value:
+            # Each channel is only written once, and not kept in memory
+            streaming = StreamingExport(exporter, combined_path, writer)
         imgs = []
-        for s in streams:
-            if not "electrons" in s.name.value and ("Acq" in s.name.value or s.name.value == "RLM"):
-                s.raw = []
-                s.single_frame_acquisition.value = True
-                s.should_update.value = True
-                while not s.raw: time.sleep(1)
-                filepath = os.path.join(dirname, basename + fe_name + " " + s.name.value + " " + status + extension)
-                s.should_update.value = False
-                imgs.append(s.raw[0])
-                exporter.export(filepath, s.raw[0])
-        filepath = os.path.join(dirname, basename + fe_name + " " + status + extension)
-        exporter.export(filepath, imgs)
+        for s in self._get_acq_streams(streams):
+            with timer.phase("acquire"):
+                data = frames.acquire(s)
+            filepath = os.path.join(dirname, basename + fe_name + " " + s.name.value + " " + status + extension)
+            with timer.phase("export"):
+                if streaming:
+                    streaming.add(filepath, data)
+                else:
+                    imgs.append(data)
+                    export(filepath, data)
+        if not streaming:
+            with timer.phase("export"):
+                export(combined_path, imgs)
         for s in streams:
             if s.name.value == "RLM":
                 s.single_frame_acquisition.value = False
                 s.should_update.value = True
 
-    def acq_imgs(self, dlg):
+    def acq_imgs(self, dlg, run=None):
+        """
+        Acquire the images of all the features.
+        run (RunState or None): the interrupted run to continue, or None to start a new one
+        """
         main_data = self.main_app.main_data
         tab = self.main_app.main_data.tab.value
         tab_data = tab.tab_data_model
         action = self.action[self.act.value]
+        writer = ExportQueue(self.export_queue_size) if self.pipeline.value else None
+        trace = start_trace("ImgAcq", get_picture_folder()) if self.trace.value else None
+        acq_streams = []
+        journal = None
+        result = RESULT_CANCELLED
         try:
             f = model.ProgressiveFuture()
             f.task_canceller = lambda l: True  # To allow cancelling while it's running
             f.set_running_or_notify_cancel()  # Indicate the work is starting now
             dlg.showProgress(f)
-            initt = time.time()
-            fs = main_data.features.value
-            features = [f for f in fs if not f.status.value == FEATURE_DEACTIVE]
+            frames = FrameAcquirer(f)
+            # The acquisition streams of the profile are only needed now
+            acq_streams = create_acq_streams(main_data, get_current_profile(), tab_data.streams.value,
+                                             tab.streambar_controller)
+            if run is None:
+                fs = main_data.features.value
+                features = [f for f in fs if not f.status.value == FEATURE_DEACTIVE]
+                if self.optimize_route.value:
+                    features = self._order_features(features, dlg)
+                journal = RunJournal.create("ImgAcq", [fe.name.value for fe in features], self._journal_dir)
+            else:
+                features = self._get_run_features(run, ["ImgAcq"])
+                journal = resume_journal(run)
             nb = len(features)
+            phases = self._get_phases(milling=False)
             done = 0
             for fe in features:
-                currt = time.time()
-                left = nb - done
-                if done > 0: dur = left * (currt - initt) / done
-                else: dur = nb * 5 * 60 #default estimate 5 min per site
-                f.set_progress(end=currt + dur)
+                timer = FeatureTimer(fe.name.value, "ImgAcq")
+                # The streams of the tab can change during the run
+                streams = tab_data.streams.value
+                self._update_eta(f, "ImgAcq", phases, nb - done, timer)
                 if f.cancelled():
                     dlg.resumeSettings()
                     return
-                pos = fe.pos.value
-                logging.info(f"Moving to position: {pos}")
-                self.main_data.stage.moveAbs({'x': pos[0], 'y': pos[1]})
-                self.main_data.focus.moveAbs({'z': pos[2]})
-                time.sleep(2.0)
-                self._acq_and_save_images(tab_data.streams.value, fe.name.value, "ImgAcq")
-                time.sleep(2.0)
+                self._move_to_feature(fe.pos.value, frames, streams, timer)
+                if self.drift_correction.value:
+                    self._correct_drift(fe, frames, streams, timer)
+                if self.autofocus.value:
+                    self._autofocus(fe, frames, streams, timer)
+                self._acq_and_save_images(streams, fe.name.value, "ImgAcq", frames, timer, writer)
+                self._step_done(journal, writer, fe, "ImgAcq")
+                self._timing.record("ImgAcq", timer.durations)
                 done += 1
+            if writer is not None:
+                writer.close()  # Wait for the last images to be written
+            result = RESULT_DONE
+            frames.log_summary()
             f.set_result(None)  # Indicate it's over
+        except CancelledError:
+            logging.info("Acquisition cancelled")
+            dlg.resumeSettings()
+            return
+        except Exception as ex:
+            logging.exception("Failed to run on all the features")
+            result = RESULT_FAILED
+            f.set_exception(ex)
+            raise
         finally:
+            if writer is not None:
+                try:
+                    # Also write the images already acquired when cancelled
+                    writer.close()
+                except Exception:
+                    pass  # Already reported
+            if journal is not None:
+                journal.finish(result)
+            if trace is not None:
+                stop_trace(trace)
             for s in tab_data.streams.value:
                 if not "electrons" in s.name.value:
                     s.should_update.value = False
                     s.single_frame_acquisition.value = False
+            teardown_streams(acq_streams, tab.streambar_controller)
         logging.debug("Closing dialog")
         dlg.Close()
 
-    def _auto_mill(self, dlg):
+    def _auto_mill(self, dlg, run=None):
         """
         Automated rough milling operation.
+        run (RunState or None): the interrupted run to continue, or None to start a new one
         """
         main_data = self.main_app.main_data
         tab = self.main_app.main_data.tab.value
         tab_data = tab.tab_data_model
         action = self.action[self.act.value]
-                
+        writer = ExportQueue(self.export_queue_size) if self.pipeline.value else None
+        trace = start_trace(self.label[self.act.value], get_picture_folder()) if self.trace.value else None
+
+        acq_streams = []
+        journal = None
+        result = RESULT_CANCELLED
         try:
             f = model.ProgressiveFuture()
             f.task_canceller = lambda l: True  # To allow cancelling while it's running
             f.set_running_or_notify_cancel()  # Indicate the work is starting now
             dlg.showProgress(f)
-            initt = time.time()
-            fs = main_data.features.value
-            features = [f for f in fs if f.status.value == FEATURE_ACTIVE]
+            frames = FrameAcquirer(f)
+            # The acquisition streams of the profile are only needed now
+            acq_streams = create_acq_streams(main_data, get_current_profile(), tab_data.streams.value,
+                                             tab.streambar_controller)
+            label = self.label[self.act.value]
+            waits = expected_waits(self._recipe, action)
+            if None not in waits and sum(waits) > 0:
+                self._timing.set_prior(label, "mill", sum(waits))
+            # The steps of each feature, which are recorded when done
+            steps = ["PreMill"] + ["mill " + cmd for cmd in action] + [label]
+            if run is None:
+                fs = main_data.features.value
+                features = [f for f in fs if f.status.value == FEATURE_ACTIVE]
+                if self.optimize_route.value:
+                    features = self._order_features(features, dlg)
+                journal = RunJournal.create("mill", [fe.name.value for fe in features], self._journal_dir,
+                                            act=self.act.value, label=label)
+                is_done = lambda name, step: False
+            else:
+                features = self._get_run_features(run, steps)
+                journal = resume_journal(run)
+                is_done = run.is_done
             nb = len(features)
+            phases = self._get_phases(milling=True)
             done = 0
-            sr = self.sem.get_rotation()
             for fe in features:
-                currt = time.time()
-                left = nb - done
-                if done > 0: dur = left * (currt - initt) / done
-                else: dur = nb * 5 * 60 #default estimate 5 min per site
-                f.set_progress(end=currt + dur)
+                timer = FeatureTimer(fe.name.value, label)
+                # The streams of the tab can change during the run
+                streams = tab_data.streams.value
+                self._update_eta(f, label, phases, nb - done, timer)
                 if f.cancelled():
                     dlg.resumeSettings()
                     return
-                pos = fe.pos.value
-                logging.info(f"Moving to position: {pos}")
-                self.main_data.stage.moveAbs({'x': pos[0], 'y': pos[1]})
-                self.main_data.focus.moveAbs({'z': pos[2]})
-                time.sleep(2.0)
-                self._acq_and_save_images(tab_data.streams.value, fe.name.value, "PreMill")
-                time.sleep(2.0)
-                self._set_rot(action)
-                while not np.abs(self.sem.get_rotation() - sr) < 0.0001:
-                    if f.cancelled():
-                        dlg.resumeSettings()
-                        return
-                    time.sleep(4)
+                self._move_to_feature(fe.pos.value, frames, streams, timer)
+                if self.drift_correction.value:
+                    self._correct_drift(fe, frames, streams, timer)
+                if self.autofocus.value:
+                    self._autofocus(fe, frames, streams, timer)
+                # Partial durations would mislead the time estimation
+                resumed = any(is_done(fe.name.value, step) for step in steps)
+                cmds = [cmd for cmd in action if not is_done(fe.name.value, "mill " + cmd)]
+                # Once milled, it's too late to acquire the PreMill images
+                if not is_done(fe.name.value, "PreMill") and len(cmds) == len(action):
+                    self._acq_and_save_images(streams, fe.name.value, "PreMill", frames, timer, writer)
+                    self._step_done(journal, writer, fe, "PreMill")
+                if cmds:
+                    if writer is not None:
+                        # The PreMill step must be recorded before any milling step
+                        writer.flush()
+                    with timer.phase("mill"):
+                        timelapse = None
+                        if self.timelapse.value:
+                            timelapse = self._start_timelapse(streams, fe.name.value, label, f)
+                        try:
+                            self._mill(cmds, f, lambda cmd: journal.step_done(fe.name.value, "mill " + cmd))
+                        finally:
+                            if timelapse is not None:
+                                try:
+                                    timelapse.stop()
+                                except Exception:
+                                    logging.exception("Time-lapse of %s failed", fe.name.value)
+                self._update_eta(f, label, phases, nb - done, timer)
                 if self.act.value > 0: fe.status.value = FEATURE_ROUGH_MILLED
-                self._acq_and_save_images(tab_data.streams.value, fe.name.value, self.label[self.act.value])
+                if not is_done(fe.name.value, label):
+                    self._acq_and_save_images(streams, fe.name.value, label, frames, timer, writer)
+                    self._step_done(journal, writer, fe, label)
+                if not resumed:
+                    self._timing.record(label, timer.durations)
                 done += 1
+            if writer is not None:
+                writer.close()  # Wait for the last images to be written
+            result = RESULT_DONE
+            frames.log_summary()
+            self._channel.log_metrics()
             f.set_result(None)  # Indicate it's over
+        except CancelledError:
+            logging.info("Automated milling cancelled")
+            dlg.resumeSettings()
+            return
+        except Exception as ex:
+            logging.exception("Failed to run on all the features")
+            result = RESULT_FAILED
+            f.set_exception(ex)
+            raise
         finally:
+            if writer is not None:
+                try:
+                    # Also write the images already acquired when cancelled
+                    writer.close()
+                except Exception:
+                    pass  # Already reported
+            if journal is not None:
+                journal.finish(result)
+            if trace is not None:
+                stop_trace(trace)
             for s in tab_data.streams.value:
                 if not "electrons" in s.name.value:
                     s.should_update.value = False
                     s.single_frame_acquisition.value = False
+            teardown_streams(acq_streams, tab.streambar_controller)
 
 
         logging.debug("Closing dialog")
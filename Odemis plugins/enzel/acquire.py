@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Acquisition of single frames from a stream, woken up as soon as the frame is
+received (instead of polling).
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures._base import CancelledError
+
+from enzel.tracing import tracer
+
+# Extra time allowed, on top of the exposure time, for a frame to arrive
+FRAME_TIMEOUT_MARGIN = 10  # s
+
+
+class FrameAcquirer(object):
+    """
+    Acquires single frames from streams, and keeps track of how long it had to
+    wait for each of them.
+    The wait is interrupted as soon as the (progressive) future is cancelled.
+    """
+
+    def __init__(self, future=None):
+        """
+        future (Future or None): the task future. When it's cancelled, the
+          current acquisition is stopped and CancelledError is raised.
+        """
+        self._future = future
+        self._frame_received = threading.Event()
+        self._cancelled = False
+        self.waits = []  # list of (str, float): stream name, wait duration (s)
+        if future is not None:
+            future.add_done_callback(self._on_future_done)
+
+    def _on_future_done(self, future):
+        if future.cancelled():
+            self._cancelled = True
+            self._frame_received.set()
+
+    def abort(self):
+        """
+        Stop the current acquisition (if any), and all the next ones.
+        The acquisitions raise CancelledError.
+        """
+        self._cancelled = True
+        self._frame_received.set()
+
+    def _on_image(self, image):
+        # Called from the stream thread, whenever a new image is computed
+        self._frame_received.set()
+
+    def acquire(self, stream, timeout=None):
+        """
+        Acquire one frame from the stream, and stop it.
+        stream (Stream): stream to acquire, which supports single frame acquisition
+        timeout (float or None): maximum time to wait (s). If None, it is
+          based on the exposure time of the stream.
+        return (DataArray): the raw data received
+        raise:
+          TimeoutError: if no frame was received within the timeout
+          CancelledError: if the future was cancelled during the acquisition
+        """
+        if timeout is None:
+            timeout = FRAME_TIMEOUT_MARGIN
+            if "exposureTime" in getattr(stream, "det_vas", {}):
+                timeout += stream.det_vas["exposureTime"].value
+
+        stream.raw = []
+        self._frame_received.clear()
+        # Note: the VA only keeps a weak reference to the listener, which is
+        # fine as it's a method of this object.
+        stream.image.subscribe(self._on_image)
+        tstart = time.time()
+        with tracer.span("frame", "acquire", stream=stream.name.value):
+            try:
+                stream.single_frame_acquisition.value = True
+                stream.should_update.value = True
+                tend = tstart + timeout
+                # The image is normally updated right after .raw, but we also check
+                # regularly .raw directly, in case the projection failed.
+                while not stream.raw:
+                    if self._cancelled:
+                        raise CancelledError()
+                    left = tend - time.time()
+                    if left <= 0:
+                        raise TimeoutError("No frame received from %s after %g s" %
+                                           (stream.name.value, timeout))
+                    self._frame_received.wait(min(left, 0.1))
+                    self._frame_received.clear()
+            finally:
+                stream.image.unsubscribe(self._on_image)
+                stream.should_update.value = False
+
+        dur = time.time() - tstart
+        self.waits.append((stream.name.value, dur))
+        logging.debug("Received frame of %s after %g s", stream.name.value, dur)
+        return stream.raw[0]
+
+    def log_summary(self):
+        """
+        Log how long it took to acquire all the frames so far.
+        """
+        if not self.waits:
+            return
+        total = sum(d for n, d in self.waits)
+        logging.info("Acquired %d frames in %g s (%g s on average)",
+                     len(self.waits), total, total / len(self.waits))
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Image-based autofocus: finds the focus position which gives the sharpest image
+of a (short exposure) stream, with a coarse scan followed by a golden-section
+search, acquiring as few frames as possible.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+import math
+
+import numpy as np
+
+from enzel.lazy import lazy_import
+
+cv2 = lazy_import("cv2")
+
+DEFAULT_RANGE = 20e-6  # m, total range scanned around the current focus
+DEFAULT_PRECISION = 0.5e-6  # m, stop when the best focus is known within this distance
+DEFAULT_MAX_FRAMES = 12
+COARSE_STEPS = 5  # number of frames of the initial scan
+
+_INV_PHI = (math.sqrt(5) - 1) / 2  # 0.618...
+
+
+def sharpness(image):
+    """
+    Variance of the Laplacian, normalized by the square of the mean intensity,
+    so that it doesn't depend on the brightness.
+    image (ndarray): 2D image
+    return (float): higher is sharper
+    """
+    im = np.asarray(image, dtype=np.float32)
+    # Slight smoothing, so that the noise doesn't dominate
+    im = cv2.GaussianBlur(im, (0, 0), 1)
+    lap = cv2.Laplacian(im, cv2.CV_32F)
+    mean = float(im.mean())
+    if mean <= 0:
+        return 0.0
+    return float(lap.var()) / mean ** 2
+
+
+def golden_section_max(f, a, b, fa=None, fb=None, tol=DEFAULT_PRECISION, max_evals=10, cache=None):
+    """
+    Find the maximum of a unimodal function on [a, b].
+    f (callable float -> float): function to maximize
+    tol (float): stop when the interval is smaller than this
+    max_evals (int): maximum number of calls to f. The search stops before
+      an iteration would need more.
+    cache (dict float -> float or None): values already known. At least one
+      value must be known if max_evals is less than 2.
+    return (float, float): position and value of the best point evaluated
+    """
+    cache = {} if cache is None else cache
+
+    def ev(x):
+        if x not in cache:
+            cache[x] = f(x)
+        return cache[x]
+
+    evals = 0
+    c = b - _INV_PHI * (b - a)
+    d = a + _INV_PHI * (b - a)
+    while abs(b - a) > tol:
+        needed = (c not in cache) + (d not in cache)
+        if evals + needed > max_evals:
+            break
+        evals += needed
+        if ev(c) >= ev(d):
+            b, d = d, c
+            c = b - _INV_PHI * (b - a)
+        else:
+            a, c = c, d
+            d = a + _INV_PHI * (b - a)
+    best = max(cache, key=cache.get)
+    return best, cache[best]
+
+
+def autofocus(focus, frames, stream, z0, rng=DEFAULT_RANGE, precision=DEFAULT_PRECISION,
+              max_frames=DEFAULT_MAX_FRAMES):
+    """
+    Move the focus to the position where the stream image is the sharpest.
+    focus (Actuator): the focus, with a z axis
+    frames (FrameAcquirer): used to acquire the frames
+    stream (Stream): the stream to acquire, which should be short
+    z0 (float): focus position around which to search (m)
+    rng (float): total range scanned (m)
+    precision (float): stop when the best focus is known within this distance (m)
+    max_frames (int): maximum number of frames acquired, at least COARSE_STEPS
+    return (float or None): the best focus position found (m), or None if it
+      couldn't be found (in which case the focus is moved back to z0)
+    raise:
+      ValueError: if max_frames is smaller than COARSE_STEPS
+      CancelledError: if the acquisition was cancelled
+    """
+    if max_frames < COARSE_STEPS:
+        raise ValueError("max_frames must be at least %d, got %d" % (COARSE_STEPS, max_frames))
+    zmin, zmax = focus.axes["z"].range
+    lo, hi = max(zmin, z0 - rng / 2), min(zmax, z0 + rng / 2)
+    scores = {}  # z -> sharpness
+
+    def measure(z):
+        if len(scores) >= max_frames:
+            raise RuntimeError("Autofocus out of frames (%d)" % (max_frames,))
+        focus.moveAbs({"z": z}).result()
+        scores[z] = sharpness(frames.acquire(stream))
+        logging.debug("Sharpness at z = %g m: %g", z, scores[z])
+        return scores[z]
+
+    # Coarse scan, to find where the best focus is (the sharpness is only
+    # unimodal close to the focus)
+    coarse = np.linspace(lo, hi, COARSE_STEPS)
+    for z in coarse:
+        measure(float(z))
+    i = int(np.argmax([scores[float(z)] for z in coarse]))
+    if i in (0, len(coarse) - 1):
+        logging.warning("Best focus at the end of the range (%g m), focus not found", coarse[i])
+        focus.moveAbs({"z": z0}).result()
+        return None
+
+    # Fine search, between the neighbours of the best coarse point
+    a, b = float(coarse[i - 1]), float(coarse[i + 1])
+    zbest, score = golden_section_max(measure, a, b, tol=precision,
+                                      max_evals=max_frames - len(scores), cache=scores)
+    focus.moveAbs({"z": zbest}).result()
+    logging.info("Best focus found at z = %g m (%+g m), sharpness %g, after %d frames",
+                 zbest, zbest - z0, score, len(scores))
+    return zbest
@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Benchmark of the plugins on the simulator: runs the feature loops of
+AutoRoughMill, the move of moveSampleStage and the IFM-Monitor processing, and
+reports the wall time per feature, the time spent in each phase and the memory
+peak. Run it from the "Odemis plugins" folder with:
+python3 -m enzel.bench [scenario...] [--baseline previous.json]
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+from collections import OrderedDict
+import argparse
+import importlib.util
+import json
+import logging
+import math
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from enzel.eta import PHASES, TimingModel
+from enzel.recipe import EXAMPLE_RECIPE_PATH, load_recipe, scale_recipe
+from enzel.sim import AcquisitionDialog, Plugin, Simulator
+from enzel.tracing import start_trace, stop_trace
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_plugin(sim, filename):
+    """
+    Load the plugin file, and create its plugin, connected to the simulator.
+    sim (Simulator): must be installed
+    filename (str): name of the file in the plugins folder
+    return (Plugin)
+    """
+    name = "plugin_" + os.path.splitext(filename)[0]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(PLUGIN_DIR, filename))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    for obj in vars(mod).values():
+        if isinstance(obj, type) and issubclass(obj, Plugin) and obj.__module__ == name:
+            return obj(sim, sim.main_app)
+    raise ValueError("No plugin found in %s" % (filename,))
+
+
+def _timing_report(timing, action):
+    """
+    Convert the durations recorded by the runner to the benchmark results.
+    return (dict): per_feature (list of float): total time of each feature (s),
+      phases (dict str -> list of float): phase -> time of each feature (s)
+    """
+    phases = OrderedDict()
+    for p in PHASES:
+        h = timing.history(action, p)
+        if h:
+            phases[p] = h
+    nb = max([len(h) for h in phases.values()] + [0])
+    per_feature = [sum(h[i] for h in phases.values() if i < len(h)) for i in range(nb)]
+    return {"per_feature": per_feature, "phases": phases}
+
+
+def _prepare_runner(sim, options):
+    """
+    return (AutoRoughMill): the runner plugin, with features and streams, and the stage at the origin
+    """
+    if options.profile:
+        # Preview streams from the profile, the acquisition ones created by the runner
+        sim.add_streams(acq=False)
+        load_plugin(sim, "setupStreambarController.py").setup(options.profile)
+    else:
+        sim.add_streams()
+    nx = int(math.ceil(math.sqrt(options.features)))
+    ny = int(math.ceil(options.features / nx))
+    sim.main_data.features.value = sim.add_features(nx, ny)[:options.features]
+    sim.stage.moveAbs({"x": 0, "y": 0}).result()
+    arm = load_plugin(sim, "AutoRoughMill.py")
+    arm._timing = TimingModel(None)  # Don't mix with the history of the microscope
+    arm._journal_dir = os.path.join(sim.folder, "journal")
+    arm._recipe = scale_recipe(load_recipe(EXAMPLE_RECIPE_PATH), sim.time_scale)
+    arm.pipeline.value = options.pipeline
+    arm.settle_check.value = options.settle_check
+    arm.optimize_route.value = options.optimize_route
+    arm.streaming_export.value = options.streaming_export
+    arm.timelapse.value = options.timelapse
+    arm.autofocus.value = options.autofocus
+    arm.drift_correction.value = options.drift_correction
+    return arm
+
+
+def _run_dialog(arm, method):
+    dlg = AcquisitionDialog(arm, "Benchmark")
+    method(dlg)
+    if dlg.future is not None and dlg.future.done() and not dlg.future.cancelled():
+        dlg.future.result()  # raise the error, if any
+
+
+def bench_acq_imgs(sim, options):
+    arm = _prepare_runner(sim, options)
+    _run_dialog(arm, arm.acq_imgs)
+    return _timing_report(arm._timing, "ImgAcq")
+
+
+def bench_auto_mill(sim, options):
+    arm = _prepare_runner(sim, options)
+    arm.act.value = options.act
+    nmill = len(sim.sem.history)
+    _run_dialog(arm, arm._auto_mill)
+    res = _timing_report(arm._timing, arm.label[options.act])
+    res["milled"] = [(n, d) for n, d, s in sim.sem.history[nmill:]]
+    return res
+
+
+def bench_position_stage(sim, options):
+    sim.stage.moveAbs({"x": 0, "y": 0, "z": 0, "rx": 0, "rz": 0}).result()
+    msm = load_plugin(sim, "moveSampleStage.py")
+    nmoves = len(sim.stage.moves)
+    tstart = time.time()
+    msm.position_stage(AcquisitionDialog(msm, "Benchmark"))
+    dur = time.time() - tstart
+    return {"per_feature": [dur], "phases": {"move": [dur]},
+            "moves": len(sim.stage.moves) - nmoves}
+
+
+def bench_setup_streams(sim, options):
+    from enzel.profiles import DEFAULT_PROFILE
+
+    sim.add_streams(acq=False)
+    ssc = load_plugin(sim, "setupStreambarController.py")
+    tstart = time.time()
+    ssc.setup(options.profile or DEFAULT_PROFILE)
+    dur = time.time() - tstart
+    return {"per_feature": [], "phases": {}, "setup_time": dur,
+            "streams": len(sim.tab.tab_data_model.streams.value)}
+
+
+def _measure_startup(filename, scale):
+    """
+    Load a plugin, as the GUI does when it starts. To be run in a new process,
+    so that the modules imported by the plugin are not already loaded.
+    Prints the results, as JSON.
+    """
+    sim = Simulator(time_scale=scale)
+    sim.install()
+    before = set(sys.modules)
+    tstart = time.time()
+    load_plugin(sim, filename)
+    dur = time.time() - tstart
+    # Only report the top packages, eg "cv2" instead of all its modules
+    # (and which of our own modules are loaded)
+    loaded = set(m.split(".")[0] for m in before)
+    new = set(sys.modules) - before
+    imported = set(m.split(".")[0] for m in new if m.split(".")[0] not in loaded)
+    imported |= set(m for m in new if m.startswith("enzel."))
+    imported = sorted(m for m in imported if not m.startswith("_"))
+    sim.terminate()
+    print(json.dumps({"time": dur, "imports": [m for m in imported if not m.startswith("plugin_")]}))
+
+
+def bench_startup(sim, options):
+    plugins = OrderedDict()
+    for fn in sorted(os.listdir(PLUGIN_DIR)):
+        if not fn.endswith(".py"):
+            continue
+        code = "from enzel.bench import _measure_startup; _measure_startup(%r, %r)" % (fn, options.scale)
+        out = subprocess.check_output([sys.executable, "-c", code], cwd=PLUGIN_DIR)
+        plugins[fn] = json.loads(out.decode("utf-8").splitlines()[-1])
+    return {"per_feature": [], "phases": {}, "plugins": plugins,
+            "startup_time": sum(p["time"] for p in plugins.values())}
+
+
+def bench_monitor(sim, options):
+    from enzel.commands import get_channel
+    from enzel.endpoint import CusumDetector, EndpointStopper
+    from enzel.monitor import IntensityMonitor
+
+    latencies = []
+
+    def on_frame(frame, record):
+        latencies.append(time.time() - record["time"])
+
+    sim.stage.moveAbs({"x": 0, "y": 0}).result()
+    sim.focus.moveAbs({"z": sim.sample.best_focus(0, 0)}).result()
+    sim.ccd.exposureTime.value = options.exposure
+    monitor = IntensityMonitor(sim.ccd.data, hw=3, track_drift=True)
+    monitor.add_listener(on_frame)
+    stopper = EndpointStopper(get_channel(sim.sem), CusumDetector())
+    monitor.add_listener(stopper.on_frame)
+    get_channel(sim.sem).send("mill_0_6um")  # bleaches the fluorescence, until stopped
+    tstart = time.time()
+    monitor.start()
+    try:
+        while monitor.stats.count < options.frames:
+            time.sleep(0.05)
+    finally:
+        monitor.stop()
+    dur = time.time() - tstart
+    nframes = monitor.stats.count
+    return {"per_feature": [], "phases": {},
+            "frames": nframes, "fps": nframes / dur,
+            "frame_latency": float(np.mean(latencies)) if latencies else None,
+            "endpoint_frame": stopper.decisions[0]["frame"] if stopper.decisions else None}
+
+
+SCENARIOS = OrderedDict((
+    ("acq_imgs", bench_acq_imgs),
+    ("auto_mill", bench_auto_mill),
+    ("position_stage", bench_position_stage),
+    ("setup_streams", bench_setup_streams),
+    ("startup", bench_startup),
+    ("monitor", bench_monitor),
+))
+
+
+def _get_rss():
+    """
+    return (int or None): memory used by the process (bytes), None if unknown
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class MemorySampler(object):
+    """
+    Samples the memory used by the process, to find its peak.
+    (tracemalloc would be more precise, but it slows down the allocations too
+    much to also measure the time)
+    """
+
+    def __init__(self, period=0.01):
+        self._period = period
+        self._stop = threading.Event()
+        self._start_rss = _get_rss()
+        self.peak = self._start_rss
+        self._thread = threading.Thread(target=self._run, name="Memory sampler")
+        self._thread.daemon = True
+
+    def start(self):
+        if self._start_rss is not None:
+            self._thread.start()
+
+    def stop(self):
+        """
+        return (int or None): peak memory increase since the start (bytes)
+        """
+        if self._start_rss is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        return self.peak - self._start_rss
+
+    def _run(self):
+        while not self._stop.wait(self._period):
+            self.peak = max(self.peak, _get_rss())
+
+
+def run_scenario(sim, name, options):
+    """
+    Run one scenario, measuring its wall time and memory peak.
+    return (dict): the results
+    """
+    logging.info("Running scenario %s", name)
+    mem = MemorySampler()
+    trace = start_trace(name, options.trace) if options.trace else None
+    mem.start()
+    tstart = time.time()
+    try:
+        res = SCENARIOS[name](sim, options)
+    finally:
+        wall = time.time() - tstart
+        mem_peak = mem.stop()
+        if trace is not None:
+            stop_trace(trace)
+    res["wall"] = wall
+    res["mem_peak"] = mem_peak
+    pf = res["per_feature"]
+    res["feature_time"] = float(np.mean(pf)) if pf else None
+    res["phase_time"] = {p: float(np.mean(d)) for p, d in res["phases"].items()}
+    return res
+
+
+def print_report(results, out=sys.stdout):
+    phases = [p for p in PHASES if any(p in r["phase_time"] for r in results.values())]
+    header = "%-15s %9s %5s %9s" % ("Scenario", "Wall (s)", "Feat", "Feat (s)")
+    header += "".join(" %8s" % (p,) for p in phases) + " %9s" % ("Mem (MB)",)
+    out.write(header + "\n")
+    for name, r in results.items():
+        line = "%-15s %9.2f %5d %9s" % (name, r["wall"], len(r["per_feature"]),
+                                       "%.2f" % r["feature_time"] if r["feature_time"] is not None else "-")
+        for p in phases:
+            line += " %8s" % ("%.2f" % r["phase_time"][p] if p in r["phase_time"] else "-",)
+        line += " %9s" % ("%.1f" % (r["mem_peak"] / 2 ** 20) if r["mem_peak"] is not None else "-",)
+        out.write(line + "\n")
+    if "startup" in results:
+        for fn, p in results["startup"]["plugins"].items():
+            out.write("Loading %s: %.3f s, importing %s\n" % (fn, p["time"], ", ".join(p["imports"]) or "nothing"))
+    if "monitor" in results:
+        r = results["monitor"]
+        out.write("Monitor: %d frames at %.1f fps, %s s from frame to statistics, endpoint at frame %s\n" %
+                  (r["frames"], r["fps"],
+                   "%.4f" % r["frame_latency"] if r["frame_latency"] is not None else "-",
+                   r["endpoint_frame"]))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare the wall time and time per feature with the ones of a previous run.
+    tolerance (float): relative increase accepted
+    return (list of str): description of each regression
+    """
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            continue
+        for key in ("wall", "feature_time", "startup_time"):
+            if r.get(key) is None or b.get(key) is None:
+                continue
+            if r[key] > b[key] * (1 + tolerance):
+                regressions.append("%s %s: %.2f s instead of %.2f s (+%d %%)" %
+                                   (name, key, r[key], b[key], round((r[key] / b[key] - 1) * 100)))
+    return regressions
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of the ENZEL plugins on the simulated hardware")
+    parser.add_argument("scenarios", nargs="*",
+                        help="Scenarios to run, among %s (default: all)" % (", ".join(SCENARIOS),))
+    parser.add_argument("--scale", type=float, default=0.01,
+                        help="Multiplier of the durations of the hardware")
+    parser.add_argument("--features", type=int, default=4, help="Number of features")
+    parser.add_argument("--act", type=int, default=0, help="Action of AutoRoughMill (0-5)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Write the images while moving to the next feature")
+    parser.add_argument("--settle-check", action="store_true", help="Check the image is stable after each move")
+    parser.add_argument("--optimize-route", action="store_true", help="Optimize the feature order")
+    parser.add_argument("--streaming-export", action="store_true", help="Write each image once")
+    parser.add_argument("--timelapse", action="store_true", help="Acquire the LM streams while milling")
+    parser.add_argument("--autofocus", action="store_true", help="Find the best focus of each feature")
+    parser.add_argument("--drift-correction", action="store_true", help="Correct the drift of each feature")
+    parser.add_argument("--profile", help="Set up the streams with this stream profile, "
+                                          "instead of creating all of them in the tab")
+    parser.add_argument("--format", default="TIFF", choices=("TIFF", "HDF5"), help="Format of the images")
+    parser.add_argument("--frames", type=int, default=500, help="Number of frames for the monitor")
+    parser.add_argument("--exposure", type=float, default=0.1, help="Exposure time for the monitor (s)")
+    parser.add_argument("--json", help="File where to save the results")
+    parser.add_argument("--trace", help="Folder where to save the trace of each scenario")
+    parser.add_argument("--baseline", help="Results of a previous run, to detect regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative slow down accepted compared to the baseline")
+    parser.add_argument("--log-level", type=int, default=1, help="0: warnings, 1: info, 2: debug")
+    options = parser.parse_args(args[1:])
+    for name in options.scenarios:
+        if name not in SCENARIOS:
+            parser.error("Unknown scenario %s" % (name,))
+
+    loglev = (logging.WARNING, logging.INFO, logging.DEBUG)[min(options.log_level, 2)]
+    logging.basicConfig(level=loglev, format="%(asctime)s %(levelname)s %(message)s")
+
+    sim = Simulator(time_scale=options.scale, export_format=options.format)
+    sim.install()
+    results = OrderedDict()
+    try:
+        for name in options.scenarios or SCENARIOS.keys():
+            results[name] = run_scenario(sim, name, options)
+    finally:
+        sim.terminate()
+        shutil.rmtree(sim.folder, ignore_errors=True)
+
+    print_report(results)
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump({"scale": options.scale, "scenarios": results}, f, indent=1)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != options.scale:
+            logging.warning("Baseline run with time scale %s, instead of %s", baseline.get("scale"), options.scale)
+        regressions = compare(results, baseline["scenarios"], options.tolerance)
+        for r in regressions:
+            print("Regression: %s" % (r,))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    ret = main(sys.argv)
+    exit(ret)
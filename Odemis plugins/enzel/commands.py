@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Command channel to iFast (LamellaMillingCommands.xrml), which reads the commands
+as small offsets of the scan rotation, and sets the rotation back to its default
+value to acknowledge them.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from enzel.completion import rotation_diff, wait_rotation_back
+from enzel.settle import wait_rotation
+from enzel.tracing import tracer
+
+# code (float): offset of the scan rotation (deg)
+# blocking (bool): if True, iFast acknowledges the command once all the patterns
+#   are milled. Otherwise, it acknowledges it as soon as the milling starts.
+Command = namedtuple("Command", ["label", "code", "blocking"])
+
+COMMANDS = OrderedDict((
+    ("stop", Command("Stop", -0.001, False)),
+    ("relief_cuts", Command("Stress relieve cuts", 0.001, False)),
+    ("mill_2_5um", Command("2.5 um", 0.002, False)),
+    ("mill_1_0um", Command("1.0 um", 0.003, False)),
+    ("mill_0_6um", Command("0.6 um", 0.004, False)),
+    ("mill_0_2um", Command("0.2 um", 0.005, False)),
+    ("alignment_hole", Command("3-beam alignment hole", 0.006, False)),
+    ("beam_align", Command("Beam alignment", 0.007, False)),
+    ("auto_rc_rm", Command("RC and RM", 0.011, True)),
+    ("auto_relief_cuts", Command("Relief Cuts", 0.012, True)),
+    ("auto_rough_milling", Command("Rough Milling", 0.013, True)),
+    ("auto_2um", Command("2 um", 0.014, True)),
+    ("auto_1um", Command("1 um", 0.015, True)),
+))
+
+# Sequences of commands, which can be run one after another without interaction
+SEQUENCES = OrderedDict((
+    ("rc_2um_1um", ("auto_relief_cuts", "auto_2um", "auto_1um")),
+))
+
+DEFAULT_SCAN_ROTATION = 180.0  # deg, DefScanRot in LamellaMillingCommands
+# Tolerance when comparing the scan rotation: half the difference between two
+# codes (0.001°). It has to be smaller than the code, otherwise the rotation of
+# the command would already be taken for the acknowledgement. The XT readback
+# is much more precise than that, as iFast itself compares the rotation with
+# DefScanRot + the code.
+ROTATION_ATOL = np.deg2rad(0.0005)  # rad
+
+
+class CommandChannel(object):
+    """
+    Sends the commands to iFast, one at a time.
+    Commands can be sent directly (send()), run synchronously (run()), or
+    queued (submit()), in which case each command is sent as soon as the
+    previous one is acknowledged.
+    """
+
+    def __init__(self, sem, def_sr=DEFAULT_SCAN_ROTATION):
+        """
+        sem (Component): the XT connection
+        def_sr (float): default scan rotation (deg)
+        """
+        self.sem = sem
+        self.def_sr = def_sr
+        self.latencies = {}  # str -> list of float: command name -> acknowledgement latencies (s)
+        self._lock = threading.Lock()  # Only one command in flight
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run_queue, name="iFast command queue")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _get_rotation(self, name):
+        """
+        return (float): the scan rotation corresponding to the command (rad)
+        """
+        return np.deg2rad(self.def_sr + COMMANDS[name].code)
+
+    def send(self, name):
+        """
+        Send the command, without waiting for it to be acknowledged.
+        name (str): a key of COMMANDS
+        """
+        logging.debug("Sending command %s", name)
+        tracer.instant("send " + name, "ifast", command=name)
+        self.sem.set_rotation(self._get_rotation(name))
+
+    def run(self, name, expected=None, timeout=None, future=None):
+        """
+        Send the command, and wait until it's acknowledged.
+        name (str): a key of COMMANDS
+        expected (float or None): expected time until the acknowledgement (s)
+        timeout (float or None): maximum time to wait for the acknowledgement (s)
+        future (Future or None): if it's cancelled, the wait stops
+        return (float): time it took for iFast to acknowledge the command (s)
+        raise:
+          TimeoutError: if the command is not acknowledged within the timeout.
+            iFast is then asked to stop, and the queued commands are cancelled.
+          CancelledError: if the future is cancelled
+        """
+        with self._lock, tracer.span("ifast " + name, "ifast", command=name):
+            tstart = time.time()
+            # The acknowledgement is compared to the rotation as reported by
+            # XT, which might be rounded differently from def_sr. Unless it
+            # could be a command, which iFast will not set back.
+            base_rot = self.sem.get_rotation()
+            if abs(rotation_diff(base_rot, np.deg2rad(self.def_sr))) > ROTATION_ATOL:
+                logging.warning("Scan rotation at %g° instead of %g°, a command might still be running",
+                                np.rad2deg(base_rot), self.def_sr)
+                base_rot = np.deg2rad(self.def_sr)
+            rot = self._get_rotation(name)
+            self.sem.set_rotation(rot)
+            # Make sure the new rotation is applied, otherwise the default
+            # rotation could be read back before iFast even sees the command.
+            wait_rotation(self.sem, rot, timeout=2.0, atol=ROTATION_ATOL)
+            try:
+                latency = wait_rotation_back(self.sem, base_rot, tstart,
+                                             expected, timeout, future, atol=ROTATION_ATOL)
+            except TimeoutError:
+                logging.warning("Command %s not acknowledged in time, stopping iFast", name)
+                self.stop()
+                raise
+        self.latencies.setdefault(name, []).append(latency)
+        logging.info("Command %s (rotation code %g) acknowledged after %g s",
+                     name, COMMANDS[name].code, latency)
+        return latency
+
+    def submit(self, name):
+        """
+        Queue the command, to be run as soon as all the previous ones are
+        acknowledged.
+        name (str): a key of COMMANDS
+        return (Future): its result is the acknowledgement latency (s)
+        """
+        if name not in COMMANDS:
+            raise KeyError("Unknown command %s" % (name,))
+        f = Future()
+        self._queue.put((name, f))
+        return f
+
+    def submit_sequence(self, names):
+        """
+        Queue all the commands of a sequence.
+        names (str or list of str): a key of SEQUENCES, or a list of commands
+        return (list of Futures): one per command
+        """
+        if isinstance(names, str):
+            names = SEQUENCES[names]
+        return [self.submit(n) for n in names]
+
+    def stop(self):
+        """
+        Cancel all the queued commands, and stop the current milling.
+        """
+        while True:
+            try:
+                name, f = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            f.cancel()
+        self.send("stop")
+
+    def _run_queue(self):
+        while True:
+            name, f = self._queue.get()
+            if not f.set_running_or_notify_cancel():
+                continue
+            try:
+                f.set_result(self.run(name))
+            except Exception as ex:
+                logging.exception("Command %s failed", name)
+                f.set_exception(ex)
+
+    def log_metrics(self):
+        """
+        Log the acknowledgement latency of each command run so far.
+        """
+        for name, lats in self.latencies.items():
+            logging.info("Command %s: %d runs, latency %g s on average (max %g s)",
+                         name, len(lats), sum(lats) / len(lats), max(lats))
+
+
+_channels = {}  # str -> CommandChannel: component name -> channel
+_channels_lock = threading.Lock()
+
+
+def get_channel(sem, def_sr=DEFAULT_SCAN_ROTATION):
+    """
+    Get the command channel of the XT connection, shared by all the plugins.
+    sem (Component): the XT connection
+    def_sr (float): default scan rotation (deg)
+    return (CommandChannel)
+    """
+    with _channels_lock:
+        if sem.name not in _channels:
+            _channels[sem.name] = CommandChannel(sem, def_sr)
+        return _channels[sem.name]
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Detection of the end of a milling pattern run by iFast, which signals it by
+setting the scan rotation back to its default value.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+import math
+import threading
+import time
+from concurrent.futures._base import CancelledError
+
+# Polling periods of the scan rotation. The fastest period is only used around
+# the expected end of the pattern, to keep the load on the XT connection low.
+MIN_POLL_PERIOD = 0.2  # s
+DEFAULT_POLL_PERIOD = 0.5  # s, when the expected duration is unknown, or passed
+MAX_POLL_PERIOD = 5  # s
+
+
+def rotation_diff(a, b):
+    """
+    a, b (float): two rotations (rad)
+    return (float): the difference a - b, wrapped to ]-pi, pi] (rad). So that
+      rotations reported around ±pi (eg, the default 180°) compare correctly.
+    """
+    d = (a - b) % (2 * math.pi)
+    if d > math.pi:
+        d -= 2 * math.pi
+    return d
+
+
+def next_poll_period(elapsed, expected):
+    """
+    Compute how long to wait before checking again the scan rotation.
+    elapsed (float): time since the pattern started (s)
+    expected (float or None): expected duration of the pattern (s)
+    return (float): time to wait (s)
+    """
+    if expected is None:
+        return DEFAULT_POLL_PERIOD
+    left = expected - elapsed
+    if left > 0:
+        # Sleep a fraction of the time left, so that the checks get more
+        # frequent when approaching the expected end.
+        return min(max(left / 4, MIN_POLL_PERIOD), MAX_POLL_PERIOD)
+    elif left > -0.2 * expected:
+        return MIN_POLL_PERIOD  # Just passed the expected end => check often
+    else:
+        return DEFAULT_POLL_PERIOD
+
+
+def wait_rotation_back(sem, base_rot, tstart, expected=None, timeout=None, future=None, atol=1e-4):
+    """
+    Wait until iFast has finished the pattern, which is indicated by the scan
+    rotation being set back to its default value.
+    sem (Component): the XT connection
+    base_rot (float): the default scan rotation (rad)
+    tstart (float): time at which the pattern was requested
+    expected (float or None): expected duration of the pattern (s)
+    timeout (float or None): maximum time to wait (s). If None, it's based on
+      the expected duration, or there is no limit if the duration is unknown
+      (some patterns take hours).
+    future (Future or None): if it's cancelled, the wait stops
+    atol (float): tolerance on the rotation (rad)
+    return (float): the duration of the pattern (s), measured from tstart
+    raise:
+      TimeoutError: if the pattern is still not finished after the timeout
+      CancelledError: if the future is cancelled
+    """
+    if timeout is None and expected is not None:
+        timeout = expected * 3 + 60
+    cancelled = threading.Event()
+    if future is not None:
+        future.add_done_callback(lambda f: f.cancelled() and cancelled.set())
+
+    nchecks = 0
+    while True:
+        rot = sem.get_rotation()
+        nchecks += 1
+        now = time.time()
+        if abs(rotation_diff(rot, base_rot)) < atol:
+            dur = now - tstart
+            logging.debug("Pattern finished after %g s (%d checks)", dur, nchecks)
+            return dur
+        if timeout is not None and now - tstart > timeout:
+            raise TimeoutError("Pattern still not finished after %g s" % (timeout,))
+        if cancelled.wait(next_poll_period(now - tstart, expected)):
+            raise CancelledError()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Automatic milling endpoint detection, from the fluorescence intensity measured
+by the monitor.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+import math
+import time
+
+
+class CusumDetector(object):
+    """
+    Online detection of a change of the mean of a signal, with the CUSUM
+    algorithm. The mean and standard deviation of the signal are first learnt
+    during a warm-up period. Afterwards, each value only takes O(1) time.
+    Optionally, it also triggers when the value goes past a fraction of the
+    initial mean.
+    """
+
+    def __init__(self, threshold=8.0, slack=0.5, warmup=30, direction=-1, ratio=None):
+        """
+        threshold (float): cumulative deviation (in standard deviations)
+          needed to trigger
+        slack (float): deviation (in standard deviations) which is tolerated
+          at each sample, without accumulating
+        warmup (int): number of values used to learn the initial mean
+        direction (-1, 1 or 0): -1 to detect a decrease, 1 an increase, 0 both
+        ratio (float or None): if given, also trigger when the value is below
+          (for a decrease) or above (for an increase) ratio * initial mean
+        """
+        self.threshold = threshold
+        self.slack = slack
+        self.warmup = warmup
+        self.direction = direction
+        self.ratio = ratio
+        self.reset()
+
+    def reset(self):
+        self._n = 0
+        self._mean = 0.0
+        self._m2 = 0.0  # sum of the squared differences to the mean
+        self._std = None
+        self.s_pos = 0.0
+        self.s_neg = 0.0
+
+    @property
+    def ready(self):
+        """
+        (bool): True once the warm-up is over
+        """
+        return self._std is not None
+
+    def update(self, value):
+        """
+        Add a value of the signal.
+        value (float)
+        return (bool): True if a change is detected
+        """
+        if self._std is None:
+            # Welford's algorithm for the mean and variance
+            self._n += 1
+            d = value - self._mean
+            self._mean += d / self._n
+            self._m2 += d * (value - self._mean)
+            if self._n >= self.warmup:
+                self._std = max(math.sqrt(self._m2 / max(self._n - 1, 1)), 1e-9)
+                logging.debug("CUSUM baseline: mean = %g, std = %g", self._mean, self._std)
+            return False
+
+        z = (value - self._mean) / self._std
+        self.s_pos = max(0.0, self.s_pos + z - self.slack)
+        self.s_neg = max(0.0, self.s_neg - z - self.slack)
+        if self.direction <= 0:
+            if self.s_neg > self.threshold:
+                return True
+            if self.ratio is not None and value < self.ratio * self._mean:
+                return True
+        if self.direction >= 0:
+            if self.s_pos > self.threshold:
+                return True
+            if self.ratio is not None and value > self.ratio * self._mean:
+                return True
+        return False
+
+
+class EndpointStopper(object):
+    """
+    Listens to the frames of an IntensityMonitor, and stops the milling as soon
+    as the detector triggers on the mean intensity of the ROI.
+    Each decision is logged, and kept in .decisions.
+    """
+
+    def __init__(self, channel, detector, roi=0):
+        """
+        channel (CommandChannel): used to send the stop command to iFast
+        detector (CusumDetector): the change detector
+        roi (int): index of the ROI to watch
+        """
+        self._channel = channel
+        self._detector = detector
+        self._roi = roi
+        self.triggered = False
+        self.decisions = []  # list of dict: information about each stop
+
+    def on_frame(self, frame, record):
+        """
+        To be passed to IntensityMonitor.add_listener()
+        """
+        if self.triggered:
+            return
+        value = float(record["mean"][self._roi])
+        if not self._detector.update(value):
+            return
+
+        self.triggered = True
+        self._channel.stop()
+        # Latency from the frame acquisition to the stop command
+        latency = time.time() - record["time"]
+        decision = {"frame": int(record["index"]), "time": float(record["time"]),
+                    "value": value, "s_neg": self._detector.s_neg,
+                    "s_pos": self._detector.s_pos, "latency": latency}
+        self.decisions.append(decision)
+        logging.warning("Milling endpoint detected at frame %d (intensity %g), "
+                        "stop command sent %g s after the frame", decision["frame"], value, latency)
+
+    def rearm(self):
+        """
+        Start detecting again, with a new baseline (eg, for the next milling step).
+        """
+        self._detector.reset()
+        self.triggered = False
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Learned estimation of the time left, based on the duration of each phase of the
+features previously processed.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+from contextlib import contextmanager
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from enzel.tracing import tracer
+
+# The phases of the processing of a feature
+PHASES = ("move", "settle", "register", "focus", "acquire", "mill", "export")
+
+# Duration of each phase, when nothing is known yet
+DEFAULT_PHASE_TIME = {
+    "move": 5,  # s
+    "settle": 2,  # s
+    "register": 2,  # s
+    "focus": 10,  # s
+    "acquire": 100,  # s
+    "mill": 180,  # s
+    "export": 10,  # s
+}
+
+DEFAULT_FILE = os.path.join(os.path.expanduser("~"), ".config", "odemis", "enzel_timing.json")
+
+
+class FeatureTimer(object):
+    """
+    Measures the duration of each phase of the processing of one feature.
+    A phase can be run multiple times (eg, acquiring before and after milling),
+    in which case the durations are summed.
+    Each phase is also recorded as a span in the current trace (if any).
+    """
+
+    def __init__(self, feature=None, action=None):
+        """
+        feature (str or None): name of the feature, for the trace
+        action (str or None): name of the action, for the trace
+        """
+        self.durations = {}  # str -> float: phase -> duration (s)
+        self._feature = feature
+        self._action = action
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager to measure the time spent in the given phase.
+        name (str): one of PHASES
+        """
+        tstart = time.time()
+        try:
+            with tracer.span(name, "phase", feature=self._feature, action=self._action):
+                yield
+        finally:
+            dur = time.time() - tstart
+            self.durations[name] = self.durations.get(name, 0) + dur
+
+
+class TimingModel(object):
+    """
+    Keeps the history of the duration of each phase, per action, and uses it
+    to predict how long it will take to process the features.
+    The history is stored in a JSON file, so that it's available in the next
+    sessions.
+    """
+
+    def __init__(self, filename=DEFAULT_FILE, history=50):
+        """
+        filename (str or None): file where the history is stored. If None, the
+          history is only kept in memory.
+        history (int): maximum number of durations kept per action and phase
+        """
+        self._filename = filename
+        self._history = history
+        self._times = {}  # str -> str -> list of float: action -> phase -> durations
+        self._priors = {}  # (str, str) -> float: (action, phase) -> expected duration
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename) as f:
+                    self._times = json.load(f)
+            except Exception:
+                logging.exception("Failed to read timing history %s, will start from scratch", filename)
+
+    def record(self, action, durations):
+        """
+        Add the durations of a feature which has been completely processed.
+        action (str): name of the action
+        durations (dict str -> float): phase -> duration (s)
+        """
+        atimes = self._times.setdefault(action, {})
+        for phase, dur in durations.items():
+            ptimes = atimes.setdefault(phase, [])
+            ptimes.append(dur)
+            del ptimes[:-self._history]
+        self._save()
+
+    def _save(self):
+        if not self._filename:
+            return
+        try:
+            os.makedirs(os.path.dirname(self._filename), exist_ok=True)
+            # Write to a temporary file first, so that the history is never lost
+            tmpfn = self._filename + ".tmp"
+            with open(tmpfn, "w") as f:
+                json.dump(self._times, f)
+            os.replace(tmpfn, self._filename)
+        except Exception:
+            logging.exception("Failed to save timing history to %s", self._filename)
+
+    def set_prior(self, action, phase, duration):
+        """
+        Set the duration expected for the phase of the action, used as long as
+        there is no history (eg, estimated from the milling recipe).
+        action (str): name of the action
+        phase (str): one of PHASES
+        duration (float or None): expected duration (s), or None to use the default
+        """
+        if duration is None:
+            self._priors.pop((action, phase), None)
+        else:
+            self._priors[(action, phase)] = duration
+
+    def history(self, action, phase):
+        """
+        return (list of float): the previous durations of the phase for the action (s)
+        """
+        return list(self._times.get(action, {}).get(phase, []))
+
+    def phase_time(self, action, phase):
+        """
+        return (float): the expected duration of the phase for the action (s)
+        """
+        ptimes = self._times.get(action, {}).get(phase)
+        if not ptimes:
+            return self._priors.get((action, phase), DEFAULT_PHASE_TIME[phase])
+        # Median, as a cancelled or troubled feature shouldn't count much
+        return float(np.median(ptimes))
+
+    def feature_time(self, action, phases):
+        """
+        action (str): name of the action
+        phases (list of str): the phases run for each feature
+        return (float): the expected time to process one feature (s)
+        """
+        return sum(self.phase_time(action, p) for p in phases)
+
+    def time_left(self, action, phases, nb_left, timer=None):
+        """
+        Estimate the time needed to process the remaining features.
+        action (str): name of the action
+        phases (list of str): the phases run for each feature
+        nb_left (int): number of features left, including the current one
+        timer (FeatureTimer or None): timer of the current feature. The phases
+          already done are not counted.
+        return (float): the expected time left (s)
+        """
+        if nb_left <= 0:
+            return 0
+        done = timer.durations if timer else {}
+        current = sum(self.phase_time(action, p) for p in phases if p not in done)
+        return current + (nb_left - 1) * self.feature_time(action, phases)
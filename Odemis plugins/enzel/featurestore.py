@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Feature store: loads the features from several files (merging the duplicates),
+and records each change of their status or position in a journal, so that
+they can be reloaded as they were, even after a crash.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+from collections import OrderedDict
+import json
+import logging
+import math
+import os
+import threading
+
+from odemis.acq.feature import CryoFeature
+
+from enzel.journal import RunJournal, read_records, rewrite_journal
+
+DEFAULT_FILE = os.path.join(os.path.expanduser("~"), ".config", "odemis", "enzel_features.jsonl")
+# Features closer than this (in x/y) are considered the same feature
+DUPLICATE_DIST = 10e-6  # m
+# The journal is compacted when it has that many more records than features
+COMPACT_RATIO = 4
+
+
+class SpatialIndex(object):
+    """
+    Finds the items near a position in constant time, by keeping them in a
+    grid of square cells.
+    """
+
+    def __init__(self, cell_size=DUPLICATE_DIST):
+        """
+        cell_size (float > 0): size of a cell (m), ideally the search radius
+        """
+        self._cell_size = cell_size
+        self._cells = {}  # (int, int) -> list of (item, x, y)
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self._cell_size)), int(math.floor(y / self._cell_size))
+
+    def add(self, item, x, y):
+        self._cells.setdefault(self._cell(x, y), []).append((item, x, y))
+
+    def find(self, x, y, radius):
+        """
+        return (list of items): the items within radius of x, y, the closest first
+        """
+        cx, cy = self._cell(x, y)
+        n = int(math.ceil(radius / self._cell_size))
+        found = []
+        for i in range(cx - n, cx + n + 1):
+            for j in range(cy - n, cy + n + 1):
+                for item, ix, iy in self._cells.get((i, j), ()):
+                    d = math.hypot(ix - x, iy - y)
+                    if d <= radius:
+                        found.append((d, item))
+        found.sort(key=lambda di: di[0])
+        return [item for d, item in found]
+
+
+def read_feature_file(filename):
+    """
+    Read the features of a file in the Odemis format ({"feature_list": [...]}).
+    filename (str): the JSON file
+    return (list of CryoFeature): the features
+    """
+    with open(filename) as f:
+        content = json.load(f)
+    features = []
+    for fd in content["feature_list"]:
+        fe = CryoFeature(fd["name"], *fd["pos"])
+        fe.status.value = fd["status"]
+        features.append(fe)
+    return features
+
+
+def merge_features(existing, new, dist=DUPLICATE_DIST):
+    """
+    Add the new features which are not already present.
+    existing (list of CryoFeature): the features already loaded (not modified)
+    new (list of CryoFeature): the features to add
+    dist (float): features closer than this (in x/y) are duplicates
+    return:
+        merged (list of CryoFeature): the existing and the new features
+        duplicates (list of (CryoFeature, CryoFeature)): the new features not
+          added, with the feature they duplicate
+    """
+    index = SpatialIndex(dist)
+    merged = list(existing)
+    names = set()
+    for fe in merged:
+        index.add(fe, fe.pos.value[0], fe.pos.value[1])
+        names.add(fe.name.value)
+    duplicates = []
+    for fe in new:
+        x, y = fe.pos.value[:2]
+        near = index.find(x, y, dist)
+        if near:
+            duplicates.append((fe, near[0]))
+            continue
+        # Features are identified by their name, so it must be unique
+        name = fe.name.value
+        i = 2
+        while fe.name.value in names:
+            fe.name.value = "%s-%d" % (name, i)
+            i += 1
+        index.add(fe, x, y)
+        names.add(fe.name.value)
+        merged.append(fe)
+    return merged, duplicates
+
+
+def replay_journal(path):
+    """
+    Recreate the features, as they were after the last record of the journal.
+    path (str): the journal file
+    return:
+        features (list of CryoFeature): the features
+        nrec (int): number of records replayed
+    """
+    state = OrderedDict()  # name -> dict (pos, status)
+    nrec = 0
+    for rec in read_records(path):
+        nrec += 1
+        event = rec["event"]
+        try:
+            if event == "add":
+                state[rec["name"]] = {"pos": rec["pos"], "status": rec["status"]}
+            elif event == "remove":
+                del state[rec["name"]]
+            elif event == "rename":
+                state = OrderedDict((rec["new"] if n == rec["name"] else n, v) for n, v in state.items())
+            elif event in ("pos", "status"):
+                state[rec["name"]][event] = rec[event]
+        except KeyError:
+            logging.warning("Skipping record %s of unknown feature", rec)
+    features = []
+    for name, fd in state.items():
+        fe = CryoFeature(name, *fd["pos"])
+        fe.status.value = fd["status"]
+        features.append(fe)
+    logging.debug("Replayed %d records into %d features", nrec, len(features))
+    return features, nrec
+
+
+class FeatureStore(object):
+    """
+    Keeps the journal of a list of features up to date: each change of name,
+    status or position of a feature, and each feature added or removed from
+    the list, is appended to the journal as soon as it happens.
+    When all the features are removed, the recording stops, so that the
+    journal still contains the last features.
+    """
+
+    def __init__(self, features_va, path=DEFAULT_FILE):
+        """
+        features_va (ListVA of CryoFeature): the features to record (eg, main_data.features)
+        path (str): the journal file
+        """
+        self._features_va = features_va
+        self.path = path
+        self._journal = None
+        self._lock = threading.RLock()
+        # CryoFeature -> (name, listeners). The VAs only keep a weak reference
+        # to the listeners, so they are kept here.
+        self._watched = {}
+        features_va.subscribe(self._on_features)
+
+    def attach(self, features, reset=True):
+        """
+        Start recording the given features, which become the content of features_va.
+        features (list of CryoFeature): the features
+        reset (bool): if True, the journal is rewritten with only the current
+          features. If False, the records are appended to the existing journal
+          (which must correspond to the features).
+        """
+        with self._lock:
+            self._unwatch_all()
+            if self._journal is not None:
+                self._journal.close()
+            if reset:
+                rewrite_journal(self.path, [self._add_record(fe) for fe in features])
+            self._journal = RunJournal(self.path)
+            for fe in features:
+                self._watch(fe)
+            self._features_va.value = list(features)
+
+    def load(self):
+        """
+        Reload the features from the journal, and continue recording them.
+        return (list of CryoFeature): the features, also set in features_va
+        raise:
+            IOError: if there is no journal
+        """
+        features, nrec = replay_journal(self.path)
+        # Rewrite the journal, if replaying it is getting slow
+        reset = nrec > COMPACT_RATIO * max(len(features), 1)
+        self.attach(features, reset=reset)
+        return features
+
+    def detach(self):
+        """
+        Stop recording the features (until the next attach() or load()).
+        """
+        with self._lock:
+            self._unwatch_all()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def close(self):
+        self._features_va.unsubscribe(self._on_features)
+        self.detach()
+
+    @staticmethod
+    def _add_record(fe):
+        return {"event": "add", "name": fe.name.value, "pos": list(fe.pos.value),
+                "status": fe.status.value}
+
+    def _record(self, event, **kwargs):
+        if self._journal is None:
+            return
+        try:
+            self._journal.record(event, **kwargs)
+        except (IOError, OSError):
+            logging.exception("Failed to record feature change %s %s", event, kwargs)
+
+    def _watch(self, fe):
+        def on_name(name):
+            with self._lock:
+                old = self._watched[fe][0]
+                if name != old:
+                    self._watched[fe] = (name,) + self._watched[fe][1:]
+                    self._record("rename", name=old, new=name)
+
+        def on_status(status):
+            self._record("status", name=fe.name.value, status=status)
+
+        def on_pos(pos):
+            self._record("pos", name=fe.name.value, pos=list(pos))
+
+        self._watched[fe] = (fe.name.value, on_name, on_status, on_pos)
+        fe.name.subscribe(on_name)
+        fe.status.subscribe(on_status)
+        fe.pos.subscribe(on_pos)
+
+    def _unwatch(self, fe):
+        name, on_name, on_status, on_pos = self._watched.pop(fe)
+        fe.name.unsubscribe(on_name)
+        fe.status.unsubscribe(on_status)
+        fe.pos.unsubscribe(on_pos)
+
+    def _unwatch_all(self):
+        for fe in list(self._watched):
+            self._unwatch(fe)
+
+    def _on_features(self, features):
+        # Features added or removed, from the GUI or the plugins
+        with self._lock:
+            if self._journal is None:
+                return
+            if not features:
+                logging.debug("All features removed, stopping recording them")
+                self.detach()
+                return
+            current = set(features)
+            for fe in list(self._watched):
+                if fe not in current:
+                    self._record("remove", name=self._watched[fe][0])
+                    self._unwatch(fe)
+            for fe in features:
+                if fe not in self._watched:
+                    self._record(**self._add_record(fe))
+                    self._watch(fe)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Focus map: model of the difference between the focus confirmed on some
+features and the focus stored in them, used to predict the focus of the other
+features (eg, after the sample drifted or was re-cooled).
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+
+import numpy as np
+
+# Minimum number of points to fit a thin-plate spline (otherwise, a plane)
+TPS_MIN_POINTS = 6
+# Points closer than this are considered the same, and the newest replaces the oldest
+SAME_POINT_DIST = 10e-6  # m
+# The prediction is limited to the range of the measured offsets, plus this
+# margin, as the plane and the spline are unreliable far from the points
+OFFSET_MARGIN = 2e-6  # m
+# Unit of the coordinates for the spline, to keep the system well conditioned
+_TPS_UNIT = 1e-3  # m
+
+
+def _tps_kernel(r):
+    """
+    Thin-plate spline radial basis function: r² log(r)
+    r (ndarray): distances
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = r ** 2 * np.log(r)
+    k[r == 0] = 0
+    return k
+
+
+class FocusMap(object):
+    """
+    Fits the focus offset (confirmed z - stored z) over the sample:
+    * no point: no offset
+    * 1 or 2 points (or all on a line): the average offset
+    * 3 to TPS_MIN_POINTS - 1 points: a plane, updated incrementally
+    * TPS_MIN_POINTS or more: a (smoothed) thin-plate spline, on top of the plane
+    The offset predicted is clamped to the range of the measured offsets (plus
+    a margin), so that it doesn't diverge away from the points.
+    """
+
+    def __init__(self, smoothing=1e-3, tps_min_points=TPS_MIN_POINTS, margin=OFFSET_MARGIN):
+        """
+        smoothing (float >= 0): regularization of the spline. 0 passes exactly
+          through all the points.
+        tps_min_points (int): minimum number of points to use a spline
+        margin (float >= 0): how much the offset predicted can be outside of the
+          range of the measured offsets (m)
+        """
+        self.smoothing = smoothing
+        self.tps_min_points = tps_min_points
+        self.margin = margin
+        self._points = []  # list of (float, float, float): x, y, dz (m)
+        # Normal equations of the plane dz = a + b x + c y
+        self._ata = np.zeros((3, 3))
+        self._atb = np.zeros(3)
+        self._tps = None  # (ndarray, ndarray, ndarray): centres, weights, plane coefs
+
+    def __len__(self):
+        return len(self._points)
+
+    def clear(self):
+        self._points = []
+        self._ata[:] = 0
+        self._atb[:] = 0
+        self._tps = None
+
+    def _accumulate(self, x, y, dz, sign=1):
+        row = np.array([1, x, y])
+        self._ata += sign * np.outer(row, row)
+        self._atb += sign * row * dz
+
+    def add(self, x, y, dz):
+        """
+        Add a point where the focus has been confirmed.
+        x, y (float): position of the point (m)
+        dz (float): confirmed z - stored z (m)
+        """
+        for i, (px, py, pdz) in enumerate(self._points):
+            if np.hypot(px - x, py - y) < SAME_POINT_DIST:
+                # Confirmed again: only keep the newest value
+                self._accumulate(px, py, pdz, -1)
+                del self._points[i]
+                break
+        self._points.append((x, y, dz))
+        self._accumulate(x, y, dz)
+        self._tps = None  # Will be recomputed when needed
+        logging.debug("Focus map: %d points, new offset %g m at %g, %g", len(self._points), dz, x, y)
+
+    def _plane(self):
+        """
+        return (ndarray of 3 floats or None): a, b, c, or None if the points
+          are not enough to define a plane
+        """
+        if len(self._points) < 3:
+            return None
+        # Scale the x, y columns, as the matrix has entries of very different magnitude
+        s = np.array([1, _TPS_UNIT, _TPS_UNIT])
+        ata = self._ata / np.outer(s, s)
+        if np.linalg.cond(ata) > 1e8:  # All the points on a line
+            return None
+        return np.linalg.solve(ata, self._atb / s) / s
+
+    def _fit_tps(self):
+        pts = np.array(self._points)
+        centres = pts[:, :2] / _TPS_UNIT
+        n = len(pts)
+        k = _tps_kernel(np.hypot(*(centres[:, np.newaxis, :] - centres[np.newaxis, :, :]).transpose(2, 0, 1)))
+        p = np.hstack([np.ones((n, 1)), centres])
+        a = np.zeros((n + 3, n + 3))
+        a[:n, :n] = k + self.smoothing * np.eye(n)
+        a[:n, n:] = p
+        a[n:, :n] = p.T
+        b = np.concatenate([pts[:, 2], np.zeros(3)])
+        sol = np.linalg.lstsq(a, b, rcond=None)[0]
+        self._tps = centres, sol[:n], sol[n:]
+
+    def predict(self, x, y):
+        """
+        Predict the focus offset at the given positions.
+        x, y (float or ndarray): position (m)
+        return (float or ndarray): z - stored z (m)
+        """
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        n = len(self._points)
+        if n == 0:
+            return np.zeros(np.broadcast(x, y).shape)[()]
+        if n >= self.tps_min_points:
+            if self._tps is None:
+                self._fit_tps()
+            centres, w, coefs = self._tps
+            xs, ys = x / _TPS_UNIT, y / _TPS_UNIT
+            r = np.hypot(xs[..., np.newaxis] - centres[:, 0], ys[..., np.newaxis] - centres[:, 1])
+            dz = _tps_kernel(r) @ w + coefs[0] + coefs[1] * xs + coefs[2] * ys
+        else:
+            plane = self._plane()
+            if plane is None:
+                return np.full(np.broadcast(x, y).shape, self._atb[0] / self._ata[0, 0])[()]
+            dz = plane[0] + plane[1] * x + plane[2] * y
+        dzs = [p[2] for p in self._points]
+        return np.clip(dz, min(dzs) - self.margin, max(dzs) + self.margin)[()]
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Run journal: records on disk each step done during a run over the features, so
+that an interrupted run (cancelled, or Odemis crashed) can be resumed from the
+first step not done.
+
+The journal is a JSON-lines file, only appended. Each record is written with a
+single write() on a file opened in append mode, and synced to disk before
+continuing, so that after a crash the file contains all the steps reported
+done, and at worse a truncated last line, which is ignored.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".config", "odemis", "enzel_journal")
+# Number of journals kept in the folder, the older ones are deleted
+MAX_JOURNALS = 50
+
+# Result of a run, in the "end" record
+RESULT_DONE = "done"
+RESULT_CANCELLED = "cancelled"
+RESULT_FAILED = "failed"
+
+
+def _sync_dir(dirname):
+    """
+    Make sure a new file in the folder is kept after a crash.
+    """
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        return  # Not supported (eg, on Windows)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class RunJournal(object):
+    """
+    Journal of a run, to which the steps done are appended.
+    """
+
+    def __init__(self, path):
+        """
+        Open an existing journal, to append records.
+        path (str): the journal file
+        """
+        self.path = path
+        self._lock = threading.Lock()  # one record at a time
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    @classmethod
+    def create(cls, kind, features, folder=DEFAULT_DIR, **info):
+        """
+        Start the journal of a new run.
+        kind (str): the type of run (eg, "ImgAcq")
+        features (list of str): names of the features, in the order processed
+        folder (str): where the journals are stored
+        info: any other information needed to resume the run
+        return (RunJournal): the new journal
+        """
+        os.makedirs(folder, exist_ok=True)
+        _prune(folder, MAX_JOURNALS - 1)
+        basename = time.strftime("%Y%m%d-%H%M%S", time.localtime())
+        path = os.path.join(folder, "%s %s.jsonl" % (basename, kind))
+        n = 1
+        while os.path.exists(path):  # Several runs within a second
+            n += 1
+            path = os.path.join(folder, "%s %s-%d.jsonl" % (basename, kind, n))
+        journal = cls(path)
+        journal.record("start", kind=kind, features=list(features), **info)
+        _sync_dir(folder)
+        return journal
+
+    def record(self, event, **kwargs):
+        """
+        Append a record, and only return once it's on disk.
+        event (str): type of record
+        kwargs: content of the record (must be JSON serializable)
+        """
+        rec = {"event": event, "time": time.time()}
+        rec.update(kwargs)
+        line = (json.dumps(rec) + "\n").encode("utf-8")
+        with self._lock:
+            os.write(self._fd, line)
+            os.fsync(self._fd)
+
+    def step_done(self, feature, step):
+        """
+        Record that a step of a feature is done (and will not need to be done again).
+        feature (str): name of the feature
+        step (str): name of the step
+        """
+        self.record("step", feature=feature, step=step)
+
+    def finish(self, result):
+        """
+        Record the end of the run, and close the journal.
+        result (RESULT_*): how the run ended. Only the runs which are not
+          RESULT_DONE can be resumed.
+        """
+        self.record("end", result=result)
+        self.close()
+
+    def close(self):
+        """
+        Can be called multiple times.
+        """
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+class RunState(object):
+    """
+    What a run has done, as read from its journal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.kind = None
+        self.features = []  # names of the features, in the order processed
+        self.info = {}  # the other information of the start record
+        self.result = None  # None if the run never ended
+        self.resumed = 0  # number of times the run was resumed
+        self._done = set()  # (str, str): feature, step
+
+    def is_done(self, feature, step):
+        return (feature, step) in self._done
+
+    def features_left(self, steps):
+        """
+        steps (list of str): all the steps of a feature
+        return (list of str): the features with some steps not done
+        """
+        return [f for f in self.features
+                if not all(self.is_done(f, s) for s in steps)]
+
+    @property
+    def resumable(self):
+        return self.kind is not None and self.result != RESULT_DONE
+
+
+def rewrite_journal(path, records):
+    """
+    Replace the content of a journal, atomically: after a crash, the file
+    contains either all the old records or all the new ones.
+    path (str): the journal file
+    records (iterable of dict): the new records, each one with at least "event"
+    """
+    dirname = os.path.dirname(path)
+    os.makedirs(dirname, exist_ok=True)
+    tmppath = path + ".tmp"
+    with open(tmppath, "wb") as f:
+        for rec in records:
+            f.write((json.dumps(rec) + "\n").encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmppath, path)
+    _sync_dir(dirname)
+
+
+def read_records(path):
+    """
+    Read all the records of a journal file.
+    path (str): the journal file
+    yield (dict): each valid record, in the order they were written
+    """
+    with open(path, "rb") as f:
+        for i, line in enumerate(f):
+            try:
+                rec = json.loads(line.decode("utf-8"))
+                rec["event"]
+            except (ValueError, KeyError, TypeError):
+                # Normally only the last line, if it was being written during a crash
+                logging.warning("Skipping invalid record %d of journal %s", i + 1, path)
+                continue
+            yield rec
+
+
+def read_journal(path):
+    """
+    path (str): the journal file
+    return (RunState): the state of the run
+    """
+    state = RunState(path)
+    for rec in read_records(path):
+        event = rec["event"]
+        if event == "start":
+            state.kind = rec["kind"]
+            state.features = rec["features"]
+            state.info = {k: v for k, v in rec.items()
+                          if k not in ("event", "time", "kind", "features")}
+        elif event == "step":
+            state._done.add((rec["feature"], rec["step"]))
+        elif event == "resume":
+            state.resumed += 1
+            state.result = None
+        elif event == "end":
+            state.result = rec["result"]
+    return state
+
+
+def _list_journals(folder):
+    """
+    return (list of str): the journal files, from the oldest to the newest
+    """
+    return sorted(glob.glob(os.path.join(folder, "*.jsonl")), key=os.path.getmtime)
+
+
+def find_resumable(folder=DEFAULT_DIR):
+    """
+    Look for the last run, if it was not completed.
+    return (RunState or None): the state of the last run, or None if it was
+      completed (or there is no run)
+    """
+    journals = _list_journals(folder)
+    if not journals:
+        return None
+    try:
+        state = read_journal(journals[-1])
+    except IOError:
+        logging.exception("Failed to read journal %s", journals[-1])
+        return None
+    return state if state.resumable else None
+
+
+def resume_journal(state):
+    """
+    Reopen the journal of a run, to continue it.
+    state (RunState): the run to continue
+    return (RunJournal)
+    """
+    journal = RunJournal(state.path)
+    journal.record("resume")
+    return journal
+
+
+def _prune(folder, keep):
+    for path in _list_journals(folder)[:-keep or None]:
+        try:
+            os.remove(path)
+        except OSError:
+            logging.warning("Failed to delete old journal %s", path)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Helpers to defer the heavy imports and the hardware lookups of the plugins.
+Odemis loads all the plugins when the GUI starts, so whatever a plugin does
+when it's loaded delays the start of the GUI, even if the plugin is never used.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import importlib
+import logging
+import threading
+import time
+
+_import_lock = threading.Lock()
+
+
+class LazyImport(object):
+    """
+    Stands for a module (or an object of a module), which is only imported
+    the first time it's used.
+    """
+
+    def __init__(self, module, name=None):
+        """
+        module (str): full name of the module
+        name (str or None): name of the object in the module, or None for the module itself
+        """
+        self._lazy_module = module
+        self._lazy_name = name
+        self._lazy_target = None
+
+    def _lazy_load(self):
+        if self._lazy_target is None:
+            with _import_lock:
+                if self._lazy_target is None:
+                    tstart = time.time()
+                    target = importlib.import_module(self._lazy_module)
+                    if self._lazy_name is not None:
+                        target = getattr(target, self._lazy_name)
+                    logging.debug("Imported %s in %g s", self._lazy_module, time.time() - tstart)
+                    self._lazy_target = target
+        return self._lazy_target
+
+    def __getattr__(self, attr):
+        # Only called for the attributes not found, so not for the ones of LazyImport
+        return getattr(self._lazy_load(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._lazy_load()(*args, **kwargs)
+
+    def __repr__(self):
+        name = self._lazy_module
+        if self._lazy_name is not None:
+            name += "." + self._lazy_name
+        return "<lazy %s%s>" % (name, "" if self._lazy_target is None else " (loaded)")
+
+
+def lazy_import(module, name=None):
+    """
+    Import a module (or an object of a module) only when it's first used.
+    For example, cv2 = lazy_import("cv2"), or
+      TimeLapse = lazy_import("enzel.timelapse", "TimeLapse").
+    module (str): full name of the module
+    name (str or None): name of the object in the module
+    return (LazyImport): forwards the attribute access and calls to the module (or object)
+    """
+    return LazyImport(module, name)
+
+
+class lazy_property(object):
+    """
+    Decorator for a property computed only when it's first read, and then
+    stored in the object (functools.cached_property, which is not available
+    on all the Python versions supported by Odemis).
+    Assigning the attribute replaces the value.
+    """
+
+    def __init__(self, func):
+        self._func = func
+        self._name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner, name):
+        self._name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        value = self._func(obj)
+        obj.__dict__[self._name] = value
+        return value
+
+
+def lazy_component(name=None, role=None):
+    """
+    A property which looks up the component (by name and/or role) the first
+    time it's read, instead of when the plugin is loaded.
+    raise (on access):
+        LookupError: if the component doesn't exist
+    """
+    def get_component(self):
+        from odemis import model
+        return model.getComponent(name=name, role=role)
+    return lazy_property(get_component)
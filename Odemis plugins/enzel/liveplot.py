@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Live plot of the intensity measured by the monitor. It is redrawn on its own
+timer, using blitting, so its cost doesn't depend on the acquisition rate, nor
+on the length of the session.
+Can also be run as a script, to monitor the CCD of the running Odemis back-end.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import argparse
+import logging
+import sys
+
+import matplotlib.pyplot as plt
+
+
+class LivePlot(object):
+    """
+    Plots the mean and max intensity of one ROI, over the last frames.
+    The x axis is the number of frames ago, so that it never changes, and only
+    the lines have to be redrawn.
+    """
+
+    def __init__(self, stats, window=100, max_points=500, interval=0.2, roi=0, ax=None):
+        """
+        stats (RingBuffer): the statistics of the monitor
+        window (int): number of frames displayed
+        max_points (int): maximum number of points drawn per line
+        interval (float): time between two redraws (s)
+        roi (int): index of the ROI to plot
+        ax (Axes or None): where to plot. If None, a new figure is created.
+        """
+        self._stats = stats
+        self._window = window
+        self._max_points = max_points
+        self._roi = roi
+        if ax is None:
+            fig, ax = plt.subplots(dpi=150)
+        self._ax = ax
+        self._canvas = ax.figure.canvas
+        ax.set_xlim(-window, 0)
+        ax.set_xlabel("Frames ago")
+        ax.set_ylabel("Intensity")
+        self._line_mean, = ax.plot([], [], ".", label="mean", animated=True)
+        self._line_max, = ax.plot([], [], ".", label="max", animated=True)
+        ax.legend(loc="upper left")
+        self._background = None
+        self._canvas.mpl_connect("draw_event", self._on_draw)
+        self._timer = self._canvas.new_timer(interval=int(interval * 1000))
+        self._timer.add_callback(self._update)
+
+    def start(self):
+        self._canvas.draw()
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def _on_draw(self, event):
+        # Everything but the lines, to be restored before drawing the lines
+        self._background = self._canvas.copy_from_bbox(self._ax.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        self._ax.draw_artist(self._line_mean)
+        self._ax.draw_artist(self._line_max)
+
+    def _get_ylim(self, ymin, ymax):
+        """
+        return (float, float): the y range to show the data, with a margin.
+          The margin is never null, even if the data is flat.
+        """
+        margin = max((ymax - ymin) * 0.2, abs(ymax) * 0.01, 1e-9)
+        return ymin - margin, ymax + margin
+
+    def _needs_rescale(self, ymin, ymax):
+        """
+        return (bool): True if the data doesn't fit well in the y range anymore
+        """
+        low, high = self._ax.get_ylim()
+        if ymin < low or ymax > high:
+            return True
+        # Avoid rescaling on every small change, only if the data uses less
+        # than a third of the range, and the range would really shrink (which
+        # is not the case with flat data, as the margin has a minimum).
+        nlow, nhigh = self._get_ylim(ymin, ymax)
+        return (ymax - ymin) < (high - low) / 3 and (nhigh - nlow) < (high - low) / 2
+
+    def _update(self):
+        try:
+            st = self._stats.latest(self._window, self._max_points)
+            if len(st) == 0:
+                return
+            x = st["index"] - st["index"][-1]
+            ymean, ymax = st["mean"][:, self._roi], st["max"][:, self._roi]
+            self._line_mean.set_data(x, ymean)
+            self._line_max.set_data(x, ymax)
+
+            low, high = float(ymean.min()), float(ymax.max())
+            if self._needs_rescale(low, high):
+                self._ax.set_ylim(*self._get_ylim(low, high))
+                self._canvas.draw()  # Full redraw, which also updates the background
+            elif self._background is not None:
+                self._canvas.restore_region(self._background)
+                self._draw_lines()
+                self._canvas.blit(self._ax.bbox)
+                self._canvas.flush_events()
+        except Exception:
+            logging.exception("Failed to update the plot")
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Live plot of the fluorescence intensity")
+    parser.add_argument("--role", default="ccd", help="Role of the camera")
+    parser.add_argument("--hw", type=int, default=3, help="Half size of the box (px)")
+    parser.add_argument("--window", type=int, default=100, help="Number of frames displayed")
+    parser.add_argument("--spill", help="File where to save the statistics of all the frames")
+    options = parser.parse_args(args[1:])
+
+    from odemis import model
+    from enzel.monitor import IntensityMonitor
+
+    ccd = model.getComponent(role=options.role)
+    monitor = IntensityMonitor(ccd.data, hw=options.hw, spill_file=options.spill)
+    liveplot = LivePlot(monitor.stats, window=options.window)
+    monitor.start()
+    liveplot.start()
+    try:
+        plt.show()
+    finally:
+        liveplot.stop()
+        monitor.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    ret = main(sys.argv)
+    exit(ret)
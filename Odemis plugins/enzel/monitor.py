@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Fluorescence intensity monitor (used by IFM-Monitor): the statistics of every
+camera frame are kept in a fixed-size ring buffer.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+from odemis import model
+
+from enzel.roistats import DEFAULT_HALF_WIDTH, MultiROIStats
+
+
+def stats_dtype(nrois):
+    """
+    nrois (int): number of ROIs
+    return (numpy.dtype): the statistics stored for each frame
+    """
+    return np.dtype([
+        ("index", np.int64),  # frame number, since the start
+        ("time", np.float64),  # acquisition time (s)
+        ("mean", np.float64, (nrois,)),  # mean intensity in each ROI
+        ("max", np.float64, (nrois,)),  # max intensity in each ROI
+        ("drift", np.float64, (2,)),  # drift (y, x) of the image (px)
+    ])
+
+
+class RingBuffer(object):
+    """
+    Fixed-size buffer of records, which overwrites the oldest ones when full.
+    Optionally, all the records are also written to a file, in blocks, so
+    nothing is lost. The file can be read with numpy.fromfile(fn, dtype).
+    """
+
+    def __init__(self, capacity, dtype, spill_file=None, block_size=None):
+        """
+        capacity (int): maximum number of records kept in memory
+        dtype (numpy.dtype): type of a record
+        spill_file (str or None): path of the file where to write all the records
+        block_size (int or None): number of records written at once to the file.
+          Must be a divisor of the capacity. Default is capacity / 8.
+        """
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self._data = np.zeros(capacity, dtype=self.dtype)  # preallocated
+        self._count = 0  # total number of records ever appended
+        self._lock = threading.Lock()
+        self._spill = None
+        if spill_file:
+            self._block_size = block_size or max(1, capacity // 8)
+            if capacity % self._block_size:
+                raise ValueError("block_size %d is not a divisor of capacity %d" % (self._block_size, capacity))
+            self._spill = open(spill_file, "ab")
+            self._spilled = 0  # number of records written to the file
+
+    def __len__(self):
+        """
+        return (int): number of records currently in the buffer
+        """
+        return min(self._count, self.capacity)
+
+    @property
+    def count(self):
+        """
+        (int): total number of records appended
+        """
+        return self._count
+
+    def append(self, *record):
+        """
+        Add a record. O(1).
+        record: the values of each field
+        """
+        with self._lock:
+            self._data[self._count % self.capacity] = record
+            self._count += 1
+            if self._spill and self._count - self._spilled >= self._block_size:
+                self._write_spill()
+
+    def _write_spill(self):
+        # Always a full block, which is contiguous in the buffer
+        start = self._spilled % self.capacity
+        self._data[start:start + self._block_size].tofile(self._spill)
+        self._spilled += self._block_size
+
+    def latest(self, n=None, max_points=None):
+        """
+        n (int or None): maximum number of records. If None, all the records in
+          the buffer are returned.
+        max_points (int or None): if given, and there are more records, only
+          every few records are returned (always including the last one).
+        return (ndarray of dtype): copy of the last n records, oldest first
+        """
+        with self._lock:
+            n = len(self) if n is None else min(n, len(self))
+            end = self._count % self.capacity
+            idx = np.arange(end - n, end)
+            if max_points and n > max_points:
+                step = -(-n // max_points)  # ceil
+                idx = idx[::-1][::step][::-1]
+            return self._data[idx % self.capacity]
+
+    def close(self):
+        """
+        Write the records not yet written to the spill file, and close it.
+        """
+        with self._lock:
+            if self._spill:
+                left = self._count - self._spilled
+                start = self._spilled % self.capacity
+                idx = np.arange(start, start + left) % self.capacity
+                self._data[idx].tofile(self._spill)
+                self._spilled += left
+                self._spill.close()
+                self._spill = None
+
+
+class IntensityMonitor(object):
+    """
+    Computes the intensity statistics of every frame produced by a camera,
+    by subscribing to its dataflow. The sampling rate is therefore the frame
+    rate of the camera, independently of how often the values are displayed.
+    """
+
+    def __init__(self, dataflow, capacity=100000, hw=DEFAULT_HALF_WIDTH, spill_file=None,
+                 rois=None, track_drift=False):
+        """
+        dataflow (DataFlow): the dataflow of the camera (eg, ccd.data)
+        capacity (int): number of frames for which the statistics are kept in memory
+        hw (int): half size of the ROIs (px)
+        spill_file (str or None): if given, the statistics of all the frames are
+          also written to this file
+        rois (None or list of (int, int)): centre (y, x) of each ROI (px). If
+          None, a single ROI at the centre of the image is used.
+        track_drift (bool): if True, the ROIs follow the drift of the image
+        """
+        self._dataflow = dataflow
+        self._roi_stats = MultiROIStats(rois, hw, track_drift)
+        self.stats = RingBuffer(capacity, stats_dtype(self._roi_stats.nrois), spill_file)
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """
+        listener (callable): called with (frame (DataArray), stats (record))
+          for every new frame, from the acquisition thread. It must be fast.
+        """
+        self._listeners.append(listener)
+
+    def add_recorder(self, recorder, name="ccd"):
+        """
+        Record every frame, along with its statistics. The acquisition is never
+        slowed down: if the disk cannot keep up, frames are dropped (and counted).
+        recorder (FrameRecorder): where to record the frames
+        name (str): name of the series in the recorder
+        """
+        def record(frame, stats):
+            recorder.add(name, frame, stats["time"],
+                         {"mean": stats["mean"], "max": stats["max"], "drift": stats["drift"]},
+                         block=False)
+        self.add_listener(record)
+
+    def start(self):
+        # Note: the dataflow only keeps a weak reference to the listener
+        self._dataflow.subscribe(self._on_data)
+
+    def stop(self):
+        self._dataflow.unsubscribe(self._on_data)
+        self.stats.close()
+        logging.info("Intensity monitor stopped after %d frames", self.stats.count)
+
+    def _on_data(self, dataflow, data):
+        try:
+            tstamp = data.metadata.get(model.MD_ACQ_DATE, time.time())
+            means, maxs = self._roi_stats.compute(data)
+            self.stats.append(self.stats.count, tstamp, means, maxs, self._roi_stats.drift)
+            record = self.stats.latest(1)[0]
+            for l in self._listeners:
+                l(data, record)
+        except Exception:
+            logging.exception("Failed to process frame")
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Planning of the stage moves: the axes which can safely move together are moved
+in a single move, and z is moved first or last, depending on whether the stage
+goes away or towards the chamber shield.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import numpy as np
+
+# Axes which can move together, in the order they are moved
+DEFAULT_GROUPS = (("x", "y"), ("rx", "rz"))
+
+# Axis which moves towards the chamber shield (when increasing), and so which
+# must be moved last when going up, and first when going down.
+SHIELD_AXIS = "z"
+
+# Used when the actuator doesn't report its speed
+DEFAULT_AXIS_SPEED = {"x": 1e-3, "y": 1e-3, "z": 1e-4, "rx": 0.01, "rz": 0.01}  # m/s or rad/s
+
+# Axes closer than this to their target are not moved
+POS_ATOL = 1e-7  # m
+ROT_ATOL = 1e-5  # rad
+
+
+def _is_rotation(ax):
+    return ax.startswith("r")
+
+
+def plan_moves(current, target, groups=DEFAULT_GROUPS, shield_axis=SHIELD_AXIS):
+    """
+    Split a move into moves of the axes which can move together, ordered to
+    avoid hitting the shield.
+    current (dict str -> float): current position of each axis
+    target (dict str -> float): position to reach of each axis
+    groups (tuple of tuple of str): axes which can move together, in order
+    shield_axis (str or None): axis which goes towards the shield when increasing
+    return (list of dict str -> float): the positions to pass to moveAbs(),
+      one after another. Axes already at their target are not moved.
+    """
+    left = {}
+    for ax, pos in target.items():
+        atol = ROT_ATOL if _is_rotation(ax) else POS_ATOL
+        if ax not in current or abs(pos - current[ax]) > atol:
+            left[ax] = pos
+
+    first, last = [], []
+    if shield_axis in left:
+        move = {shield_axis: left.pop(shield_axis)}
+        if move[shield_axis] < current.get(shield_axis, -np.inf):
+            first.append(move)  # Going away from the shield: do it before moving around
+        else:
+            last.append(move)
+
+    plan = first
+    for g in groups:
+        move = {ax: left.pop(ax) for ax in g if ax in left}
+        if move:
+            plan.append(move)
+    if left:  # Any other axis
+        plan.append(left)
+    return plan + last
+
+
+def get_axis_speeds(actuator):
+    """
+    return (dict str -> float): speed of each axis of the actuator (m/s or rad/s)
+    """
+    try:
+        reported = actuator.speed.value
+    except AttributeError:
+        reported = {}
+    return {ax: reported.get(ax, DEFAULT_AXIS_SPEED.get(ax, 1e-4)) for ax in actuator.axes}
+
+
+def plan_time(current, plan, speeds):
+    """
+    Estimate how long it takes to run the moves, assuming the axes of each
+    move go simultaneously.
+    current (dict str -> float): current position of each axis. The axes
+      whose position is unknown are not counted in the first move of the axis.
+    plan (list of dict str -> float): the moves, as returned by plan_moves()
+    speeds (dict str -> float): speed of each axis
+    return (float): time (s)
+    """
+    pos = dict(current)
+    total = 0
+    for move in plan:
+        total += max([abs(p - pos[ax]) / speeds.get(ax, DEFAULT_AXIS_SPEED.get(ax, 1e-4))
+                      for ax, p in move.items() if ax in pos] or [0])
+        pos.update(move)
+    return total
+
+
+def describe_plan(plan):
+    """
+    return (str): user friendly description of the moves, eg "x & y, then z"
+    """
+    return ", then ".join(" & ".join(move) for move in plan) or "nothing to move"
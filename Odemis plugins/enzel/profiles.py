@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Stream profiles: the sets of optical streams, defined as data in JSON files.
+
+A profile file looks like:
+{
+    "name": "ENZEL",
+    "on_demand": true,
+    "streams": [
+        {"name": "Ex485Em525", "excitation": 485e-9, "emission": 525e-9,
+         "power": 10e-3, "exposure": 0.5, "binning": [2, 2], "tint": [55, 255, 0]},
+        ...
+    ]
+}
+The excitation and emission are wavelengths (m), and the closest light source
+and filter of the microscope are picked (with a warning if they don't cover the
+wavelength). The emission can also be "pass-through". The acquisition streams (by default, the ones with a name
+ending with "Acq") are only created when acquiring, if on_demand is true.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+from collections import OrderedDict, namedtuple
+import glob
+import json
+import logging
+import os
+
+from odemis.acq import stream as acqstream
+from odemis.util import conversion
+
+# The profiles shipped with the plugins, and the ones of the user
+PROFILE_DIRS = (
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "stream_profiles"),
+    os.path.join(os.path.expanduser("~"), ".config", "odemis", "enzel_profiles"),
+)
+DEFAULT_PROFILE = "ENZEL"
+
+PASS_THROUGH = "pass-through"
+
+StreamSpec = namedtuple("StreamSpec", ["name", "excitation", "emission", "power",
+                                       "exposure", "binning", "tint", "acquisition"])
+Profile = namedtuple("Profile", ["name", "streams", "on_demand"])
+
+# filename -> (mtime, Profile)
+_cache = {}
+# The profile last set up in the GUI, or None if the streams were set up by hand
+_current = None
+
+
+def parse_profile(content):
+    """
+    content (dict): the profile, as read from the JSON file
+    return (Profile): the profile
+    raise:
+        ValueError: if the profile is not valid
+    """
+    try:
+        name = content["name"]
+        specs = []
+        for sd in content["streams"]:
+            sname = sd["name"]
+            emission = sd["emission"]
+            if emission != PASS_THROUGH:
+                emission = float(emission)
+            specs.append(StreamSpec(sname, float(sd["excitation"]), emission,
+                                    float(sd["power"]), float(sd["exposure"]),
+                                    tuple(int(b) for b in sd.get("binning", (1, 1))),
+                                    tuple(int(c) for c in sd.get("tint", (255, 255, 255))),
+                                    bool(sd.get("acquisition", sname.endswith("Acq")))))
+    except (KeyError, TypeError) as ex:
+        raise ValueError("Invalid stream profile: %s" % (ex,))
+    names = [s.name for s in specs]
+    if len(set(names)) != len(names):
+        raise ValueError("Invalid stream profile %s: stream names are not unique" % (name,))
+    return Profile(name, tuple(specs), bool(content.get("on_demand", True)))
+
+
+def _read_profile(filename):
+    """
+    Read a profile file, only if it has changed since the last time.
+    return (Profile)
+    """
+    mtime = os.path.getmtime(filename)
+    try:
+        cmtime, profile = _cache[filename]
+        if cmtime == mtime:
+            return profile
+    except KeyError:
+        pass
+    with open(filename) as f:
+        profile = parse_profile(json.load(f))
+    _cache[filename] = (mtime, profile)
+    return profile
+
+
+def load_profiles(dirs=PROFILE_DIRS):
+    """
+    Read all the profiles. If several have the same name, the last one is used,
+      so the profiles of the user override the ones shipped.
+    dirs (list of str): the folders containing the profile files (*.json)
+    return (OrderedDict str -> Profile): name -> profile
+    """
+    profiles = OrderedDict()
+    for d in dirs:
+        for fn in sorted(glob.glob(os.path.join(d, "*.json"))):
+            try:
+                profile = _read_profile(fn)
+            except (IOError, ValueError) as ex:
+                logging.warning("Skipping stream profile %s: %s", fn, ex)
+                continue
+            profiles[profile.name] = profile
+    return profiles
+
+
+def set_current_profile(profile):
+    """
+    profile (Profile or None): the profile set up in the GUI
+    """
+    global _current
+    _current = profile
+
+
+def get_current_profile():
+    """
+    return (Profile or None): the profile set up in the GUI, if any
+    """
+    return _current
+
+
+def get_choices(main_data):
+    """
+    return:
+        ex_choices (list of tuple of 5 floats): the spectrum of each light source
+        em_choices (list of str or tuples): the band of each emission filter
+    """
+    ex_choices = list(main_data.light.spectra.value)
+    em_choices = [conversion.ensure_tuple(v)
+                  for v in main_data.light_filter.axes["band"].choices.values()]
+    return ex_choices, em_choices
+
+
+def _band_center(band):
+    """
+    return (float or None): the center wavelength of a band, or None if it's
+      not a wavelength range (eg, "pass-through")
+    """
+    if isinstance(band, str):
+        return None
+    if isinstance(band[0], tuple):  # multi-band: use the first one
+        band = band[0]
+    return sum(band) / len(band)
+
+
+def _in_band(band, wl):
+    """
+    return (bool): True if the wavelength is within (one of) the band(s)
+    """
+    if isinstance(band, str):
+        return False
+    bands = band if isinstance(band[0], tuple) else (band,)
+    return any(b[0] <= wl <= b[-1] for b in bands)
+
+
+def find_excitation(ex_choices, wl):
+    """
+    return (tuple of 5 floats): the spectrum with the center closest to wl
+    """
+    spec = min(ex_choices, key=lambda s: abs(s[2] - wl))
+    if not spec[0] <= wl <= spec[4]:
+        logging.warning("No light source emits at %g nm, using the one at %g nm instead",
+                        wl * 1e9, spec[2] * 1e9)
+    return spec
+
+
+def find_emission(em_choices, wl):
+    """
+    wl (float or PASS_THROUGH): the center of the emission wanted
+    return (str or tuple): the band closest to wl
+    raise:
+        LookupError: if no filter fits
+    """
+    if wl == PASS_THROUGH:
+        if PASS_THROUGH in em_choices:
+            return PASS_THROUGH
+        # Some filter wheels have a different name for the empty position
+        for band in em_choices:
+            if isinstance(band, str):
+                logging.warning("No %s emission filter, using %s instead", PASS_THROUGH, band)
+                return band
+        raise LookupError("No %s emission filter" % (PASS_THROUGH,))
+    bands = [b for b in em_choices if _band_center(b) is not None]
+    if not bands:
+        raise LookupError("No emission filter")
+    band = min(bands, key=lambda b: abs(_band_center(b) - wl))
+    if not _in_band(band, wl):
+        logging.warning("No emission filter passes %g nm, using the one at %g nm instead",
+                        wl * 1e9, _band_center(band) * 1e9)
+    return band
+
+
+def create_stream(main_data, spec, ex_choices, em_choices):
+    """
+    Create a FluoStream with the settings of the profile. It's not added
+    to the GUI.
+    spec (StreamSpec): the settings of the stream
+    ex_choices, em_choices: as returned by get_choices()
+    return (FluoStream): the new stream
+    """
+    s = acqstream.FluoStream(
+        spec.name,
+        main_data.ccd,
+        main_data.ccd.data,
+        main_data.light,
+        main_data.light_filter,
+        focuser=main_data.focus,
+        opm=main_data.opm,
+        detvas={"exposureTime", "binning"},
+    )
+    s.power.value = spec.power
+    s.excitation.value = find_excitation(ex_choices, spec.excitation)
+    s.emission.value = find_emission(em_choices, spec.emission)
+    s.det_vas["exposureTime"].value = spec.exposure
+    s.det_vas["binning"].value = spec.binning
+    s.tint.value = spec.tint
+    return s
+
+
+def create_acq_streams(main_data, profile, existing=(), streambar=None):
+    """
+    Create the acquisition streams of the profile, when they are created on demand.
+    profile (Profile or None): the profile
+    existing (list of Streams): the streams already present, which are not created again
+    streambar (StreamBarController or None): if given, the streams are added to
+      it, without playing them. Only the streams of the stream bar are
+      scheduled by the GUI, ie, acquire when should_update is set.
+    return (list of FluoStream): the new streams (might be empty)
+    """
+    if profile is None or not profile.on_demand:
+        return []
+    names = set(s.name.value for s in existing)
+    specs = [spec for spec in profile.streams if spec.acquisition and spec.name not in names]
+    if not specs:
+        return []
+    ex_choices, em_choices = get_choices(main_data)
+    streams = [create_stream(main_data, spec, ex_choices, em_choices) for spec in specs]
+    if streambar is not None:
+        for s in streams:
+            sc = streambar._add_stream(s, add_to_view=True, play=False)
+            sc.stream_panel.collapse(True)
+    logging.debug("Created the acquisition streams %s", ", ".join(s.name for s in specs))
+    return streams
+
+
+def teardown_streams(streams, streambar=None):
+    """
+    Stop the streams created on demand, so that they release the hardware.
+    streams (list of Streams): the streams to stop
+    streambar (StreamBarController or None): if given, the streams are also
+      removed from it
+    """
+    for s in streams:
+        s.should_update.value = False
+        s.is_active.value = False
+        if streambar is not None:
+            streambar.removeStreamPanel(s)
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Reads the milling patterns of each command of the iFast recipe
+(LamellaMillingCommands.xrml), and estimates how long each command takes.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+from collections import OrderedDict, namedtuple
+import logging
+import os
+import re
+import xml.etree.ElementTree as ET
+
+from enzel.commands import COMMANDS, DEFAULT_SCAN_ROTATION
+
+RECIPE_NAME = "LamellaMillingCommands.xrml"
+# The recipe copied from the microscope PC. The example next to the plugins is
+# not used, as it may differ from the recipe actually run by iFast, and the
+# milling would be stopped too early.
+RECIPE_PATH = os.path.join(os.path.expanduser("~"), ".config", "odemis", RECIPE_NAME)
+EXAMPLE_RECIPE_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                    "..", "..", RECIPE_NAME))
+
+# Volume milled per charge of the ion beam (m³/C), per patterning application.
+# The recipe only stores the sputter rate for the current set when it was
+# saved, which is often not the current of the FIB settings.
+SPUTTER_YIELD = {
+    "Si": 0.27e-9,  # 0.27 µm³/nC, Ga+ at 30 kV
+}
+DEFAULT_SPUTTER_YIELD = SPUTTER_YIELD["Si"]
+
+# Margin when waiting for a command estimated from the recipe, which is not as
+# reliable as the durations measured on the system
+TIMEOUT_FACTOR = 3
+TIMEOUT_MARGIN = 300  # s
+
+_XAML_NS = "{http://schemas.microsoft.com/winfx/2006/xaml}"
+
+_UNITS = {
+    "°": 1, "m": 1, "mm": 1e-3, "um": 1e-6, "µm": 1e-6, "nm": 1e-9,
+    "A": 1, "nA": 1e-9, "pA": 1e-12, "V": 1, "kV": 1e3, "s": 1,
+}
+
+# name (str): name of the activity in the recipe
+# shape (str): "Rectangle", "CleaningCrossSection", "Circle", "Spot"...
+# area (float or None): milled area (m²)
+# depth (float or None): milled depth (m)
+# current (float or None): ion beam current (A), if set by the branch
+# duration (float): estimated milling time (s)
+Pattern = namedtuple("Pattern", ["name", "shape", "area", "depth", "current", "duration"])
+# name (str or None): key of COMMANDS, or None if no command has this code
+# code (float): offset of the scan rotation (deg)
+# patterns (tuple of Patterns): the patterns milled, in order
+# duration (float): time until iFast has finished the branch (s)
+# ack_time (float): time until iFast acknowledges the command (s)
+CommandRecipe = namedtuple("CommandRecipe", ["name", "code", "patterns", "duration", "ack_time"])
+
+# filename -> (mtime, OrderedDict str -> CommandRecipe)
+_cache = {}
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _name(el):
+    return el.get(_XAML_NS + "Name") or el.get("Name") or ""
+
+
+def _enabled(el):
+    return el.get("Enabled", "True") != "False"
+
+
+def _raw_value(el, prop):
+    """
+    return (float or None): the RawValue of the property element (eg, "Depth"),
+      or None if the activity doesn't have it
+    """
+    for c in el:
+        if _local(c.tag).endswith("." + prop):
+            for v in c.iter():
+                if "RawValue" in v.attrib:
+                    return float(v.get("RawValue"))
+    return None
+
+
+def _expressions(el):
+    """
+    return (dict str -> str): property name -> expression
+    """
+    exprs = {}
+    for c in el:
+        if _local(c.tag).endswith(".Expressions"):
+            for e in c.iter():
+                if _local(e.tag) == "ActivityExpressionProperty":
+                    exprs[e.get("PropertyName")] = e.get("Expression")
+    return exprs
+
+
+def _parse_timespan(s):
+    """
+    s (str): duration as "hh:mm:ss(.fff)"
+    return (float): duration (s)
+    """
+    h, m, sec = s.split(":")
+    return int(h) * 3600 + int(m) * 60 + float(sec)
+
+
+def evaluate(expr, variables):
+    """
+    Evaluate a (simple) expression of the recipe, such as
+    "2*VariableContainer.MillingDepth" or "VariableContainer.DefScanRot + 0.001 °".
+    Only additions, subtractions and multiplications are supported.
+    expr (str): the expression
+    variables (dict str -> float): value of the variables of the VariableContainer
+    return (float): the value, in SI units (or degrees for angles)
+    raise:
+        ValueError: if the expression is not supported
+    """
+    total = 0
+    for sign, term in re.findall(r"([+-]?)\s*([^+-]+)", expr.strip()):
+        val = 1
+        for factor in term.split("*"):
+            factor = factor.strip()
+            if factor.startswith("VariableContainer."):
+                try:
+                    val *= variables[factor.split(".", 1)[1]]
+                except KeyError:
+                    raise ValueError("Unknown variable in %s" % (expr,))
+                continue
+            m = re.match(r"^([0-9.]+(?:[eE][+-]?\d+)?)\s*(\S*)$", factor)
+            if not m or m.group(2) not in _UNITS and m.group(2) != "":
+                raise ValueError("Unsupported expression %s" % (expr,))
+            val *= float(m.group(1)) * _UNITS.get(m.group(2), 1)
+        total += -val if sign == "-" else val
+    return total
+
+
+def _read_variables(root):
+    """
+    return (dict str -> float): name -> default value of the scalar variables
+      of the VariableContainer
+    """
+    variables = {}
+    for el in root.iter():
+        if _local(el.tag) != "CustomVariableActivity":
+            continue
+        for ui in el.iter():
+            if _local(ui.tag) != "UserInput":
+                continue
+            val = _raw_value(ui, "Value")
+            if val is not None:
+                variables[ui.get("Name")] = val
+        break
+    return variables
+
+
+def _pattern_duration(el, area, depth, current):
+    """
+    Estimate the milling time of a pattern.
+    return (float): duration (s)
+    """
+    if area and depth is not None and current:
+        app = el.get("PatterningApplicationName")
+        spy = SPUTTER_YIELD.get(app, DEFAULT_SPUTTER_YIELD)
+        return area * depth / (current * spy)
+    # No beam current known => rely on the time computed by xT when saving
+    tt = _raw_value(el, "TotalTime")
+    saved_depth = _raw_value(el, "Depth")
+    if tt is None:
+        return 0
+    if depth is not None and saved_depth:
+        tt *= depth / saved_depth
+    return tt
+
+
+def _parse_branch(branch, variables, poll_time):
+    """
+    Simulate the activities of one IfElse branch.
+    return (tuple of Patterns, float, float): the patterns, the time until
+      the branch is finished (s), and until the command is acknowledged (s)
+    """
+    patterns = []
+    pending = []  # Patterns waiting for a trigger
+    t = 0  # end of the activities run so far (s)
+    busy_until = 0  # end of the milling started so far (s)
+    ack_time = None
+    current = None
+    for act in branch:
+        kind = _local(act.tag)
+        if "." in kind or not _enabled(act):
+            continue
+        exprs = _expressions(act)
+        if kind == "IonBeamControlActivity":
+            current = _raw_value(act, "Current")
+        elif kind == "SEMBeamControlActivity":
+            if "ScanRotation" in exprs and ack_time is None:
+                ack_time = t
+        elif kind == "DelayActivity":
+            t += _parse_timespan(act.get("TimeoutDelay", "0:0:0"))
+        elif kind == "MillTriggerActivity":
+            if act.get("RunOption") == "Stop" or not pending:
+                continue
+            busy_until = max(t, busy_until) + sum(p.duration for p in pending)
+            patterns.extend(pending)
+            pending = []
+            if act.get("RunOption") == "StartAndWait":
+                t = busy_until
+        elif kind.startswith("Mill"):
+            shape = kind[len("Mill"):-len("Activity")]
+            area = _raw_value(act, "Area")
+            depth = _raw_value(act, "Depth")
+            if "Depth" in exprs:
+                try:
+                    depth = evaluate(exprs["Depth"], variables)
+                except ValueError as ex:
+                    logging.debug("Using saved depth of %s: %s", _name(act), ex)
+            if act.get("Duration"):
+                dur = _parse_timespan(act.get("Duration"))
+            else:
+                dur = _pattern_duration(act, area, depth, current)
+            p = Pattern(_name(act), shape, area, depth, current, dur)
+            if act.get("WaitForTrigger") == "True":
+                pending.append(p)
+            else:
+                t = max(t, busy_until) + dur
+                busy_until = t
+                patterns.append(p)
+    # Patterns never triggered are not milled
+    duration = max(t, busy_until) + poll_time
+    ack_time = duration if ack_time is None else ack_time + poll_time
+    return tuple(patterns), duration, ack_time
+
+
+def parse_recipe(root):
+    """
+    root (Element): the root of the recipe
+    return (OrderedDict float -> CommandRecipe): code -> command, for each
+      branch corresponding to a command code
+    raise:
+        ValueError: if the recipe doesn't have the expected structure
+    """
+    variables = _read_variables(root)
+    def_sr = variables.get("DefScanRot", DEFAULT_SCAN_ROTATION)
+    branches = []
+    for el in root.iter():
+        if _local(el.tag) != "IfElseBranchActivity" or not _enabled(el):
+            continue
+        cond = el.get("Condition", "")
+        m = re.match(r"^\s*Microscope\.Sem\.ScanRotation\s*=\s*(.+)$", cond)
+        if not m:
+            logging.debug("Skipping branch %s with condition %s", _name(el), cond)
+            continue
+        try:
+            code = round(evaluate(m.group(1), variables) - def_sr, 6)
+        except ValueError as ex:
+            logging.warning("Skipping branch %s: %s", _name(el), ex)
+            continue
+        branches.append((code, el))
+    if not branches:
+        raise ValueError("No scan rotation branch found in the recipe")
+
+    # When idle, iFast loops through the default branch, so it reads the scan
+    # rotation once per loop. Count half a loop to notice a new command.
+    poll_time = 0
+    for code, el in branches:
+        if code == 0:
+            _, loop, _ = _parse_branch(el, variables, 0)
+            poll_time = loop / 2
+
+    names = {round(c.code, 6): n for n, c in COMMANDS.items()}
+    recipe = OrderedDict()
+    for code, el in branches:
+        if code == 0:
+            continue
+        patterns, duration, ack_time = _parse_branch(el, variables, poll_time)
+        recipe[code] = CommandRecipe(names.get(code), code, patterns, duration, ack_time)
+    return recipe
+
+
+def load_recipe(filename=None):
+    """
+    Read the recipe, only if it has changed since the last time.
+    filename (str or None): the recipe file. If None, RECIPE_PATH is used.
+    return (dict str -> CommandRecipe): command name -> recipe of the command.
+      It's empty if no recipe is found.
+    """
+    if filename is None:
+        filename = RECIPE_PATH
+        if not os.path.exists(filename):
+            logging.info("No %s found, milling times will not be estimated", filename)
+            return {}
+
+    try:
+        mtime = os.path.getmtime(filename)
+        cmtime, recipe = _cache.get(filename, (None, None))
+        if cmtime != mtime:
+            recipe = parse_recipe(ET.parse(filename).getroot())
+            _cache[filename] = (mtime, recipe)
+    except (IOError, ET.ParseError, ValueError) as ex:
+        logging.warning("Failed to read the recipe %s: %s", filename, ex)
+        return {}
+    return {r.name: r for r in recipe.values() if r.name is not None}
+
+
+def scale_recipe(recipe, factor):
+    """
+    recipe (dict str -> CommandRecipe): as returned by load_recipe()
+    factor (float): multiplier of all the durations
+    return (dict str -> CommandRecipe): the same commands, with scaled durations
+    """
+    return {n: r._replace(duration=r.duration * factor, ack_time=r.ack_time * factor)
+            for n, r in recipe.items()}
+
+
+def expected_waits(recipe, names):
+    """
+    Estimate how long it takes to run each command of a sequence, one after
+    another. When a command is acknowledged as soon as the milling starts, iFast
+    only reads the next command once the milling is finished.
+    recipe (dict str -> CommandRecipe): as returned by load_recipe()
+    names (list of str): the commands, in order
+    return (list of float or None): for each command, the time until it's
+      acknowledged (s), or None if the command is not in the recipe, or mills
+      nothing (probably, the recipe is not the one run by iFast)
+    """
+    waits = []
+    busy = 0  # s, milling left from the previous command
+    for n in names:
+        r = recipe.get(n)
+        if r is None or not r.patterns or r.duration <= 0:
+            waits.append(None)
+            busy = 0
+            continue
+        waits.append(busy + r.ack_time)
+        busy = r.duration - r.ack_time
+    return waits
+
+
+def wait_timeout(expected):
+    """
+    expected (float): time until the command is acknowledged, estimated from
+      the recipe (s)
+    return (float): maximum time to wait for the command (s)
+    """
+    return expected * TIMEOUT_FACTOR + TIMEOUT_MARGIN
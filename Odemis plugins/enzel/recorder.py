@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Recorder of frames into a chunked (optionally compressed) HDF5 file, written from
+a background thread, so that the acquisition never waits for the disk.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+
+import numpy as np
+
+from enzel.lazy import lazy_import
+from enzel.writer import ExportQueue
+
+h5py = lazy_import("h5py")
+
+
+class FrameRecorder(object):
+    """
+    Records series of frames, with their timestamp and statistics, in one HDF5
+    file. Each series is stored in its own group, with the datasets:
+     * frames: all the frames (N x Y x X), chunked per frame
+     * timestamps: time of each frame (N)
+     * one dataset per statistic (N)
+    The file is written by a background thread, so add() only blocks if the
+    disk cannot keep up.
+    """
+
+    def __init__(self, filename, compression=None, queue_size=8):
+        """
+        filename (str): path of the HDF5 file to create
+        compression (None or str): compression of the frames, as supported by
+          h5py (eg, "gzip" or "lzf")
+        queue_size (int): maximum number of frames waiting to be written
+        """
+        self.filename = filename
+        self._compression = compression
+        self._file = None
+        self.dropped = 0  # number of frames not recorded because the disk was too slow
+        self._writer = ExportQueue(queue_size, name="FrameRecorder")
+        self._writer.put(self._open)
+
+    def add(self, name, frame, timestamp, stats=None, block=True):
+        """
+        Schedule the recording of a frame.
+        name (str): name of the series
+        frame (2D ndarray): the frame
+        timestamp (float): time of the frame
+        stats (dict str -> float or ndarray or None): statistics of the frame
+        block (bool): if False, and too many frames are already waiting to be
+          written, the frame is dropped instead of waiting.
+        return (bool): True if the frame will be recorded, False if it was dropped
+        raise: the error of a previous write, if one failed
+        """
+        args = (self._write, name, np.asarray(frame), timestamp, stats or {})
+        if block:
+            self._writer.put(*args)
+        elif not self._writer.try_put(*args):
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self):
+        """
+        Write all the pending frames and close the file.
+        raise: the error of a previous write, if one failed
+        """
+        try:
+            self._writer.put(self._close)
+        finally:
+            self._writer.close()
+        if self.dropped:
+            logging.warning("%d frames were not recorded in %s, as the disk was too slow",
+                            self.dropped, self.filename)
+
+    def _open(self):
+        self._file = h5py.File(self.filename, "w")
+
+    def _close(self):
+        self._file.close()
+        logging.debug("Closed recording %s", self.filename)
+
+    def _append(self, grp, dsname, value, shape=(), dtype=float, **kwargs):
+        """
+        Append one value to a dataset, created on first use.
+        """
+        try:
+            ds = grp[dsname]
+        except KeyError:
+            ds = grp.create_dataset(dsname, (0,) + shape, dtype, maxshape=(None,) + shape, **kwargs)
+        n = ds.shape[0]
+        ds.resize(n + 1, axis=0)
+        ds[n] = value
+
+    def _write(self, name, frame, timestamp, stats):
+        grp = self._file.require_group(name)
+        self._append(grp, "frames", frame, frame.shape, frame.dtype,
+                     chunks=(1,) + frame.shape, compression=self._compression)
+        # Small values => larger chunks
+        self._append(grp, "timestamps", timestamp, chunks=(1024,))
+        for k, v in stats.items():
+            shape = np.shape(v)
+            self._append(grp, k, v, shape, chunks=(1024,) + shape)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Registration of images by FFT phase correlation, to measure how much the
+sample drifted since a reference image was taken.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import os
+
+import numpy as np
+
+# Below this peak value of the correlation, the shift is not reliable
+MIN_RESPONSE = 0.05
+# Frequencies above this fraction of the maximum are attenuated, as they mostly contain noise
+LOWPASS_CUTOFF = 0.25
+
+
+def _subpixel(c_m, c_0, c_p):
+    """
+    Position of the maximum of the parabola passing through 3 points at -1, 0, +1
+    """
+    denom = c_m - 2 * c_0 + c_p
+    if denom >= 0:
+        return 0.0
+    return 0.5 * (c_m - c_p) / denom
+
+
+class PhaseCorrelator(object):
+    """
+    Measures the shift between images and references, by phase correlation.
+    The window, the frequency weights and the spectrum of each reference are
+    computed only once.
+    """
+
+    def __init__(self):
+        self._windows = {}  # shape -> 2D ndarray
+        self._weights = {}  # shape -> 2D ndarray
+        self._refs = {}  # key -> (shape, ndarray): spectrum of the reference
+
+    def _window(self, shape):
+        if shape not in self._windows:
+            self._windows[shape] = np.outer(np.hanning(shape[0]), np.hanning(shape[1])).astype(np.float32)
+        return self._windows[shape]
+
+    def _weight(self, shape):
+        """
+        return (2D ndarray): gaussian low-pass weights of the (half) spectrum,
+          normalized so that the correlation peak is 1 for identical images
+        """
+        if shape not in self._weights:
+            fy = np.fft.fftfreq(shape[0])[:, np.newaxis]
+            fx = np.fft.rfftfreq(shape[1])[np.newaxis, :]
+            w = np.exp(-(fx ** 2 + fy ** 2) / (2 * (LOWPASS_CUTOFF * 0.5) ** 2))
+            # The full spectrum is the half spectrum, mirrored (except the first and last columns)
+            total = 2 * w.sum() - w[:, 0].sum() - (w[:, -1].sum() if shape[1] % 2 == 0 else 0)
+            self._weights[shape] = (w * (shape[0] * shape[1] / total)).astype(np.float32)
+        return self._weights[shape]
+
+    def _spectrum(self, image):
+        im = np.asarray(image, dtype=np.float32)
+        im = (im - im.mean()) * self._window(im.shape)
+        return np.fft.rfft2(im)
+
+    def set_reference(self, key, image):
+        """
+        key (hashable): identifier of the reference (eg, the feature name)
+        image (2D ndarray)
+        """
+        self._refs[key] = (image.shape, np.conj(self._spectrum(image)))
+
+    def has_reference(self, key):
+        return key in self._refs
+
+    def remove_reference(self, key):
+        self._refs.pop(key, None)
+
+    def measure(self, key, image):
+        """
+        Measure how much the content of the image moved compared to the reference.
+        key (hashable): identifier of the reference
+        image (2D ndarray): same shape as the reference
+        return ((float, float), float): the shift along x (columns) and y
+          (rows) in px, and the peak of the correlation (0 -> 1, low values
+          mean the shift is unreliable)
+        raise:
+          KeyError: if there is no reference
+          ValueError: if the image doesn't have the same shape as the reference
+        """
+        shape, ref_conj = self._refs[key]
+        if image.shape != shape:
+            raise ValueError("Image of shape %s, while reference has shape %s" % (image.shape, shape))
+        cross = self._spectrum(image) * ref_conj
+        cross *= self._weight(shape) / (np.abs(cross) + 1e-12)
+        corr = np.fft.irfft2(cross, s=shape)
+        py, px = np.unravel_index(np.argmax(corr), shape)
+        h, w = shape
+        dy = py + _subpixel(corr[py - 1, px], corr[py, px], corr[(py + 1) % h, px])
+        dx = px + _subpixel(corr[py, px - 1], corr[py, px], corr[py, (px + 1) % w])
+        # Shifts over half the image are negative shifts
+        if dy > h / 2:
+            dy -= h
+        if dx > w / 2:
+            dx -= w
+        return (float(dx), float(dy)), float(corr[py, px])
+
+
+def save_reference(filename, image, pos):
+    """
+    Store a reference image, to be used in the next sessions.
+    filename (str): the file (.npz)
+    image (2D ndarray)
+    pos (float, float): x, y position where the image was acquired (m)
+    """
+    tmpfn = filename + ".tmp.npz"
+    np.savez(tmpfn, image=np.asarray(image), pos=np.asarray(pos, dtype=float))
+    os.replace(tmpfn, filename)
+
+
+def load_reference(filename):
+    """
+    filename (str): the file (.npz), as written by save_reference()
+    return (2D ndarray, (float, float)) or None: the reference image, and the
+      position where it was acquired, or None if there is none
+    """
+    try:
+        with np.load(filename) as f:
+            return f["image"], tuple(float(v) for v in f["pos"])
+    except (IOError, ValueError, KeyError):
+        return None
+
+
+def shift_to_physical(shift, pixel_size):
+    """
+    Convert a shift of the image content to a physical shift, with the Odemis
+    convention that the y axis goes up while the rows go down.
+    shift (float, float): x, y shift (px)
+    pixel_size (float, float): size of a pixel (m)
+    return (float, float): x, y shift (m)
+    """
+    return shift[0] * pixel_size[0], -shift[1] * pixel_size[1]
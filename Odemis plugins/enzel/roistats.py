@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Intensity statistics in regions of interest, as done by IFM-Monitor.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+
+import numpy as np
+
+from enzel.lazy import lazy_import
+
+cv2 = lazy_import("cv2")
+
+# Default half size of the box at the centre of the image
+DEFAULT_HALF_WIDTH = 3  # px
+
+
+def center_roi_stats(im, hw=DEFAULT_HALF_WIDTH):
+    """
+    Compute the intensity statistics in a small box at the centre of the image.
+    im (2D ndarray): the image
+    hw (int): half size of the box (px)
+    return (dict str -> float): "mean" and "max" intensity in the box
+    """
+    sy, sx = im.shape[-2:]
+    roi = im[..., sy // 2 - hw:sy // 2 + hw, sx // 2 - hw:sx // 2 + hw]
+    return {"mean": float(np.mean(roi)), "max": float(np.max(roi))}
+
+
+class MultiROIStats(object):
+    """
+    Computes the mean and max intensity of many square ROIs at once, by
+    gathering all the ROIs in a single array and reducing it.
+    Optionally, the drift of the image is tracked (by phase correlation with
+    the first frame), and the ROIs are moved along with it.
+    """
+
+    def __init__(self, centers=None, hw=DEFAULT_HALF_WIDTH, track_drift=False, track_size=256):
+        """
+        centers (None or list of (int, int)): the centre of each ROI, as (y, x)
+          in px, on the first frame. If None, a single ROI at the centre of the
+          image is used.
+        hw (int): half size of the ROIs (px)
+        track_drift (bool): if True, the ROIs follow the drift of the image
+        track_size (int): size of the area used to measure the drift (px). The
+          larger, the more accurate, but the slower.
+        """
+        self._centers = None if centers is None else np.array(centers, dtype=int).reshape(-1, 2)
+        self.hw = hw
+        self.track_drift = track_drift
+        self._track_size = track_size
+        self._track_area = None  # slice in y, slice in x
+        self._ref = None  # reference image for the drift
+        self._window = None
+        self.drift = np.zeros(2)  # current drift (y, x) in px, compared to the first frame
+
+    @property
+    def nrois(self):
+        return 1 if self._centers is None else len(self._centers)
+
+    def _init_tracking(self, im):
+        # Track on an area around the ROIs, as the whole image would be too slow
+        sy, sx = im.shape
+        cy, cx = self._centers.mean(axis=0).astype(int)
+        ts = min(self._track_size, sy, sx)
+        y0 = min(max(cy - ts // 2, 0), sy - ts)
+        x0 = min(max(cx - ts // 2, 0), sx - ts)
+        self._track_area = (slice(y0, y0 + ts), slice(x0, x0 + ts))
+        self._window = cv2.createHanningWindow((ts, ts), cv2.CV_32F)
+        self._ref = im[self._track_area].astype(np.float32)
+
+    def _update_drift(self, im):
+        cur = im[self._track_area].astype(np.float32)
+        (dx, dy), response = cv2.phaseCorrelate(self._ref, cur, self._window)
+        if response < 0.05:
+            # Probably not the same content anymore (eg, shutter closed)
+            logging.debug("Drift measurement unreliable (response = %g), ignored", response)
+            return
+        self.drift = np.array((dy, dx))
+
+    def compute(self, im):
+        """
+        Compute the statistics of all the ROIs in the image.
+        im (2D ndarray): the image
+        return:
+          means (ndarray of shape N): mean intensity of each ROI
+          maxs (ndarray of shape N): max intensity of each ROI
+        """
+        sy, sx = im.shape
+        if self._centers is None:
+            self._centers = np.array([[sy // 2, sx // 2]])
+        if self.track_drift:
+            if self._ref is None:
+                self._init_tracking(im)
+            else:
+                self._update_drift(im)
+
+        hw = self.hw
+        centers = self._centers + np.round(self.drift).astype(int)
+        # Keep the ROIs inside the image
+        ys = np.clip(centers[:, 0], hw, sy - hw) - hw
+        xs = np.clip(centers[:, 1], hw, sx - hw) - hw
+        offsets = np.arange(2 * hw)
+        # N x 2hw x 2hw array with all the ROIs
+        rois = im[(ys[:, np.newaxis] + offsets)[:, :, np.newaxis],
+                  (xs[:, np.newaxis] + offsets)[:, np.newaxis, :]]
+        return rois.mean(axis=(1, 2)), rois.max(axis=(1, 2))
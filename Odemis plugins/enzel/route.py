@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Route planner, to order the features so that the stage travels as little as
+possible.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+
+import numpy as np
+
+# Used when the actuator doesn't report its speed
+DEFAULT_SPEED = {"x": 1e-3, "y": 1e-3, "z": 1e-4}  # m/s
+
+
+def get_speeds(stage, focus):
+    """
+    Find the speed of the x, y axes of the stage, and of the z axis of the focus.
+    stage (Actuator): the sample stage
+    focus (Actuator): the optical focus
+    return (tuple of 3 floats): speed of x, y, z (m/s)
+    """
+    speeds = []
+    for comp, ax in ((stage, "x"), (stage, "y"), (focus, "z")):
+        try:
+            speeds.append(comp.speed.value[ax])
+        except (AttributeError, KeyError):
+            speeds.append(DEFAULT_SPEED[ax])
+    return tuple(speeds)
+
+
+def travel_times(points, speeds):
+    """
+    Compute the time to travel between every pair of points, assuming all the
+    axes move simultaneously.
+    points (ndarray of shape N, 3): x, y, z positions (m)
+    speeds (tuple of 3 floats): speed of each axis (m/s)
+    return (ndarray of shape N, N): travel time between each point (s)
+    """
+    points = np.asarray(points, dtype=float)
+    delta = np.abs(points[:, np.newaxis, :] - points[np.newaxis, :, :])
+    return (delta / np.asarray(speeds, dtype=float)).max(axis=2)
+
+
+def route_time(route, times):
+    """
+    route (list of int): indices of the points, in the order visited
+    times (ndarray of shape N, N): travel time between each point (s)
+    return (float): total travel time (s)
+    """
+    route = np.asarray(route)
+    return float(times[route[:-1], route[1:]].sum())
+
+
+def _nearest_neighbour(times, start):
+    n = times.shape[0]
+    route = [start]
+    visited = np.zeros(n, dtype=bool)
+    visited[start] = True
+    for _ in range(n - 1):
+        t = np.where(visited, np.inf, times[route[-1]])
+        nxt = int(np.argmin(t))
+        route.append(nxt)
+        visited[nxt] = True
+    return route
+
+
+def _two_opt(route, times, max_passes=50):
+    """
+    Improve an open route (the first point is fixed) by reversing segments,
+    until no reversal makes it shorter.
+    """
+    route = np.array(route)
+    n = len(route)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            # Reverse route[i:j+1], for every j > i, at once
+            j = np.arange(i + 1, n)
+            a, b = route[i - 1], route[i]
+            c = route[j]
+            before = times[a, b] + times[c[:-1], route[j[:-1] + 1]]
+            after = times[a, c[:-1]] + times[b, route[j[:-1] + 1]]
+            # Last point: there is no edge after it
+            before = np.append(before, times[a, b])
+            after = np.append(after, times[a, c[-1]])
+            gain = before - after
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                k = j[best]
+                route[i:k + 1] = route[i:k + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return route.tolist()
+
+
+def plan_route(points, speeds, start):
+    """
+    Order the points to minimize the total travel time, starting from the
+    current position. It uses the nearest neighbour heuristic, refined by 2-opt.
+    points (list of tuple of 3 floats): x, y, z positions of the points (m)
+    speeds (tuple of 3 floats): speed of each axis (m/s)
+    start (tuple of 3 floats): current x, y, z position (m)
+    return:
+      order (list of int): indices of the points, in the order to visit them
+      opt_time (float): estimated travel time with this order (s)
+      orig_time (float): estimated travel time in the original order (s)
+    """
+    if not points:
+        return [], 0, 0
+    allp = np.vstack([start, points])
+    times = travel_times(allp, speeds)
+    route = _nearest_neighbour(times, 0)
+    route = _two_opt(route, times)
+    opt_time = route_time(route, times)
+    orig_time = route_time(range(len(allp)), times)
+    if orig_time <= opt_time:  # Could happen if the points are already well ordered
+        return list(range(len(points))), orig_time, orig_time
+    logging.debug("Route optimized from %g s to %g s", orig_time, opt_time)
+    return [i - 1 for i in route[1:]], opt_time, orig_time
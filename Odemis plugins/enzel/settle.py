@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Settle detection: wait until the stage (and the image) is stable after a move,
+instead of sleeping a fixed time.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+import math
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from enzel.completion import rotation_diff
+from enzel.lazy import lazy_import
+
+cv2 = lazy_import("cv2")
+
+# Time to wait for a move to complete, before giving up
+MOVE_TIMEOUT = 120  # s
+
+
+def wait_moves(futures, timeout=MOVE_TIMEOUT):
+    """
+    Wait for all the moves to be complete.
+    futures (list of Future): the futures returned by moveAbs/moveRel
+    timeout (float): maximum time to wait for all the moves (s)
+    raise:
+      TimeoutError: if a move is still not done after the timeout
+      Exception: the error of a move which failed
+    """
+    tend = time.time() + timeout
+    for f in futures:
+        try:
+            f.result(max(0, tend - time.time()))
+        except FutureTimeoutError:
+            raise TimeoutError("Move not done after %g s" % (timeout,))
+
+
+def measure_shift(prev, cur):
+    """
+    Measure the translation between two images of the same size, by phase
+    correlation.
+    prev (2D ndarray): reference image
+    cur (2D ndarray): new image
+    return (float, float): shift (x, y) of cur compared to prev, in pixels
+    """
+    prev = np.asarray(prev, dtype=np.float32)
+    cur = np.asarray(cur, dtype=np.float32)
+    (dx, dy), _ = cv2.phaseCorrelate(prev, cur)
+    return dx, dy
+
+
+def wait_stable(frames, stream, max_shift=0.5, timeout=10):
+    """
+    Acquire frames until two successive ones are not shifted anymore.
+    frames (FrameAcquirer): used to acquire the frames
+    stream (Stream): fast stream (eg, RLM), used to check the image
+    max_shift (float): maximum shift between two frames to be stable (px)
+    timeout (float): maximum time to wait (s). After this time, it returns
+      even if the image is not stable.
+    return (bool): True if the image is stable, False if the timeout was reached
+    raise:
+      CancelledError: if the acquisition was cancelled
+    """
+    tstart = time.time()
+    prev = None
+    while True:
+        left = tstart + timeout - time.time()
+        if left <= 0:
+            logging.warning("Image of %s still not stable after %g s",
+                            stream.name.value, timeout)
+            return False
+        try:
+            cur = frames.acquire(stream, timeout=left)
+        except TimeoutError:
+            continue  # Will stop just after
+        if prev is not None and prev.shape == cur.shape:
+            dx, dy = measure_shift(prev, cur)
+            logging.debug("Image shifted by %g, %g px", dx, dy)
+            if math.hypot(dx, dy) <= max_shift:
+                logging.debug("Image stable after %g s", time.time() - tstart)
+                return True
+        prev = cur
+
+
+def wait_rotation(sem, rot, timeout=2.0, atol=1e-5):
+    """
+    Wait until the scan rotation has changed to the given value.
+    sem (Component): the XT connection
+    rot (float): the expected rotation (rad)
+    timeout (float): maximum time to wait (s)
+    atol (float): tolerance on the rotation (rad)
+    return (bool): True if the rotation was reached, False if the timeout was reached
+    """
+    tend = time.time() + timeout
+    while time.time() < tend:
+        if abs(rotation_diff(sem.get_rotation(), rot)) < atol:
+            return True
+        time.sleep(0.1)
+    logging.debug("Rotation still not at %g rad after %g s", rot, timeout)
+    return False
@@ -0,0 +1,1086 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Simulator of the ENZEL hardware, and of the parts of the Odemis (and wx) API used
+by the plugins, so that they can be run (and benchmarked) without microscope.
+The durations (moves, exposures, milling) are those of the real system,
+multiplied by the time scale.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures._base import CANCELLED, FINISHED, RUNNING
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+import weakref
+
+import numpy as np
+
+from enzel.commands import COMMANDS, DEFAULT_SCAN_ROTATION
+from enzel.lazy import lazy_import, lazy_property
+
+cv2 = lazy_import("cv2")
+
+# Metadata keys, same values as in odemis.model
+MD_ACQ_DATE = "Acquisition date"
+MD_EXP_TIME = "Exposure time"
+MD_BINNING = "Binning"
+MD_PIXEL_SIZE = "Pixel size"
+MD_POS = "Centre position"
+MD_DESCRIPTION = "Description"
+
+FEATURE_ACTIVE = "Active"
+FEATURE_ROUGH_MILLED = "Rough Milled"
+FEATURE_POLISHED = "Polished"
+FEATURE_DEACTIVE = "Discarded"
+
+# Duration of each iFast command (s), as on the real system
+MILL_TIMES = {
+    "stop": 0,
+    "relief_cuts": 120,
+    "mill_2_5um": 300,
+    "mill_1_0um": 240,
+    "mill_0_6um": 180,
+    "mill_0_2um": 120,
+    "alignment_hole": 60,
+    "beam_align": 30,
+    "auto_rc_rm": 600,
+    "auto_relief_cuts": 180,
+    "auto_rough_milling": 420,
+    "auto_2um": 360,
+    "auto_1um": 300,
+}
+IFAST_POLL_PERIOD = 1.0  # s, how often the iFast script reads the scan rotation
+
+# Speed of each axis, as on the real system
+STAGE_SPEED = {"x": 1e-3, "y": 1e-3, "z": 0.5e-3, "rx": 0.05, "rz": 0.05}  # m/s or rad/s
+FOCUS_SPEED = {"z": 1e-3}  # m/s
+MOVE_OVERHEAD = 0.2  # s, added to each move (acceleration, communication)
+
+
+def _weak_listener(listener):
+    """
+    Like Odemis, only keep a weak reference to the listeners, so that the same
+    bugs happen on the simulator.
+    return (callable): returns the listener, or None if it's gone
+    """
+    if hasattr(listener, "__self__"):
+        return weakref.WeakMethod(listener)
+    return weakref.ref(listener)
+
+
+class VigilantAttribute(object):
+    """
+    Value which notifies its listeners when it's changed
+    """
+
+    def __init__(self, value=None, unit=None, readonly=False, range=None, choices=None, **kwargs):
+        self._value = value
+        self.unit = unit
+        self.readonly = readonly
+        if range is not None:
+            self.range = range
+        if choices is not None:
+            self.choices = choices
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        prev = self._value
+        self._value = value
+        try:
+            changed = bool(prev != value)
+        except Exception:  # eg, numpy arrays
+            changed = prev is not value
+        if changed:
+            self.notify(value)
+
+    def subscribe(self, listener, init=False):
+        with self._lock:
+            self._listeners.append(_weak_listener(listener))
+        if init:
+            listener(self._value)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            self._listeners = [r for r in self._listeners if r() not in (None, listener)]
+
+    def notify(self, value):
+        with self._lock:
+            listeners = [r() for r in self._listeners]
+        for l in listeners:
+            if l is not None:
+                l(value)
+
+
+BooleanVA = StringVA = FloatVA = IntVA = ListVA = TupleVA = ResolutionVA = VigilantAttribute
+
+
+class FloatContinuous(VigilantAttribute):
+    def __init__(self, value, range, unit=None, **kwargs):
+        super(FloatContinuous, self).__init__(value, unit, range=tuple(range), **kwargs)
+
+
+class VAEnumerated(VigilantAttribute):
+    def __init__(self, value, choices, unit=None, **kwargs):
+        super(VAEnumerated, self).__init__(value, unit, choices=choices, **kwargs)
+
+
+IntContinuous = FloatContinuous
+
+
+class DataArray(np.ndarray):
+    """
+    numpy array with metadata
+    """
+
+    def __new__(cls, data, metadata=None):
+        arr = np.asarray(data).view(cls)
+        arr.metadata = dict(metadata or {})
+        return arr
+
+    def __array_finalize__(self, obj):
+        self.metadata = getattr(obj, "metadata", {})
+
+
+class DataFlow(object):
+    """
+    Sends data to its subscribers. The generation is started with the first
+    subscriber, and stopped when the last one unsubscribes.
+    """
+
+    def __init__(self):
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener):
+        with self._lock:
+            start = not self._listeners
+            self._listeners.append(_weak_listener(listener))
+        if start:
+            self.start_generate()
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            self._listeners = [r for r in self._listeners if r() not in (None, listener)]
+            stop = not self._listeners
+        if stop:
+            self.stop_generate()
+
+    def notify(self, data):
+        with self._lock:
+            listeners = [r() for r in self._listeners]
+        for l in listeners:
+            if l is not None:
+                l(self, data)
+
+    def start_generate(self):
+        pass
+
+    def stop_generate(self):
+        pass
+
+
+class ProgressiveFuture(Future):
+    """
+    Future which reports its expected end time, and can be cancelled while running
+    """
+
+    def __init__(self, start=None, end=None):
+        super(ProgressiveFuture, self).__init__()
+        self._start = start or time.time()
+        self._end = end or self._start + 0.1
+        self.task_canceller = None
+        self._upd_callbacks = []
+
+    def set_progress(self, start=None, end=None):
+        if start is not None:
+            self._start = start
+        if end is not None:
+            self._end = end
+        for c in self._upd_callbacks:
+            c(self, self._start, self._end)
+
+    def get_progress(self):
+        return self._start, self._end
+
+    def add_update_callback(self, fn):
+        self._upd_callbacks.append(fn)
+
+    def cancel(self):
+        with self._condition:
+            if self._state == FINISHED:
+                return False
+            if self._state == CANCELLED:
+                return True
+            if self._state == RUNNING:
+                if not (self.task_canceller and self.task_canceller(self)):
+                    return False
+            self._state = CANCELLED
+            self._condition.notify_all()
+        self._invoke_callbacks()
+        return True
+
+    def set_result(self, result):
+        if self.cancelled():  # Odemis accepts it silently
+            return
+        super(ProgressiveFuture, self).set_result(result)
+
+    def set_exception(self, exception):
+        if self.cancelled():
+            return
+        super(ProgressiveFuture, self).set_exception(exception)
+
+
+class Axis(object):
+    def __init__(self, range=None, choices=None, unit=None):
+        if range is not None:
+            self.range = tuple(range)
+        if choices is not None:
+            self.choices = choices
+        self.unit = unit
+
+
+class Component(object):
+    def __init__(self, name, role=None):
+        self.name = name
+        self.role = role
+
+
+class Actuator(Component):
+    """
+    Moves are run one after another, and take as long as the slowest axis.
+    """
+
+    def __init__(self, name, role, axes, position, speed, time_scale=1.0):
+        """
+        axes (dict str -> Axis)
+        position (dict str -> float): initial position
+        speed (dict str -> float): speed of each axis (m/s or rad/s)
+        time_scale (float): multiplier of all the durations
+        """
+        super(Actuator, self).__init__(name, role)
+        self.axes = axes
+        self.position = VigilantAttribute(dict(position), readonly=True)
+        self.speed = VigilantAttribute(dict(speed))
+        self.time_scale = time_scale
+        self.moves = []  # list of (dict str -> float, float): shift, duration (s)
+        self.last_move_end = 0  # time at which the last move finished
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def _check(self, pos):
+        for ax, p in pos.items():
+            if ax not in self.axes:
+                raise ValueError("Unknown axis %s" % (ax,))
+            rng = getattr(self.axes[ax], "range", None)
+            if rng and not rng[0] <= p <= rng[1]:
+                raise ValueError("Position %s = %g out of range %s" % (ax, p, rng))
+
+    def moveAbs(self, pos):
+        self._check(pos)
+        return self._executor.submit(self._do_move, dict(pos))
+
+    def moveRel(self, shift):
+        return self._executor.submit(self._do_move, dict(shift), True)
+
+    def _do_move(self, pos, rel=False):
+        cur = self.position.value
+        if rel:
+            pos = {ax: cur[ax] + s for ax, s in pos.items()}
+            self._check(pos)
+        shift = {ax: p - cur[ax] for ax, p in pos.items()}
+        dur = MOVE_OVERHEAD + max([abs(s) / self.speed.value[ax] for ax, s in shift.items()] + [0])
+        time.sleep(dur * self.time_scale)
+        newpos = dict(cur)
+        newpos.update(pos)
+        self.position._value = newpos
+        self.position.notify(newpos)
+        self.last_move_end = time.time()
+        self.moves.append((shift, dur))
+
+
+class Sample(object):
+    """
+    What the camera sees: a random texture, which is fluorescent until it's
+    milled. The focus depends on the position (the sample is tilted), and the
+    sample can drift.
+    """
+
+    def __init__(self, size=1024, pixel_size=100e-9, focus=(1e-3, 0.02, -0.01),
+                 drift=(0, 0), bleach_rate=1 / 300, seed=0):
+        """
+        size (int): size of the texture (px), which repeats itself
+        pixel_size (float): size of a pixel of the texture (m)
+        focus (float, float, float): z at x=y=0 (m), slope along x and y
+        drift (float, float): speed of the sample drift, along x and y (m/s)
+        bleach_rate (float): fraction of the fluorescence lost per second of milling
+        """
+        self._size = size
+        self._seed = seed
+        self.pixel_size = pixel_size
+        self.focus = focus
+        self.drift = drift
+        self.bleach_rate = bleach_rate
+        self.depth_of_field = 1e-6  # m
+        self._fluo = {}  # (int, int) -> float: position (10 µm grid) -> fluorescence left
+
+    @lazy_property
+    def texture(self):
+        # Only created when first seen, to not import OpenCV before it's needed
+        rng = np.random.default_rng(self._seed)
+        tex = rng.random((self._size, self._size), dtype=np.float32)
+        tex = cv2.GaussianBlur(tex, (0, 0), 4)
+        tex -= tex.min()
+        tex /= tex.max()
+        return tex
+
+    def best_focus(self, x, y):
+        z0, ax, ay = self.focus
+        return z0 + ax * x + ay * y
+
+    def _site(self, x, y):
+        return int(round(x / 10e-6)), int(round(y / 10e-6))
+
+    def fluorescence(self, x, y):
+        return self._fluo.get(self._site(x, y), 1.0)
+
+    def mill(self, x, y, dt):
+        """
+        Bleach the fluorescence at the given position, as milling for dt seconds
+        """
+        site = self._site(x, y)
+        self._fluo[site] = self._fluo.get(site, 1.0) * math.exp(-self.bleach_rate * dt)
+
+
+class Camera(Component):
+    """
+    Renders the part of the sample below the stage, with noise, defocus blur
+    and the vibrations after a move.
+    """
+
+    def __init__(self, name, role, sample, stage, focus, resolution=(512, 512),
+                 time_scale=1.0, clock=None, seed=0):
+        super(Camera, self).__init__(name, role)
+        self._sample = sample
+        self._stage = stage
+        self._focus = focus
+        self._clock = clock or time.time
+        self._rng = np.random.default_rng(seed)
+        self.time_scale = time_scale
+        self.resolution = VigilantAttribute(resolution, readonly=True)
+        self.exposureTime = FloatContinuous(0.1, (1e-3, 60), unit="s")
+        self.binning = VigilantAttribute((1, 1))
+        self.pixelSize = VigilantAttribute((sample.pixel_size, sample.pixel_size), readonly=True)
+        self.vibration = 5  # px, amplitude of the oscillation right after a move
+        self.vibration_time = 1  # s, time constant of the damping of the oscillation
+        self.data = CameraDataFlow(self)
+        self.nframes = 0
+
+    def render(self, exp, binning=(1, 1)):
+        """
+        exp (float): exposure time (s)
+        binning (int, int)
+        return (DataArray of uint16)
+        """
+        spos = self._stage.position.value
+        x, y = spos["x"], spos["y"]
+        z = self._focus.position.value["z"]
+        now = self._clock()
+        px = self._sample.pixel_size
+        dx, dy = self._sample.drift
+        ox, oy = (x + dx * now) / px, (y + dy * now) / px
+        # Damped oscillation after a move
+        dt = (time.time() - self._stage.last_move_end) / self.time_scale
+        if dt < 10 * self.vibration_time:
+            amp = self.vibration * math.exp(-dt / self.vibration_time)
+            ox += amp * math.sin(2 * math.pi * dt)
+            oy += amp * math.cos(2 * math.pi * dt)
+
+        h, w = self.resolution.value
+        tex = self._sample.texture
+        # Like in Odemis, the rows go down when y goes up
+        rows = (np.arange(h) - int(round(oy))) % tex.shape[0]
+        cols = (int(round(ox)) + np.arange(w)) % tex.shape[1]
+        img = tex[np.ix_(rows, cols)]
+        defocus = abs(z - self._sample.best_focus(x, y)) / self._sample.depth_of_field
+        if defocus > 0.1:
+            img = cv2.GaussianBlur(img, (0, 0), min(defocus * 2, 50))
+
+        signal = img * (self._sample.fluorescence(x, y) * exp * 2000)
+        b = binning[0]
+        if b > 1:
+            signal = signal[:h // b * b, :w // b * b].reshape(h // b, b, w // b, b).sum(axis=(1, 3))
+        noisy = signal + 100 + self._rng.normal(0, 3, signal.shape) + np.sqrt(signal) * self._rng.standard_normal(signal.shape)
+        md = {MD_ACQ_DATE: time.time(), MD_EXP_TIME: exp, MD_BINNING: tuple(binning),
+              MD_PIXEL_SIZE: (px * b, px * b), MD_POS: (x, y)}
+        self.nframes += 1
+        return DataArray(np.clip(noisy, 0, 65535).astype(np.uint16), md)
+
+
+class CameraDataFlow(DataFlow):
+    """
+    Generates frames continuously, at the exposure time of the camera
+    """
+
+    def __init__(self, camera):
+        super(CameraDataFlow, self).__init__()
+        self._camera = camera
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start_generate(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name="Camera generator")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop_generate(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self, stop):
+        cam = self._camera
+        while not stop.wait(cam.exposureTime.value * cam.time_scale):
+            self.notify(cam.render(cam.exposureTime.value, cam.binning.value))
+
+
+class XTConnection(Component):
+    """
+    Scan rotation of the SEM, read by a simulated iFast script, which runs
+    the milling commands like LamellaMillingCommands does.
+    """
+
+    def __init__(self, sample, stage, name="SEM XT Connection", def_sr=DEFAULT_SCAN_ROTATION,
+                 mill_times=None, time_scale=1.0, seed=0):
+        """
+        mill_times (dict str -> float): command name -> milling duration (s)
+        """
+        super(XTConnection, self).__init__(name)
+        self._sample = sample
+        self._stage = stage
+        self.def_sr = def_sr
+        self.mill_times = dict(MILL_TIMES)
+        self.mill_times.update(mill_times or {})
+        self.time_scale = time_scale
+        self.history = []  # list of (str, float, bool): command, duration (s), stopped
+        self._rng = np.random.default_rng(seed)
+        self._rotation = np.deg2rad(def_sr)
+        self._changed = threading.Event()
+        self._terminated = False
+        self._thread = threading.Thread(target=self._run, name="iFast simulator")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get_rotation(self):
+        return self._rotation
+
+    def set_rotation(self, rot):
+        self._rotation = rot
+        self._changed.set()
+
+    def terminate(self):
+        self._terminated = True
+        self._changed.set()
+        self._thread.join(10 * IFAST_POLL_PERIOD * self.time_scale + 1)
+
+    def _reset(self):
+        self._rotation = np.deg2rad(self.def_sr)
+
+    def _read_command(self):
+        """
+        return (str or None): the command corresponding to the scan rotation
+        """
+        code = np.rad2deg(self._rotation) - self.def_sr
+        if abs(code) < 0.0005:
+            return None
+        for n, c in COMMANDS.items():
+            if abs(c.code - code) < 0.0005:
+                return n
+        return "unknown"
+
+    def _mill(self, name):
+        """
+        Mill the patterns of the command, unless the stop command is received
+        return (bool): True if it was stopped
+        """
+        dur = self.mill_times[name] * self._rng.uniform(0.9, 1.1)
+        pos = self._stage.position.value
+        tend = time.time() + dur * self.time_scale
+        step = IFAST_POLL_PERIOD * self.time_scale
+        stopped = False
+        while True:
+            left = tend - time.time()
+            if left <= 0:
+                break
+            time.sleep(min(step, left))
+            self._sample.mill(pos["x"], pos["y"], min(step, left) / self.time_scale)
+            if self._terminated or self._read_command() == "stop":
+                stopped = True
+                self._reset()
+                break
+        self.history.append((name, dur, stopped))
+        logging.debug("iFast simulator milled %s for %g s%s", name, dur, " (stopped)" if stopped else "")
+        return stopped
+
+    def _run(self):
+        while not self._terminated:
+            cmd = self._read_command()
+            if cmd is None:
+                self._changed.wait()
+                self._changed.clear()
+                time.sleep(IFAST_POLL_PERIOD * self.time_scale)
+                continue
+            if cmd in ("stop", "unknown"):
+                if cmd == "unknown":
+                    logging.warning("iFast simulator received unknown rotation %g°",
+                                    np.rad2deg(self._rotation))
+                self._reset()
+            elif COMMANDS[cmd].blocking:
+                # Acknowledged once all the patterns are milled
+                self._mill(cmd)
+                self._reset()
+            else:
+                self._reset()
+                self._mill(cmd)
+
+
+class Light(Component):
+    def __init__(self, name, role):
+        super(Light, self).__init__(name, role)
+        # 5 wavelength points (m) of each source
+        self.spectra = VigilantAttribute([
+            (370e-9, 380e-9, 390e-9, 400e-9, 410e-9),
+            (470e-9, 480e-9, 485e-9, 490e-9, 500e-9),
+            (545e-9, 555e-9, 560e-9, 565e-9, 575e-9),
+            (635e-9, 645e-9, 648e-9, 651e-9, 660e-9),
+        ], readonly=True)
+        self.power = VigilantAttribute([0.0] * 4, unit="W")
+
+
+class FilterWheel(Actuator):
+    def __init__(self, name, role, time_scale=1.0):
+        bands = {0: "pass-through", 1: (420e-9, 460e-9), 2: (505e-9, 545e-9),
+                 3: (590e-9, 625e-9), 4: (665e-9, 705e-9)}
+        super(FilterWheel, self).__init__(name, role, {"band": Axis(choices=bands)},
+                                          {"band": 0}, {"band": 1.0}, time_scale)
+
+
+class Stream(object):
+    """
+    Stream which acquires frames from the camera, as long as is_active
+    is True (or only one, with single_frame_acquisition).
+    Like in Odemis, setting should_update is not enough: is_active is set by the
+    stream bar, only for the streams added to it.
+    """
+
+    def __init__(self, name, detector=None, dataflow=None, emitter=None, em_filter=None,
+                 focuser=None, opm=None, detvas=None, **kwargs):
+        self.name = StringVA(name)
+        self._detector = detector
+        self._dataflow = dataflow
+        self._emitter = emitter
+        self._em_filter = em_filter
+        self._focuser = focuser
+        self.image = VigilantAttribute(None)
+        self.raw = []
+        self.should_update = BooleanVA(False)
+        self.is_active = BooleanVA(False)
+        self.single_frame_acquisition = BooleanVA(False)
+        self.det_vas = {}
+        if detector is not None:
+            self.det_vas["exposureTime"] = FloatContinuous(detector.exposureTime.value,
+                                                           detector.exposureTime.range, unit="s")
+            self.det_vas["binning"] = VigilantAttribute(detector.binning.value)
+        self._stop = threading.Event()
+        self._thread = None
+        self.is_active.subscribe(self._on_active)
+
+    def _on_active(self, active):
+        if not active:
+            self._stop.set()
+            return
+        if self._detector is None or (self._thread and self._thread.is_alive() and not self._stop.is_set()):
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,),
+                                        name="Stream %s" % (self.name.value,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def join(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self, stop):
+        try:
+            while True:
+                # Read before acquiring, so that a frame started before the
+                # request of a single frame is not the last one
+                single = self.single_frame_acquisition.value
+                exp = self.det_vas["exposureTime"].value
+                if stop.wait(exp * self._detector.time_scale):
+                    break
+                data = self._detector.render(exp, self.det_vas["binning"].value)
+                self.raw = [data]
+                self.image.value = data
+                if single:
+                    break
+        except Exception:
+            logging.exception("Stream %s failed", self.name.value)
+        finally:
+            # Unless it's already been stopped, and maybe restarted
+            if not stop.is_set():
+                stop.set()
+                self.is_active.value = False
+
+
+class FluoStream(Stream):
+    def __init__(self, name, detector, dataflow, emitter, em_filter, **kwargs):
+        super(FluoStream, self).__init__(name, detector, dataflow, emitter, em_filter, **kwargs)
+        self.power = FloatContinuous(0, (0, 0.1), unit="W")
+        self.excitation = VigilantAttribute(None)
+        self.emission = VigilantAttribute(None)
+        self.tint = VigilantAttribute((255, 255, 255))
+
+
+class SEMStream(Stream):
+    pass
+
+
+class StaticStream(Stream):
+    def __init__(self, name, raw, *args, **kwargs):
+        super(StaticStream, self).__init__(name)
+        self.raw = raw if isinstance(raw, list) else [raw]
+
+
+class CryoFeature(object):
+    def __init__(self, name, x, y, z, streams=None):
+        self.name = StringVA(name)
+        self.pos = TupleVA((x, y, z), unit="m")
+        self.status = StringVA(FEATURE_ACTIVE)
+        self.streams = ListVA(streams or [])
+
+
+def read_features(project_dir):
+    """
+    return (list of CryoFeature): the features of the features.json in the folder
+    """
+    with open(os.path.join(project_dir, "features.json")) as f:
+        content = json.load(f)
+    features = []
+    for fd in content["feature_list"]:
+        fe = CryoFeature(fd["name"], *fd["pos"])
+        fe.status.value = fd["status"]
+        features.append(fe)
+    return features
+
+
+def save_features(project_dir, features):
+    content = {"feature_list": [{"name": fe.name.value, "pos": list(fe.pos.value),
+                                 "status": fe.status.value} for fe in features]}
+    with open(os.path.join(project_dir, "features.json"), "w") as f:
+        json.dump(content, f)
+
+
+class Exporter(object):
+    """
+    Writes the raw data, as fast as the real exporters would
+    """
+
+    def __init__(self, fmt, extension):
+        self.FORMAT = fmt
+        self.EXTENSIONS = [extension]
+
+    def export(self, filename, data):
+        if not isinstance(data, (list, tuple)):
+            data = [data]
+        if self.FORMAT == "HDF5":
+            import h5py
+            with h5py.File(filename, "w") as f:
+                for i, d in enumerate(data):
+                    f.create_dataset("Acquisition%d/ImageData/Image" % (i,), data=d)
+        else:
+            with open(filename, "wb") as f:
+                for d in data:
+                    np.ascontiguousarray(d).tofile(f)
+
+
+class AcquisitionDialog(object):
+    """
+    Dialog without window: the buttons are "pressed" by calling press()
+    """
+
+    def __init__(self, plugin, title, text=None):
+        self.plugin = plugin
+        self.title = title
+        self.text = text
+        self.buttons = OrderedDict()  # label -> callback
+        self.future = None
+        self.info = []  # list of str: all the messages shown
+        self.closed = False
+
+    def addSettings(self, objWithVA, conf=None):
+        pass
+
+    def addButton(self, label, callback=None, face_colour="def"):
+        self.buttons[label] = callback
+
+    def showProgress(self, future):
+        self.future = future
+
+    def setAcquisitionInfo(self, text=None, lvl=logging.INFO):
+        if text:
+            self.info.append(text)
+            logging.log(lvl, "Dialog info: %s", text)
+
+    def resumeSettings(self):
+        pass
+
+    def press(self, label):
+        """
+        Run the callback of the button, as if it was pressed
+        """
+        return self.buttons[label](self)
+
+    def ShowModal(self):
+        return 0
+
+    def Close(self):
+        self.closed = True
+
+    def Destroy(self):
+        pass
+
+
+class Plugin(object):
+    name = None
+    __version__ = None
+    __author__ = None
+    __license__ = None
+
+    def __init__(self, microscope, main_app):
+        self.microscope = microscope
+        self.main_app = main_app
+        self.menus = OrderedDict()  # menu entry -> callback
+
+    def addMenu(self, entry, callback):
+        self.menus[entry] = callback
+
+
+class StreamController(object):
+    class _Panel(object):
+        def collapse(self, collapse):
+            pass
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.stream_panel = self._Panel()
+
+
+class StreambarController(object):
+    """
+    Schedules the streams added to it, like in Odemis: when should_update is
+    set, the stream is activated, and the other streams are paused.
+    """
+
+    def __init__(self, tab_data):
+        self._tab_data = tab_data
+        self._listeners = {}  # Stream -> callable: kept, as the VAs only keep weak references
+
+    def _add_stream(self, stream, add_to_view=False, play=None):
+        self._tab_data.streams.value = [stream] + self._tab_data.streams.value
+
+        def on_update(update, stream=stream):
+            self._schedule_stream(stream, update)
+
+        self._listeners[stream] = on_update
+        stream.should_update.subscribe(on_update)
+        if play:
+            stream.should_update.value = True
+        return StreamController(stream)
+
+    def _schedule_stream(self, stream, update):
+        if update:
+            for s in self._tab_data.streams.value:
+                if s is not stream:
+                    s.should_update.value = False
+                    s.is_active.value = False
+        stream.is_active.value = update
+
+    def removeStreamPanel(self, stream):
+        listener = self._listeners.pop(stream, None)
+        if listener is not None:
+            stream.should_update.unsubscribe(listener)
+        stream.is_active.value = False
+        self._tab_data.streams.value = [s for s in self._tab_data.streams.value if s is not stream]
+
+
+class Tab(object):
+    def __init__(self, name, main_data):
+        self.name = name
+        self.tab_data_model = types.SimpleNamespace(main=main_data, streams=ListVA([]))
+        self.streambar_controller = StreambarController(self.tab_data_model)
+
+
+class Simulator(object):
+    """
+    The whole microscope, with the GUI main data, as seen by the plugins.
+    Call install() before importing the plugins, so that they use it.
+    """
+
+    def __init__(self, time_scale=0.01, folder=None, export_format="TIFF", seed=0):
+        """
+        time_scale (float): multiplier of all the durations of the hardware
+        folder (str or None): where the images are saved. If None, a temporary
+          folder is created.
+        export_format ("TIFF" or "HDF5"): format of the exported files
+        """
+        self.time_scale = time_scale
+        self.folder = folder or tempfile.mkdtemp(prefix="enzel-sim-")
+        self.file_path = None  # file (or list of files) returned by the file dialogs
+        self.exporter = Exporter(export_format, ".h5" if export_format == "HDF5" else ".tiff")
+        self._t0 = time.time()
+
+        self.sample = Sample(seed=seed)
+        self.stage = Actuator("Sample Stage", "stage",
+                              {"x": Axis((-0.02, 0.02), unit="m"), "y": Axis((-0.02, 0.02), unit="m"),
+                               "z": Axis((-0.002, 0.004), unit="m"), "rx": Axis((-0.5, 0.5), unit="rad"),
+                               "rz": Axis((-math.pi, math.pi), unit="rad")},
+                              {"x": 0, "y": 0, "z": 0, "rx": 0, "rz": 0}, STAGE_SPEED, time_scale)
+        self.focus = Actuator("Focus", "focus", {"z": Axis((-0.003, 0.003), unit="m")},
+                              {"z": self.sample.best_focus(0, 0)}, FOCUS_SPEED, time_scale)
+        self.ccd = Camera("Camera", "ccd", self.sample, self.stage, self.focus,
+                          time_scale=time_scale, clock=self.now, seed=seed)
+        self.light = Light("Light Engine", "light")
+        self.light_filter = FilterWheel("Filter Wheel", "filter", time_scale)
+        self.sem = XTConnection(self.sample, self.stage, time_scale=time_scale, seed=seed)
+        self.components = [self.stage, self.focus, self.ccd, self.light, self.light_filter, self.sem]
+
+        self.main_data = types.SimpleNamespace(
+            microscope=self, role="enzel", stage=self.stage, focus=self.focus, ccd=self.ccd,
+            light=self.light, light_filter=self.light_filter, opm=None,
+            features=ListVA([]), tab=VAEnumerated(None, choices={}))
+        self.tab = Tab("cryosecom-localization", self.main_data)
+        self.main_data.tab.choices = {self.tab: self.tab.name}
+        self.main_data.tab.value = self.tab
+        self.main_app = types.SimpleNamespace(main_data=self.main_data, main_frame=None)
+
+    def terminate(self):
+        """
+        Stop all the threads of the hardware
+        """
+        for s in self.tab.tab_data_model.streams.value:
+            s.should_update.value = False
+            s.join(5)
+        self.ccd.data.stop_generate()
+        self.ccd.data.join(5)
+        self.sem.terminate()
+
+    def now(self):
+        """
+        return (float): time since the start of the simulation, in simulated seconds
+        """
+        return (time.time() - self._t0) / self.time_scale
+
+    def getComponent(self, name=None, role=None):
+        for c in self.components:
+            if (name is None or c.name == name) and (role is None or c.role == role):
+                return c
+        raise LookupError("No component with name %s and role %s" % (name, role))
+
+    def add_streams(self, acq=True):
+        """
+        Create the streams of the default profile in the localization tab, like
+        SetStreambarController
+        acq (bool): also create the acquisition streams (20 s exposure)
+        """
+        # Only importable once the simulator is installed
+        from enzel.profiles import DEFAULT_PROFILE, PROFILE_DIRS, create_stream, get_choices, load_profiles
+
+        profile = load_profiles(PROFILE_DIRS[:1])[DEFAULT_PROFILE]  # Not the ones of the user
+        ex_choices, em_choices = get_choices(self.main_data)
+        streams = [SEMStream("Secondary electrons")]
+        for spec in profile.streams:
+            if acq or not spec.acquisition:
+                streams.append(create_stream(self.main_data, spec, ex_choices, em_choices))
+        self.tab.tab_data_model.streams.value = []
+        # Added one by one (at the front), so that the GUI schedules them
+        for s in reversed(streams):
+            self.tab.streambar_controller._add_stream(s, add_to_view=True, play=False)
+        return streams
+
+    def add_features(self, nx=3, ny=3, pitch=500e-6, z_error=0):
+        """
+        Create a grid of active features, at the focus position (with some error)
+        z_error (float): standard deviation of the error of the stored focus (m)
+        return (list of CryoFeature)
+        """
+        rng = np.random.default_rng(1)
+        features = []
+        for j in range(ny):
+            for i in range(nx):
+                x, y = (i - (nx - 1) / 2) * pitch, (j - (ny - 1) / 2) * pitch
+                z = self.sample.best_focus(x, y) + rng.normal(0, z_error)
+                features.append(CryoFeature("F%d" % (len(features) + 1,), x, y, z))
+        self.main_data.features.value = features
+        return features
+
+    def install(self):
+        """
+        Make the odemis and wx modules point to the simulator.
+        Must be called before importing the plugins (or the enzel modules using odemis).
+        """
+        if "odemis" in sys.modules and not getattr(sys.modules["odemis"], "_simulated", False):
+            logging.warning("Replacing the odemis modules already imported by the simulator")
+        for name, mod in _create_modules(self).items():
+            sys.modules[name] = mod
+
+
+def _readable_time(seconds, full=True):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return "%d second%s" % (seconds, "" if seconds == 1 else "s")
+    parts = []
+    for name, dur in (("day", 86400), ("hour", 3600), ("minute", 60), ("second", 1)):
+        n, seconds = divmod(seconds, dur)
+        if n:
+            parts.append("%d %s%s" % (n, name, "" if n == 1 else "s"))
+    return " ".join(parts)
+
+
+def _ensure_tuple(v):
+    if isinstance(v, (list, tuple)):
+        return tuple(_ensure_tuple(i) for i in v)
+    return v
+
+
+def _module(name, **attrs):
+    mod = types.ModuleType(name)
+    mod.__dict__.update(attrs)
+    mod._simulated = True
+    return mod
+
+
+def _create_modules(sim):
+    """
+    return (dict str -> module): full name -> module, for all the modules used by the plugins
+    """
+    va_classes = dict(VigilantAttribute=VigilantAttribute, BooleanVA=BooleanVA, StringVA=StringVA,
+                      FloatVA=FloatVA, IntVA=IntVA, ListVA=ListVA, TupleVA=TupleVA,
+                      ResolutionVA=ResolutionVA, FloatContinuous=FloatContinuous,
+                      IntContinuous=IntContinuous, VAEnumerated=VAEnumerated)
+    model = _module("odemis.model", DataArray=DataArray, DataFlow=DataFlow,
+                    ProgressiveFuture=ProgressiveFuture, getComponent=sim.getComponent,
+                    getComponents=lambda: set(sim.components),
+                    MD_ACQ_DATE=MD_ACQ_DATE, MD_EXP_TIME=MD_EXP_TIME, MD_BINNING=MD_BINNING,
+                    MD_PIXEL_SIZE=MD_PIXEL_SIZE, MD_POS=MD_POS, MD_DESCRIPTION=MD_DESCRIPTION,
+                    **va_classes)
+    dataio = _module("odemis.dataio", get_converter=lambda fmt: sim.exporter)
+    stream = _module("odemis.acq.stream", Stream=Stream, FluoStream=FluoStream,
+                     SEMStream=SEMStream, StaticStream=StaticStream)
+    feature = _module("odemis.acq.feature", CryoFeature=CryoFeature, read_features=read_features,
+                      save_features=save_features, FEATURE_ACTIVE=FEATURE_ACTIVE,
+                      FEATURE_ROUGH_MILLED=FEATURE_ROUGH_MILLED, FEATURE_POLISHED=FEATURE_POLISHED,
+                      FEATURE_DEACTIVE=FEATURE_DEACTIVE)
+    acqmng = _module("odemis.acq.acqmng")
+    acq = _module("odemis.acq", stream=stream, feature=feature, acqmng=acqmng)
+    acqui_conf = types.SimpleNamespace(last_format=sim.exporter.FORMAT,
+                                       last_extension=sim.exporter.EXTENSIONS[0],
+                                       last_path=sim.folder)
+    conf_util = _module("odemis.gui.conf.util")
+    conf = _module("odemis.gui.conf", get_acqui_conf=lambda: acqui_conf, util=conf_util)
+    gui_util = _module("odemis.gui.util", get_picture_folder=lambda: sim.folder,
+                       get_home_folder=lambda: sim.folder)
+    plugin = _module("odemis.gui.plugin", Plugin=Plugin, AcquisitionDialog=AcquisitionDialog)
+    text = _module("odemis.gui.comp.text", UnitFloatCtrl=object)
+    comp = _module("odemis.gui.comp", text=text)
+    gui = _module("odemis.gui", conf=conf, util=gui_util, plugin=plugin, comp=comp,
+                  CONTROL_NONE=0, CONTROL_LABEL=1, CONTROL_CHECK=2, CONTROL_RADIO=3,
+                  CONTROL_COMBO=4, CONTROL_TEXT=5, CONTROL_SLIDER=6, CONTROL_INT=7,
+                  CONTROL_FLT=8)
+    units = _module("odemis.util.units", readable_time=_readable_time)
+    udataio = _module("odemis.util.dataio")
+    conversion = _module("odemis.util.conversion", ensure_tuple=_ensure_tuple)
+    fluo = _module("odemis.util.fluo")
+    util = _module("odemis.util", units=units, dataio=udataio, conversion=conversion, fluo=fluo)
+    odemis = _module("odemis", model=model, dataio=dataio, acq=acq, gui=gui, util=util)
+
+    class MessageDialog(object):
+        def __init__(self, parent, message, caption="", style=0):
+            logging.info("Message box: %s: %s", caption, message)
+
+        def ShowModal(self):
+            return wx.ID_OK
+
+        def Destroy(self):
+            pass
+
+    class FileDialog(object):
+        def __init__(self, parent, message="", defaultDir="", defaultFile="", wildcard="", style=0):
+            pass
+
+        def ShowModal(self):
+            return wx.ID_OK if sim.file_path else wx.ID_CANCEL
+
+        def GetPath(self):
+            return self.GetPaths()[0]
+
+        def GetPaths(self):
+            # file_path can also be a list, to select multiple files
+            return sim.file_path if isinstance(sim.file_path, list) else [sim.file_path]
+
+        def Destroy(self):
+            pass
+
+    wx = _module("wx", MessageDialog=MessageDialog, FileDialog=FileDialog,
+                 CallAfter=lambda f, *args, **kwargs: f(*args, **kwargs),
+                 OK=0x4, ICON_STOP=0x200, ID_OK=5100, ID_CANCEL=5101,
+                 FD_OPEN=0x1, FD_FILE_MUST_EXIST=0x10, FD_MULTIPLE=0x20)
+
+    mods = {"odemis": odemis, "odemis.model": model, "odemis.dataio": dataio,
+            "odemis.acq": acq, "odemis.acq.stream": stream, "odemis.acq.feature": feature,
+            "odemis.acq.acqmng": acqmng, "odemis.gui": gui, "odemis.gui.conf": conf,
+            "odemis.gui.conf.util": conf_util, "odemis.gui.util": gui_util,
+            "odemis.gui.plugin": plugin, "odemis.gui.comp": comp, "odemis.gui.comp.text": text,
+            "odemis.util": util, "odemis.util.units": units, "odemis.util.dataio": udataio,
+            "odemis.util.conversion": conversion, "odemis.util.fluo": fluo, "wx": wx}
+    return mods
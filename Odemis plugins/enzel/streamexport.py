@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Streaming export of the channels of a feature: each channel is written only once,
+as soon as it is acquired.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+import os
+
+from enzel.lazy import lazy_import
+
+h5py = lazy_import("h5py")
+
+
+class StreamingExport(object):
+    """
+    Writes each channel to its own file as soon as it's received, and doesn't
+    keep it in memory afterwards.
+    The combined file is not a second copy of the data: with HDF5, it only
+    contains links to the channel files (one "AcquisitionN" per channel), so it
+    can be opened as a multi-channel file. Other formats cannot refer to another
+    file, so no combined file is written.
+    """
+
+    def __init__(self, exporter, combined_path, writer=None):
+        """
+        exporter (module): the odemis.dataio exporter
+        combined_path (str): path of the file containing all the channels
+        writer (ExportQueue or None): if given, the files are written in the
+          background, otherwise they are written immediately.
+        """
+        self._exporter = exporter
+        self._combined_path = combined_path
+        self._writer = writer
+        self._nchannels = 0
+        self._link = (exporter.FORMAT == "HDF5")
+        if not self._link:
+            logging.debug("%s format doesn't support links, combined file %s will not be written",
+                          exporter.FORMAT, combined_path)
+
+    def add(self, filepath, data):
+        """
+        Write one channel.
+        filepath (str): path of the channel file
+        data (DataArray): the channel data. It is not referenced anymore once
+          written.
+        """
+        idx = self._nchannels
+        self._nchannels += 1
+        if self._writer is None:
+            self._write(filepath, data, idx)
+        else:
+            self._writer.put(self._write, filepath, data, idx)
+
+    def _write(self, filepath, data, idx):
+        self._exporter.export(filepath, data)
+        if self._link:
+            # Appended, so that the combined file is usable even if the
+            # acquisition is stopped halfway.
+            with h5py.File(self._combined_path, "a") as f:
+                # Relative path, so that the files can be moved together
+                f["Acquisition%d" % idx] = h5py.ExternalLink(os.path.basename(filepath), "/Acquisition0")
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Fluorescence time-lapse, acquired while iFast is milling a feature.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+from concurrent.futures._base import CancelledError
+import logging
+import threading
+import time
+
+from odemis import model
+
+from enzel.acquire import FrameAcquirer
+from enzel.recorder import FrameRecorder
+from enzel.roistats import center_roi_stats
+
+
+class TimeLapse(object):
+    """
+    Acquires repeatedly a frame of each stream, in a separate thread, until
+    stopped. The frames are recorded in one HDF5 file, along with the ROI
+    intensity at the centre of each frame.
+    """
+
+    def __init__(self, streams, filename, future=None):
+        """
+        streams (list of Streams): the streams to acquire, one after another
+        filename (str): path of the HDF5 file to create
+        future (Future or None): the task future. If it's cancelled, the
+          acquisition stops.
+        """
+        self._streams = streams
+        self._frames = FrameAcquirer(future)
+        self._recorder = FrameRecorder(filename)
+        self._error = None
+        self.nframes = 0
+        self._thread = threading.Thread(target=self._run, name="Time-lapse")
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the acquisition, and wait for all the frames to be written.
+        raise: the error which happened during the acquisition or writing, if any
+        """
+        self._frames.abort()
+        self._thread.join()
+        try:
+            self._recorder.close()
+        except Exception as ex:
+            if self._error is None:
+                self._error = ex
+        logging.info("Time-lapse stopped after %d frames", self.nframes)
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        try:
+            while True:
+                for s in self._streams:
+                    data = self._frames.acquire(s)
+                    tstamp = data.metadata.get(model.MD_ACQ_DATE, time.time())
+                    stats = center_roi_stats(data)
+                    self._recorder.add(s.name.value, data, tstamp, stats)
+                    self.nframes += 1
+                    logging.debug("Time-lapse frame %d of %s: mean = %g, max = %g",
+                                  self.nframes, s.name.value, stats["mean"], stats["max"])
+        except CancelledError:
+            pass
+        except Exception as ex:
+            logging.exception("Time-lapse acquisition failed")
+            self._error = ex
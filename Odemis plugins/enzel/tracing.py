@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Lightweight tracing of the plugins: each phase (move, frame acquisition, iFast
+command, file writing...) records a span, which can be exported as a Chrome
+trace (to open in chrome://tracing or https://ui.perfetto.dev) and as CSV.
+When no trace is being recorded, a span costs a single check.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import csv
+import json
+import logging
+import os
+import threading
+import time
+
+
+class Span(object):
+    """
+    A named period of time, with arguments (eg, the feature name).
+    To be used as a context manager, or with begin() and finish() when the
+    period ends in another function (eg, a callback).
+    """
+    __slots__ = ("name", "cat", "args", "start", "end", "thread", "_tracer")
+
+    def __init__(self, tracer, name, cat, args):
+        self._tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+        self.end = None
+        self.thread = None
+
+    def begin(self):
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        return self
+
+    def finish(self, error=None):
+        """
+        error (str or None): name of the error which ended the period, if any
+        """
+        self.end = time.time()
+        if error is not None:
+            self.args["error"] = error
+        self._tracer._record(self)
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.finish(exc_type.__name__ if exc_type is not None else None)
+        return False
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class _NullSpan(object):
+    """
+    Span used when not tracing: does nothing
+    """
+    __slots__ = ()
+
+    def begin(self):
+        return self
+
+    def finish(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace(object):
+    """
+    All the spans recorded between Tracer.start() and Tracer.stop()
+    """
+
+    def __init__(self, name, basename=None):
+        """
+        name (str): name of the trace (eg, the task)
+        basename (str or None): path of the files where to save it, without extension
+        """
+        self.name = name
+        self.basename = basename
+        self.start = time.time()
+        self.spans = []  # list of Spans, in the order they ended
+
+    def export_chrome(self, filename):
+        """
+        Write the spans in the Chrome trace event format (JSON)
+        """
+        tids = {}
+        events = []
+        for s in self.spans:
+            tid = tids.setdefault(s.thread, len(tids) + 1)
+            ev = {"name": s.name, "cat": s.cat, "pid": 1, "tid": tid,
+                  "ts": (s.start - self.start) * 1e6, "args": s.args}
+            if s.end is None:  # instant event
+                ev["ph"] = "i"
+                ev["s"] = "t"
+            else:
+                ev["ph"] = "X"
+                ev["dur"] = (s.end - s.start) * 1e6
+            events.append(ev)
+        for thread, tid in tids.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                           "args": {"name": thread}})
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"trace": self.name}}, f)
+
+    def export_csv(self, filename):
+        """
+        Write one line per span: name, category, start (s, from the trace start),
+        duration (s), thread, and the arguments
+        """
+        keys = sorted(set(k for s in self.spans for k in s.args))
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "category", "start", "duration", "thread"] + keys)
+            for s in sorted(self.spans, key=lambda s: s.start):
+                dur = "" if s.end is None else "%.6f" % (s.end - s.start,)
+                writer.writerow([s.name, s.cat, "%.6f" % (s.start - self.start,), dur, s.thread] +
+                                [s.args.get(k, "") for k in keys])
+
+    def export(self, basename):
+        """
+        Write the trace as basename.json (Chrome trace) and basename.csv
+        """
+        self.export_chrome(basename + ".json")
+        self.export_csv(basename + ".csv")
+        logging.info("Trace of %s with %d spans saved to %s.json/.csv",
+                     self.name, len(self.spans), basename)
+
+    def summary(self):
+        """
+        return (dict str -> (int, float)): span name -> number of spans, total duration (s)
+        """
+        res = {}
+        for s in self.spans:
+            if s.end is None:
+                continue
+            n, d = res.get(s.name, (0, 0))
+            res[s.name] = (n + 1, d + s.end - s.start)
+        return res
+
+
+class Tracer(object):
+    """
+    Records spans into all the traces currently running (usually none or one).
+    """
+
+    def __init__(self):
+        self._traces = []
+        self._lock = threading.Lock()
+
+    def start(self, name, basename=None):
+        """
+        Start recording a new trace
+        name (str): name of the trace (eg, the task)
+        basename (str or None): path of the files where to save it, without extension
+        return (Trace): to pass to stop()
+        """
+        trace = Trace(name, basename)
+        with self._lock:
+            self._traces = self._traces + [trace]
+        return trace
+
+    def stop(self, trace):
+        """
+        Stop recording the trace
+        """
+        with self._lock:
+            self._traces = [t for t in self._traces if t is not trace]
+
+    def span(self, name, cat="phase", **args):
+        """
+        To be used as a context manager, around the code to measure.
+        name (str): name of the span
+        cat (str): category, to group the spans
+        args: extra information (eg, feature=, action=)
+        """
+        if not self._traces:
+            return _NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def instant(self, name, cat="event", **args):
+        """
+        Record an event which has no duration
+        """
+        if not self._traces:
+            return
+        s = Span(self, name, cat, args)
+        s.thread = threading.current_thread().name
+        s.start = time.time()
+        self._record(s)
+
+    def _record(self, span):
+        for t in self._traces:
+            t.spans.append(span)
+
+
+# Shared by all the plugins, so that a trace contains what they all do
+tracer = Tracer()
+
+
+def start_trace(name, folder):
+    """
+    Start recording a trace, to be saved by stop_trace()
+    name (str): name of the task
+    folder (str): folder where the trace will be saved
+    return (Trace)
+    """
+    basename = time.strftime("%Y%m%d-%H%M%S ", time.localtime()) + name + " trace"
+    return tracer.start(name, os.path.join(folder, basename))
+
+
+def stop_trace(trace):
+    """
+    Stop recording the trace, and save it (as .json and .csv). Errors while
+    saving are only logged.
+    """
+    tracer.stop(trace)
+    try:
+        trace.export(trace.basename)
+    except Exception:
+        logging.exception("Failed to save the trace %s", trace.name)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 17 2026
+
+@author: Daan Boltje
+
+Bounded background writer, used to export images while the stage is already
+moving to the next feature.
+
+This is free and unencumbered software released into the public domain.
+Anyone is free to copy, modify, publish, use, compile, sell, or
+distribute this software, either in source code form or as a compiled
+binary, for any purpose, commercial or non-commercial, and by any
+means.
+
+In jurisdictions that recognize copyright laws, the author or authors
+of this software dedicate any and all copyright interest in the
+software to the public domain. We make this dedication for the benefit
+of the public at large and to the detriment of our heirs and
+successors. We intend this dedication to be an overt act of
+relinquishment in perpetuity of all present and future rights to this
+software under copyright law.
+The software is provided "as is", without warranty of any kind,
+express or implied, including but not limited to the warranties of
+merchantability, fitness for a particular purpose and non-infringement.
+In no event shall the authors be liable for any claim, damages or
+other liability, whether in an action of contract, tort or otherwise,
+arising from, out of or in connection with the software or the use or
+other dealings in the software.
+"""
+
+import logging
+import queue
+import threading
+
+from enzel.tracing import tracer
+
+
+class ExportQueue(object):
+    """
+    Runs export jobs (eg, exporter.export(filename, data)) in a single
+    background thread, in the order they were submitted.
+    The queue is bounded: put() blocks when it is full, so that the acquisition
+    never gets more than maxsize jobs ahead of the disk.
+    The first error raised by a job is kept, and raised again by check(),
+    flush() and close(), so that the caller can report it.
+    """
+
+    def __init__(self, maxsize=16, name="ExportQueue"):
+        """
+        maxsize (int > 0): maximum number of jobs waiting to be written
+        name (str): name of the writer thread, for debugging
+        """
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) to be run in the writer thread.
+        Blocks as long as the queue is full.
+        raise: the error of a previous job, if one failed
+        """
+        self.check()
+        if not self._thread.is_alive():
+            raise RuntimeError("Export queue is closed")
+        if self._queue.full():
+            # The acquisition is waiting for the disk
+            with tracer.span("wait writer", "export"):
+                self._queue.put((fn, args, kwargs))
+        else:
+            self._queue.put((fn, args, kwargs))
+
+    def try_put(self, fn, *args, **kwargs):
+        """
+        Same as put(), but never blocks: if the queue is full, the job is dropped.
+        return (bool): True if the job was scheduled, False if it was dropped
+        raise: the error of a previous job, if one failed
+        """
+        self.check()
+        if not self._thread.is_alive():
+            raise RuntimeError("Export queue is closed")
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            return False
+        return True
+
+    def check(self):
+        """
+        raise: the error of the first job which failed, if any
+        """
+        if self._error is not None:
+            raise self._error
+
+    def flush(self):
+        """
+        Wait until all the jobs submitted so far have been run.
+        raise: the error of the first job which failed, if any
+        """
+        self._queue.join()
+        self.check()
+
+    def close(self):
+        """
+        Write all the pending jobs, and stop the writer thread.
+        Can be called multiple times.
+        raise: the error of the first job which failed, if any
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self.check()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                fn, args, kwargs = job
+                target = args[0] if args and isinstance(args[0], str) else None
+                with tracer.span("write", "export", target=target):
+                    fn(*args, **kwargs)
+            except Exception as ex:
+                logging.exception("Export job %s failed", job[0])
+                if self._error is None:
+                    self._error = ex
+            finally:
+                self._queue.task_done()
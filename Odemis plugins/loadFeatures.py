@@ -29,13 +29,18 @@ other dealings in the software.
 """
 
 import os
+import sys
 import wx
-from odemis import model
 from odemis.gui.util import get_home_folder
-from odemis.acq.feature import FEATURE_ACTIVE, FEATURE_ROUGH_MILLED, FEATURE_DEACTIVE, FEATURE_POLISHED, read_features
-from odemis.gui.plugin import Plugin, AcquisitionDialog
+from odemis.gui.plugin import Plugin
 import logging
 
+# The shared helpers are in the "enzel" folder, next to this file
+_plugin_dir = os.path.dirname(os.path.abspath(__file__))
+if _plugin_dir not in sys.path:
+    sys.path.append(_plugin_dir)
+from enzel.featurestore import FeatureStore, merge_features, read_feature_file
+
 class LoadFeatures(Plugin):
     name = "LoadFeatures"
     __version__ = "0.1"
@@ -53,56 +58,111 @@ class LoadFeatures(Plugin):
             return
         else: 
             self.main_data = self.main_app.main_data
-                
+
+        # Records every change of the features loaded, to reload them as they were
+        self._store = FeatureStore(self.main_data.features)
+
         self.addMenu("Cryo/Load features...", self.load_features)
+        self.addMenu("Cryo/Add features...", self.add_features)
+        self.addMenu("Cryo/Reload last features", self.reload_features)
         self.addMenu("Cryo/Remove all features...", self.remove_all_features)
-        
-    def remove_all_features(self):
-        # Fail if the live tab is not selected
+
+    def _check_tab(self, action):
+        """
+        Report if the live tab is not selected.
+        action (str): what cannot be done, eg "Loading features"
+        return (bool): True if the live tab is selected
+        """
         tab = self.main_app.main_data.tab.value
         if tab.name not in ("secom_live", "sparc_acqui", "cryosecom-localization"):
             available_tabs = self.main_app.main_data.tab.choices.values()
             exp_tab_name = "localization" if "cryosecom-localization" in available_tabs else "acquisition"
             box = wx.MessageDialog(self.main_app.main_frame,
-                       "Removing features must be done from the %s tab." % (exp_tab_name,),
-                       "Removing features not possible", wx.OK | wx.ICON_STOP)
+                       "%s must be done from the %s tab." % (action, exp_tab_name),
+                       "%s not possible" % (action,), wx.OK | wx.ICON_STOP)
             box.ShowModal()
             box.Destroy()
-            return
-        
-        main_data = self.main_app.main_data
-        main_data.features.value = []
+            return False
+        return True
 
-    def load_features(self):
+    def remove_all_features(self):
         # Fail if the live tab is not selected
-        tab = self.main_app.main_data.tab.value
-        if tab.name not in ("secom_live", "sparc_acqui", "cryosecom-localization"):
-            available_tabs = self.main_app.main_data.tab.choices.values()
-            exp_tab_name = "localization" if "cryosecom-localization" in available_tabs else "acquisition"
-            box = wx.MessageDialog(self.main_app.main_frame,
-                       "Loading features must be done from the %s tab." % (exp_tab_name,),
-                       "Loading features not possible", wx.OK | wx.ICON_STOP)
-            box.ShowModal()
-            box.Destroy()
+        if not self._check_tab("Removing features"):
             return
         
         main_data = self.main_app.main_data
-        fs = main_data.features.value
-        
+        main_data.features.value = []
+
+    def _ask_files(self):
+        """
+        return (list of str): the feature files selected by the user (might be empty)
+        """
         dialog = wx.FileDialog(self.main_app.main_frame,
-                               message="Choose a file to load",
+                               message="Choose the files to load",
                                defaultDir=get_home_folder(),
                                defaultFile="",
-                               style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST,
+                               style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST | wx.FD_MULTIPLE,
                                wildcard="Features JSON (*.json)|*.json")
 
         # Show the dialog and check whether is was accepted or cancelled
         if dialog.ShowModal() != wx.ID_OK:
-            return 
+            return []
+        return dialog.GetPaths()
+
+    def _merge_files(self, features, filenames):
+        """
+        Add the features of the files, except the ones already present.
+        features (list of CryoFeature): the features already present
+        filenames (list of str): the feature files
+        return (list of CryoFeature): all the features
+        """
+        for filename in filenames:
+            logging.debug("Loading features file %s", filename)
+            features, duplicates = merge_features(features, read_feature_file(filename))
+            for new, old in duplicates:
+                logging.info("Feature %s of %s is at the same position as %s, not added",
+                             new.name.value, filename, old.name.value)
+        return features
+
+    def load_features(self):
+        # Fail if the live tab is not selected
+        if not self._check_tab("Loading features"):
+            return
 
-        filename = dialog.GetPath()
-        logging.debug("Loading features file %s", filename)
-        dirname = os.path.dirname(os.path.realpath(filename))
-        fs = read_features(dirname)
-        main_data.features.value = fs
+        filenames = self._ask_files()
+        if not filenames:
+            return
+        features = self._merge_files([], filenames)
+        self._store.attach(features)
+        logging.info("Loaded %d features", len(features))
 
+    def add_features(self):
+        """
+        Load more features, in addition to the ones already present.
+        """
+        if not self._check_tab("Loading features"):
+            return
+
+        filenames = self._ask_files()
+        if not filenames:
+            return
+        features = self._merge_files(self.main_app.main_data.features.value, filenames)
+        self._store.attach(features)
+        logging.info("%d features after adding the files", len(features))
+
+    def reload_features(self):
+        """
+        Load the features as they were last time, with their latest status and position.
+        """
+        if not self._check_tab("Loading features"):
+            return
+
+        if not os.path.exists(self._store.path):
+            box = wx.MessageDialog(self.main_app.main_frame,
+                       "No features were loaded before.",
+                       "Reloading features not possible", wx.OK | wx.ICON_STOP)
+            box.ShowModal()
+            box.Destroy()
+            return
+        features = self._store.load()
+        logging.info("Reloaded %d features", len(features))
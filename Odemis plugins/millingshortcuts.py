@@ -31,24 +31,17 @@ other dealings in the software.
 
 
 from __future__ import division
-import os
-import math
-import numpy as np
-import matplotlib.pyplot as plt
-from collections import OrderedDict
-from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, RUNNING
 import logging
-from odemis import dataio, model
-from odemis.acq import stream, acqmng
-from odemis.acq.stream import StaticStream, FluoStream, SEMStream
-import odemis.gui
-from odemis.gui.conf import get_acqui_conf
-from odemis.util import dataio as udataio
-import time
-import threading
-import wx
-from odemis.gui.plugin import Plugin, AcquisitionDialog
-import cv2
+import os
+import sys
+from odemis.gui.plugin import Plugin
+
+# The shared helpers are in the "enzel" folder, next to this file
+_plugin_dir = os.path.dirname(os.path.abspath(__file__))
+if _plugin_dir not in sys.path:
+    sys.path.append(_plugin_dir)
+from enzel.commands import get_channel
+from enzel.lazy import lazy_component, lazy_property
 
 
 class MillingShortcuts(Plugin):
@@ -66,14 +59,17 @@ class MillingShortcuts(Plugin):
         if not microscope:
             return
 
-        # Get components by role
+        # Initialize parameters
+        self.def_sr = 180.0
+
+        # Only check the XT connection is present: the command channel is
+        # created on the first command, to not slow down the start of the GUI
         try:
-            self.sem = model.getComponent("SEM XT Connection")
+            self.sem
         except LookupError:
             logging.info("Hardware not found, cannot use the Milling plugin.")
             return
 
-        # TODO should check if microscope has an XT connection
         self.addMenu("Milling/Stop\tCtrl+`", self._stop_milling)
         self.addMenu("Milling/Stress relieve cuts\tCtrl+1", self._mill_p1)
         self.addMenu("Milling/2.5 um\tCtrl+2", self._mill_p2)
@@ -82,36 +78,43 @@ class MillingShortcuts(Plugin):
         self.addMenu("Milling/0.2 um\tCtrl+5", self._mill_p5)
         self.addMenu("Milling/3-beam alignment hole\tCtrl+6", self._mill_p6)
         self.addMenu("Milling/Mill RC & RM", self._run_rc_rm)
+        self.addMenu("Milling/Mill RC, 2 um & 1 um", self._run_rc_2um_1um)
 
+    sem = lazy_component("SEM XT Connection")
 
-
-        # Initialize parameters
-        self.def_sr = 180.0
+    @lazy_property
+    def _channel(self):
+        return get_channel(self.sem, self.def_sr)
 
     def _stop_milling(self):
-        self.sem.set_rotation(np.deg2rad(self.def_sr-0.001))
+        # Also drop the commands queued
+        self._channel.stop()
 
     def _mill_p1(self):
-        self.sem.set_rotation(np.deg2rad(self.def_sr+0.001))
+        self._channel.send("relief_cuts")
 
     def _mill_p2(self):
-        self.sem.set_rotation(np.deg2rad(self.def_sr+0.002))
+        self._channel.send("mill_2_5um")
 
     def _mill_p3(self):
-        self.sem.set_rotation(np.deg2rad(self.def_sr+0.003))
+        self._channel.send("mill_1_0um")
 
     def _mill_p4(self):
-        self.sem.set_rotation(np.deg2rad(self.def_sr+0.004))
+        self._channel.send("mill_0_6um")
 
     def _mill_p5(self):
-        self.sem.set_rotation(np.deg2rad(self.def_sr+0.005))
+        self._channel.send("mill_0_2um")
 
     def _mill_p6(self):
-        self.sem.set_rotation(np.deg2rad(self.def_sr+0.006))
+        self._channel.send("alignment_hole")
         
     def _mill_beam_align(self):
-        self.sem.set_rotation(np.deg2rad(self.def_sr+0.007))
+        self._channel.send("beam_align")
         
     def _run_rc_rm(self):
-        self.sem.set_rotation(np.deg2rad(self.def_sr+0.011))
+        self._channel.submit("auto_rc_rm")
+
+    def _run_rc_2um_1um(self):
+        # Each step is sent as soon as iFast has finished the previous one
+        self._channel.submit_sequence("rc_2um_1um")
 
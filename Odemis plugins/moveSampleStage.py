@@ -31,24 +31,24 @@ other dealings in the software.
 
 from __future__ import division
 import os
-import math
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
 from collections import OrderedDict
-from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, RUNNING
+from concurrent.futures._base import CancelledError
 import logging
-from odemis import dataio, model
-from odemis.acq import stream, acqmng
-from odemis.acq.stream import StaticStream, FluoStream, SEMStream
-import odemis.gui
-from odemis.gui.conf import get_acqui_conf, util
-from odemis.util import dataio as udataio
-import time
+from odemis import model
+from odemis.gui.util import get_picture_folder
+from odemis.util import units
 import threading
 import wx
 from odemis.gui.plugin import Plugin, AcquisitionDialog
-from odemis.gui.comp.text import UnitFloatCtrl
-import cv2
+
+# The shared helpers are in the "enzel" folder, next to this file
+_plugin_dir = os.path.dirname(os.path.abspath(__file__))
+if _plugin_dir not in sys.path:
+    sys.path.append(_plugin_dir)
+from enzel.moveplan import describe_plan, get_axis_speeds, plan_moves, plan_time
+from enzel.tracing import start_trace, stop_trace, tracer
 
 class moveSampleStage(Plugin):
     name = "moveSampleStage"
@@ -81,6 +81,11 @@ class moveSampleStage(Plugin):
             "label": "dz",
             "accuracy": 18, # avoid dropping units from linked field
         }),
+        ("trace", {
+            "label": "Record trace",
+            "tooltip": "Save the duration of each move, as a Chrome trace (.json) and .csv file,\n"
+                       "in the picture folder",
+        }),
     ))
 
 
@@ -93,10 +98,9 @@ class moveSampleStage(Plugin):
         if not microscope:
             return
 
-        # Get components by role
-        try:
-            self.stage = model.getComponent(role="stage")
-        except LookupError:
+        # The GUI has already looked up the stage
+        self.stage = main_app.main_data.stage
+        if not self.stage:
             logging.info("Hardware not found, cannot use the Move stage plugin.")
             return
 
@@ -119,11 +123,14 @@ class moveSampleStage(Plugin):
         self.y = model.FloatContinuous(self.shield_pos['y'], self.stage.axes['y'].range, unit='m')
         self.z = model.FloatContinuous(self.shield_pos['z'], self.stage.axes['z'].range, unit='m')
         self.dz = model.FloatContinuous(50e-6, (10e-6, 200e-6), unit='m')
+        self.trace = model.BooleanVA(False)
         
-        self.move_order = ['x', 'y', 'rx', 'rz', 'z', ]
+        # Axes moved together, one group after another. z is moved last when
+        # going up to the shield, and first when going down.
+        self.move_groups = (('x', 'y'), ('rx', 'rz'))
 
     def _position_stage(self):
-        dlg = AcquisitionDialog(self, "Move sample stage", "Move order: x, y, z, Rx, Rz\nDefault position: chamber shield\nMove stage to position:")
+        dlg = AcquisitionDialog(self, "Move sample stage", "Move order: x & y, then Rx & Rz, z last when going up (first when going down)\nDefault position: chamber shield\nMove stage to position:")
         self._dlg = dlg
         
         dlg.addSettings(self, self.vaconf)
@@ -151,17 +158,53 @@ class moveSampleStage(Plugin):
         thread.start()
 
     def position_stage(self, dlg):
-        for ax in self.move_order:
+        target = {}
+        for ax in ('x', 'y', 'rx', 'rz', 'z'):
             pos = getattr(self, ax).value
             if 'r' in ax: 
                 pos = np.deg2rad(pos)
-            logging.info("Move stage axis %s to %f", ax, pos)
-            self.stage.moveAbs({ax:pos}).result()
+            target[ax] = pos
+        current = self.stage.position.value
+        plan = plan_moves(current, target, self.move_groups)
+        speeds = get_axis_speeds(self.stage)
+        one_by_one = [{ax: p} for ax, p in target.items()]
+        msg = "Moving %s (about %s, instead of %s one axis at a time)" % (
+            describe_plan(plan), units.readable_time(round(plan_time(current, plan, speeds))),
+            units.readable_time(round(plan_time(current, one_by_one, speeds))))
+        logging.info(msg)
+        if dlg is not None:
+            wx.CallAfter(dlg.setAcquisitionInfo, msg)
+
+        trace = start_trace("Move stage", get_picture_folder()) if self.trace.value else None
+        try:
+            for move in plan:
+                logging.info("Move stage to %s", move)
+                with tracer.span("move " + " & ".join(move), "move", **move):
+                    self.stage.moveAbs(move).result()
+        finally:
+            if trace is not None:
+                stop_trace(trace)
         
     def zUp(self, dlg):
-        self.stage.moveRel({'z':self.dz.value}).result()
+        self._move_z(self.dz.value)
 
         
     def zDown(self, dlg):
-        self.stage.moveRel({'z':-1.0*self.dz.value}).result() 
+        self._move_z(-1.0*self.dz.value) 
+
+    def _move_z(self, shift):
+        # Don't block the GUI while the stage moves
+        span = tracer.span("move z", "move", shift=shift).begin()
+        f = self.stage.moveRel({'z': shift})
+        f.add_done_callback(lambda f: self._on_z_done(f, span))
+
+    def _on_z_done(self, f, span):
+        try:
+            f.result()
+            span.finish()
+        except CancelledError:
+            span.finish("CancelledError")
+        except Exception as ex:
+            span.finish(type(ex).__name__)
+            logging.exception("Failed to move z")
         
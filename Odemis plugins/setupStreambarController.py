@@ -30,29 +30,20 @@ other dealings in the software.
 
 
 from __future__ import division
+from functools import partial
 import os
-import math
-import numpy as np
-import matplotlib.pyplot as plt
-import odemis.acq.stream as acqstream
-
-from collections import OrderedDict
-from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, RUNNING
+import sys
 import logging
-from odemis import dataio, model
-from odemis.acq import stream, acqmng
-from odemis.acq.stream import StaticStream, FluoStream, SEMStream
-import odemis.gui
-from odemis.gui.conf import get_acqui_conf
-from odemis.util import dataio as udataio
-from odemis.util import conversion, fluo
-import time
-import threading
 import wx
-from odemis.gui.plugin import Plugin, AcquisitionDialog
-from odemis.gui.comp.text import UnitFloatCtrl
-import cv2
+from odemis.gui.plugin import Plugin
+from odemis.acq import stream as acqstream
 
+# The shared helpers are in the "enzel" folder, next to this file
+_plugin_dir = os.path.dirname(os.path.abspath(__file__))
+if _plugin_dir not in sys.path:
+    sys.path.append(_plugin_dir)
+from enzel.profiles import (create_stream, get_choices, load_profiles,
+                            set_current_profile, teardown_streams)
 
 class SetStreambarController(Plugin):
     name = "SetStreambarController"
@@ -75,32 +66,31 @@ class SetStreambarController(Plugin):
             if not (self.main_data.ccd and self.main_data.light):
                 return
 
-        self.addMenu("Cryo/Set-up streams", self.setup)
-
-
-    def add_stream(self, tab, name, power, excitation, emitter, exposuretime, tint, binning):
-        tab_data = tab.tab_data_model
-        _main_data_model = tab_data.main
-        s = acqstream.FluoStream(
-            name,
-            _main_data_model.ccd,
-            _main_data_model.ccd.data,
-            _main_data_model.light,
-            _main_data_model.light_filter,
-            focuser=_main_data_model.focus,
-            opm=_main_data_model.opm,
-            detvas={"exposureTime", "binning"},
-        )
-        s.power.value = power
-        s.excitation.value = excitation
-        s.emission.value = emitter
-        s.det_vas["exposureTime"].value = exposuretime
-        s.det_vas["binning"].value = binning
-        s.tint.value = tint
+        # The streams created by the last set-up, to replace them when switching profile
+        self._streams = []
+        profiles = load_profiles()
+        if not profiles:
+            logging.warning("No stream profile found")
+        for name in profiles:
+            self.addMenu("Cryo/Set-up streams/%s" % (name,), partial(self.setup, name))
+
+
+    def add_stream(self, tab, spec, ex_choices, em_choices):
+        """
+        Create a stream and add it to the stream bar
+        spec (StreamSpec): the settings of the stream
+        return (FluoStream): the new stream
+        """
+        s = create_stream(tab.tab_data_model.main, spec, ex_choices, em_choices)
         sc = tab.streambar_controller._add_stream(s, add_to_view=True, play=False)
         sc.stream_panel.collapse(True)
+        return s
 
-    def setup(self):
+    def setup(self, profile_name):
+        """
+        Set up the streams of the given profile, instead of the ones of the
+        previous profile.
+        """
         # Fail if the live tab is not selected
         tab = self.main_app.main_data.tab.value
         if tab.name not in ("secom_live", "sparc_acqui", "cryosecom-localization"):
@@ -112,35 +102,45 @@ class SetStreambarController(Plugin):
             box.ShowModal()
             box.Destroy()
             return
-            
-        # Stop the streams
+
+        # Read again, in case the file was edited since the start
+        profile = load_profiles().get(profile_name)
+        if profile is None:
+            box = wx.MessageDialog(self.main_app.main_frame,
+               "Stream profile %s not found" % (profile_name,),
+               "Setting up streams not possible", wx.OK | wx.ICON_STOP)
+            box.ShowModal()
+            box.Destroy()
+            return
+
         tab_data = tab.tab_data_model
-        _main_data_model = tab_data.main
-        add_streams = False
-        for s in tab_data.streams.value:
-            if isinstance(s, acqstream.FluoStream):
-                ex_choices = s._emitter.spectra.value
-                em_choices = s._em_filter.axes["band"].choices.copy()
-                # convert any list into tuple, as lists cannot be put in a set
-                for k, v in em_choices.items():
-                    em_choices[k] = conversion.ensure_tuple(v)
-                em_choices = [v for v in em_choices.values()]
-                #tab.streambar_controller.removeStreamPanel(s)
-                add_streams = True
-        if add_streams:
-            self.add_stream(tab, "RLMAcq", 10e-3, ex_choices[1], em_choices[0], 0.15, (255, 255, 255), (1,1))
-            #self.add_stream(tab, "Pol", 15e-3, ex_choices[1], em_choices[1], 0.15, (255, 255, 255), (1,1))
-            self.add_stream(tab, "Ex390Em440", 10e-3, ex_choices[0], em_choices[1], 0.5, (0, 0, 255), (2,2))
-            self.add_stream(tab, "Ex485Em525", 10e-3, ex_choices[1], em_choices[2], 0.5, (55, 255, 0), (2,2))
-            self.add_stream(tab, "Ex560Em607", 10e-3, ex_choices[2], em_choices[3], 0.5, (255, 149, 0), (2,2))
-            self.add_stream(tab, "Ex648Em684", 10e-3, ex_choices[3], em_choices[4], 0.5, (255, 0, 0), (2,2))
-            self.add_stream(tab, "Ex390Em440Acq", 10e-3, ex_choices[0], em_choices[1], 20.0, (0, 0, 255), (1,1))
-            self.add_stream(tab, "Ex485Em525Acq", 10e-3, ex_choices[1], em_choices[2], 20.0, (55, 255, 0), (1,1))
-            self.add_stream(tab, "Ex560Em607Acq", 10e-3, ex_choices[2], em_choices[3], 20.0, (255, 149, 0), (1,1))
-            self.add_stream(tab, "Ex648Em684Acq", 10e-3, ex_choices[3], em_choices[4], 20.0, (255, 0, 0), (1,1))
-        else:
+        if not any(isinstance(s, acqstream.FluoStream) for s in tab_data.streams.value):
             box = wx.MessageDialog(self.main_app.main_frame,
                "At least one optical stream needs to be present",
                "Setting up streams not possible", wx.OK | wx.ICON_STOP)
             box.ShowModal()
             box.Destroy()
+            return
+
+        # Remove the streams of the previous profile
+        teardown_streams(self._streams, tab.streambar_controller)
+        self._streams = []
+
+        ex_choices, em_choices = get_choices(tab_data.main)
+        names = set(s.name.value for s in tab_data.streams.value)
+        for spec in profile.streams:
+            if spec.name in names:
+                continue  # Already set up by hand
+            if profile.on_demand and spec.acquisition:
+                continue  # Only created when acquiring
+            try:
+                self._streams.append(self.add_stream(tab, spec, ex_choices, em_choices))
+            except LookupError as ex:
+                box = wx.MessageDialog(self.main_app.main_frame,
+                   "Stream %s cannot be set up: %s" % (spec.name, ex),
+                   "Setting up streams not possible", wx.OK | wx.ICON_STOP)
+                box.ShowModal()
+                box.Destroy()
+                return
+        set_current_profile(profile)
+        logging.info("Set up the streams of profile %s", profile.name)